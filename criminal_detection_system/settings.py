@@ -29,7 +29,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'detection.middleware.SessionMiddleware',  # Skips the per-request session save on dashboard polls
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -137,3 +137,61 @@ if not DEBUG:
     SECURE_HSTS_INCLUDE_SUBDOMAINS = True
     SECURE_HSTS_PRELOAD = True
     SECURE_SSL_REDIRECT = False  # Let Render handle SSL
+
+# Detection engine settings
+# Run one detection pass per cascade when a gunicorn worker boots
+DETECTION_WARMUP = os.environ.get('DETECTION_WARMUP', 'True').lower() == 'true'
+# Queue uploads for `manage.py run_detection_workers` instead of detecting inline
+DETECTION_ASYNC = os.environ.get('DETECTION_ASYNC', 'False').lower() == 'true'
+# Face detection profile: 'fast' (one quick cascade), 'balanced' (second cascade only when the first is unsure)
+# or 'thorough' (both cascades always); an upload can pick another with profile=
+DETECTION_PROFILE = os.environ.get('DETECTION_PROFILE', 'thorough')
+# Run the face cascades on a frame capped to this long edge in pixels (0 = full resolution); boxes are refined at full resolution
+DETECTION_MAX_DIMENSION = int(os.environ.get('DETECTION_MAX_DIMENSION', 0))
+# Tiled detection for crowd/CCTV stills (also per upload with tiled=true): overlapping tiles run on a thread pool
+DETECTION_TILED = os.environ.get('DETECTION_TILED', 'False').lower() == 'true'
+DETECTION_TILE_SIZE = int(os.environ.get('DETECTION_TILE_SIZE', 1024))
+DETECTION_TILE_OVERLAP = int(os.environ.get('DETECTION_TILE_OVERLAP', 192))
+DETECTION_TILE_WORKERS = int(os.environ.get('DETECTION_TILE_WORKERS', 0))
+# Per-request matching caps: the largest DETECTION_MAX_FACES faces are matched, keeping DETECTION_TOP_K candidates each
+DETECTION_MAX_FACES = int(os.environ.get('DETECTION_MAX_FACES', 10))
+DETECTION_TOP_K = int(os.environ.get('DETECTION_TOP_K', 3))
+# Opt-in quality gate: reject blurry, dark or overexposed frames, and frames whose faces are all small, before matching;
+# the default face size is the smallest the cascades find, so enabling the gate alone drops no face
+DETECTION_QUALITY_GATE = os.environ.get('DETECTION_QUALITY_GATE', 'False').lower() == 'true'
+DETECTION_MIN_SHARPNESS = float(os.environ.get('DETECTION_MIN_SHARPNESS', 15))
+DETECTION_MIN_BRIGHTNESS = float(os.environ.get('DETECTION_MIN_BRIGHTNESS', 40))
+DETECTION_MAX_BRIGHTNESS = float(os.environ.get('DETECTION_MAX_BRIGHTNESS', 220))
+DETECTION_MIN_FACE_SIZE = int(os.environ.get('DETECTION_MIN_FACE_SIZE', 25))
+# Largest upload image accepted, in bytes; raw image bodies and file parts are read in chunks up to this size
+DETECTION_MAX_UPLOAD_BYTES = int(os.environ.get('DETECTION_MAX_UPLOAD_BYTES', 16 * 1024 * 1024))
+# Write uploaded photos to media storage on a background thread while detection runs on the decoded bytes
+DETECTION_DEFER_PHOTO_WRITE = os.environ.get('DETECTION_DEFER_PHOTO_WRITE', 'True').lower() == 'true'
+# Directory for derived detection data such as the ANN gallery index
+DETECTION_INDEX_DIR = os.environ.get('DETECTION_INDEX_DIR', os.path.join(BASE_DIR, 'var', 'gallery'))
+# Approximate nearest-neighbour shortlist used once the indexed gallery reaches DETECTION_ANN_MIN_GALLERY
+DETECTION_ANN_ENABLED = os.environ.get('DETECTION_ANN_ENABLED', 'True').lower() == 'true'
+DETECTION_ANN_MIN_GALLERY = int(os.environ.get('DETECTION_ANN_MIN_GALLERY', 5000))
+DETECTION_ANN_NPROBE = int(os.environ.get('DETECTION_ANN_NPROBE', 8))
+DETECTION_ANN_CANDIDATES = int(os.environ.get('DETECTION_ANN_CANDIDATES', 50))
+# 'fused' scores against the per-criminal moments stored in the gallery, 'batched' recomputes them per request
+DETECTION_SCORING = os.environ.get('DETECTION_SCORING', 'fused')
+# Cheap first stage before full scoring when the ANN index is not in use: 'none', 'thumbnail' or 'phash'
+DETECTION_SHORTLIST_METHOD = os.environ.get('DETECTION_SHORTLIST_METHOD', 'none')
+DETECTION_SHORTLIST_SIZE = int(os.environ.get('DETECTION_SHORTLIST_SIZE', 100))
+# Per-stage wall/CPU timings of uploads in a Server-Timing header (and a JSON 'timings' block on request)
+DETECTION_TIMINGS = os.environ.get('DETECTION_TIMINGS', 'False').lower() == 'true'
+# Request/stage metrics, written per worker process to DETECTION_METRICS_DIR and served summed at /metrics/
+DETECTION_METRICS = os.environ.get('DETECTION_METRICS', 'True').lower() == 'true'
+DETECTION_METRICS_DIR = os.environ.get('DETECTION_METRICS_DIR', os.path.join(BASE_DIR, 'var', 'metrics'))
+DETECTION_METRICS_FLUSH_INTERVAL = float(os.environ.get('DETECTION_METRICS_FLUSH_INTERVAL', 1.0))
+# Optional bearer token so a Prometheus scraper can read /metrics/ without a staff login
+DETECTION_METRICS_TOKEN = os.environ.get('DETECTION_METRICS_TOKEN', '')
+# Longest a dashboard feed request may wait for a change (?wait=, ASGI only), and how often it checks while waiting
+DETECTION_FEED_MAX_WAIT = float(os.environ.get('DETECTION_FEED_MAX_WAIT', 25))
+DETECTION_FEED_POLL_INTERVAL = float(os.environ.get('DETECTION_FEED_POLL_INTERVAL', 1.0))
+# Server-Sent Events push to police dashboards at /police/events/; needs the ASGI application (see DEPLOYMENT_GUIDE.md)
+DETECTION_EVENTS = os.environ.get('DETECTION_EVENTS', 'False').lower() == 'true'
+DETECTION_EVENTS_DIR = os.environ.get('DETECTION_EVENTS_DIR', os.path.join(BASE_DIR, 'var', 'events'))
+DETECTION_EVENTS_HEARTBEAT = float(os.environ.get('DETECTION_EVENTS_HEARTBEAT', 15))
+DETECTION_EVENTS_POLL_INTERVAL = float(os.environ.get('DETECTION_EVENTS_POLL_INTERVAL', 0.5))
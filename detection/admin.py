@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Criminal, DetectionReport, DetectionResult
+from .models import Criminal, DetectionJob, DetectionReport, DetectionResult, DetectionStats
 
 @admin.register(Criminal)
 class CriminalAdmin(admin.ModelAdmin):
@@ -10,8 +10,8 @@ class CriminalAdmin(admin.ModelAdmin):
 
 @admin.register(DetectionReport)
 class DetectionReportAdmin(admin.ModelAdmin):
-    list_display = ('id', 'citizen', 'detection_time', 'location', 'is_processed')
-    list_filter = ('is_processed', 'detection_time')
+    list_display = ('id', 'citizen', 'detection_time', 'location', 'is_processed', 'status', 'detection_count', 'detection_profile', 'cascades_run', 'rejection_reason')
+    list_filter = ('is_processed', 'status', 'detection_profile', 'rejection_reason', 'detection_time')
     search_fields = ('location',)
     date_hierarchy = 'detection_time'
 
@@ -19,4 +19,15 @@ class DetectionReportAdmin(admin.ModelAdmin):
 class DetectionResultAdmin(admin.ModelAdmin):
     list_display = ('report', 'criminal', 'confidence', 'detected_at')
     list_filter = ('confidence', 'detected_at')
-    search_fields = ('criminal__name',)
\ No newline at end of file
+    search_fields = ('criminal__name',)
+
+@admin.register(DetectionJob)
+class DetectionJobAdmin(admin.ModelAdmin):
+    list_display = ('report', 'status', 'attempts', 'worker', 'created_at', 'finished_at')
+    list_filter = ('status', 'created_at')
+    readonly_fields = ('result', 'error')
+
+@admin.register(DetectionStats)
+class DetectionStatsAdmin(admin.ModelAdmin):
+    list_display = ('total_reports', 'total_detections', 'pending_review', 'verified_correct', 'verified_incorrect', 'updated_at')
+    readonly_fields = ('total_reports', 'total_detections', 'pending_review', 'verified_correct', 'verified_incorrect', 'confidence_sum', 'updated_at')
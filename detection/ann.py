@@ -0,0 +1,197 @@
+import os
+import threading
+import numpy as np
+from datetime import datetime
+from django.conf import settings
+from .descriptors import DESCRIPTOR_SIZE
+
+
+# Coarse vectors are 20x20 grayscale thumbnails of the 100x100 descriptors,
+# mean-centred and L2-normalised so an inner product is a correlation.
+COARSE_SIZE = 20
+INDEX_FILENAME = 'ann_index.npz'
+
+_cache_lock = threading.Lock()
+_cache = {'mtime': None, 'index': None}
+
+
+def coarse_vectors(descriptors):
+    """Reduce (n x 30000) descriptors to (n x 400) unit-length coarse vectors"""
+    descriptors = np.atleast_2d(np.asarray(descriptors, dtype=np.float32))
+    height, width = DESCRIPTOR_SIZE[1], DESCRIPTOR_SIZE[0]
+    block = height // COARSE_SIZE
+    images = descriptors.reshape(len(descriptors), height, width, 3)
+    # Luma from RGB, then average each 5x5 block
+    gray = images @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    thumbs = gray.reshape(len(descriptors), COARSE_SIZE, block, COARSE_SIZE, block).mean(axis=(2, 4))
+    thumbs = thumbs.reshape(len(descriptors), COARSE_SIZE * COARSE_SIZE)
+    thumbs -= thumbs.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(thumbs, axis=1, keepdims=True)
+    return thumbs / np.where(norms > 0, norms, 1)
+
+
+class IVFIndex:
+    """
+    Inverted-file index over coarse vectors.
+
+    A k-means coarse quantizer splits the gallery into nlist cells. A search
+    only scans the vectors in the nprobe cells closest to the query, so nprobe
+    trades recall for speed.
+    """
+
+    def __init__(self, centroids, ids, vectors, assignments, built_at=None):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.ids = np.asarray(ids, dtype='U36')
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.assignments = np.asarray(assignments, dtype=np.int32)
+        self.built_at = built_at or datetime.now().astimezone()
+        self._cells = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def train(cls, ids, vectors, nlist=None, iterations=10, seed=0):
+        """Train the coarse quantizer with spherical k-means and index every vector"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if nlist is None:
+            # Rule of thumb: about 4 * sqrt(n) cells
+            nlist = int(4 * np.sqrt(len(vectors)))
+        nlist = max(1, min(nlist, len(vectors)))
+
+        rng = np.random.default_rng(seed)
+        # k-means on a sample is plenty to place the cells
+        sample_size = min(len(vectors), nlist * 32)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = (sample @ centroids.T).argmax(axis=1)
+            # Sum the members of every cell in one pass over the sorted sample
+            order = np.argsort(labels, kind='stable')
+            counts = np.bincount(labels, minlength=nlist)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            occupied = counts > 0
+            sums = np.add.reduceat(sample[order], starts[occupied], axis=0)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids[occupied] = sums / np.where(norms > 0, norms, 1)
+            # Re-seed empty cells
+            empty = np.flatnonzero(~occupied)
+            centroids[empty] = sample[rng.integers(sample_size, size=len(empty))]
+
+        index = cls(centroids, [], np.empty((0, vectors.shape[1])), [])
+        index.add(ids, vectors)
+        return index
+
+    def assign(self, vectors):
+        """Return the nearest cell for each vector"""
+        return (np.asarray(vectors, dtype=np.float32) @ self.centroids.T).argmax(axis=1).astype(np.int32)
+
+    def add(self, ids, vectors):
+        """Add vectors, replacing any already indexed under the same ids"""
+        ids = np.asarray(ids, dtype='U36')
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.remove(ids)
+        self.ids = np.concatenate([self.ids, ids])
+        self.vectors = np.concatenate([self.vectors, vectors])
+        self.assignments = np.concatenate([self.assignments, self.assign(vectors)])
+        self._cells = None
+
+    def remove(self, ids):
+        """Drop vectors by id"""
+        keep = ~np.isin(self.ids, np.asarray(ids, dtype='U36'))
+        if not keep.all():
+            self.ids = self.ids[keep]
+            self.vectors = self.vectors[keep]
+            self.assignments = self.assignments[keep]
+            self._cells = None
+
+    def cell_rows(self, cell):
+        """Return the row numbers of the vectors in a cell"""
+        if self._cells is None:
+            # Inverted lists: rows grouped by cell, with an offset table per cell
+            order = np.argsort(self.assignments, kind='stable')
+            offsets = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+            self._cells = (order, offsets)
+        order, offsets = self._cells
+        return order[offsets[cell]:offsets[cell + 1]]
+
+    def search(self, queries, k=50, nprobe=8):
+        """Return a list of (ids, similarities) of the top k candidates for each query"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        nprobe = max(1, min(nprobe, len(self.centroids)))
+        cell_scores = queries @ self.centroids.T
+        probe_cells = np.argpartition(-cell_scores, nprobe - 1, axis=1)[:, :nprobe]
+
+        results = []
+        for query, cells in zip(queries, probe_cells):
+            rows = np.concatenate([self.cell_rows(cell) for cell in cells])
+            if len(rows) == 0:
+                results.append((self.ids[:0], np.empty(0, dtype=np.float32)))
+                continue
+            similarities = self.vectors[rows] @ query
+            if len(rows) > k:
+                top = np.argpartition(-similarities, k - 1)[:k]
+            else:
+                top = np.arange(len(rows))
+            top = top[np.argsort(-similarities[top])]
+            results.append((self.ids[rows[top]], similarities[top]))
+        return results
+
+    def save(self, path):
+        """Write the index to path, replacing any previous file atomically"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                ids=self.ids,
+                vectors=self.vectors,
+                assignments=self.assignments,
+                built_at=np.array(self.built_at.isoformat()),
+            )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                data['centroids'],
+                data['ids'],
+                data['vectors'],
+                data['assignments'],
+                datetime.fromisoformat(str(data['built_at'])),
+            )
+
+
+def index_path():
+    """Location of the persisted ANN index"""
+    return os.path.join(settings.DETECTION_INDEX_DIR, INDEX_FILENAME)
+
+
+def get_index():
+    """Return the persisted index, reloading it when the file changes, or None"""
+    path = index_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+    with _cache_lock:
+        if _cache['mtime'] != mtime:
+            try:
+                _cache['index'] = IVFIndex.load(path)
+                _cache['mtime'] = mtime
+            except Exception as e:
+                print(f"Error loading ANN index: {e}")
+                return None
+        return _cache['index']
+
+
+def ann_enabled(index):
+    """Use the index only when it exists and the gallery is big enough to need it"""
+    return (
+        index is not None
+        and getattr(settings, 'DETECTION_ANN_ENABLED', True)
+        and len(index) >= getattr(settings, 'DETECTION_ANN_MIN_GALLERY', 5000)
+    )
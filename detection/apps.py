@@ -3,4 +3,8 @@ from django.apps import AppConfig
 
 class DetectionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'  # pyright: ignore[reportAssignmentType]
-    name = 'detection'
\ No newline at end of file
+    name = 'detection'
+
+    def ready(self):
+        # Register model signal handlers
+        from . import signals  # noqa: F401
@@ -0,0 +1,120 @@
+import cv2
+import numpy as np
+from django.utils import timezone
+from .detectors import get_cascade
+
+
+# Bump this whenever the way descriptors are computed changes so stale rows
+# get picked up by the compute_face_descriptors command.
+DESCRIPTOR_VERSION = 1
+
+# Descriptors are 100x100 RGB crops normalized to the 0-1 range
+DESCRIPTOR_SIZE = (100, 100)
+DESCRIPTOR_LENGTH = DESCRIPTOR_SIZE[0] * DESCRIPTOR_SIZE[1] * 3
+DESCRIPTOR_DTYPE = np.float32
+
+
+def locate_face(img):
+    """Return the (x, y, w, h) box of the largest face in a BGR image, or None"""
+    gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    gray_img = cv2.equalizeHist(gray_img)
+
+    faces = get_cascade('default').detectMultiScale(
+        gray_img,
+        scaleFactor=1.05,
+        minNeighbors=3,
+        minSize=(30, 30),
+        flags=cv2.CASCADE_SCALE_IMAGE
+    )
+    if len(faces) == 0:
+        return None
+
+    # Gallery photos are portraits, so the largest face is the subject
+    x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+    return int(x), int(y), int(w), int(h)
+
+
+def descriptor_from_image(img, box=None):
+    """Crop a BGR image to box (or use all of it) and return a flat normalized descriptor"""
+    if box is not None:
+        x, y, w, h = box
+        img = img[y:y+h, x:x+w]
+
+    # RGB, resized with LANCZOS and normalized to the 0-1 range
+    rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    rgb_img = cv2.resize(rgb_img, DESCRIPTOR_SIZE, interpolation=cv2.INTER_LANCZOS4)
+    normalized_pixels = rgb_img.astype(DESCRIPTOR_DTYPE) / 255.0
+    return normalized_pixels.flatten()
+
+
+def vector_moments(matrix):
+    """Return the per-row mean, variance and squared norm of a matrix as float64"""
+    pixel_count = matrix.shape[1]
+    sums = matrix.sum(axis=1, dtype=np.float64)
+    squares = np.einsum('ij,ij->i', matrix, matrix).astype(np.float64)
+    means = sums / pixel_count
+    variances = squares / pixel_count - means ** 2
+    # Treat rounding noise on flat rows as exactly zero variance
+    variances = np.where(variances > 1e-9, variances, 0)
+    return means, variances, squares
+
+
+def decode_image(data):
+    """Decode encoded image bytes (JPEG, PNG, ...) into a BGR array, or None"""
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def compute_descriptor_for_photo(image_path):
+    """Locate the face in a photo on disk and return its descriptor, or None"""
+    img = cv2.imread(image_path)
+    if img is None:
+        return None
+    # Fall back to the whole photo when no face is found so the criminal
+    # still takes part in matching
+    return descriptor_from_image(img, locate_face(img))
+
+
+def descriptor_to_bytes(descriptor):
+    """Serialize a descriptor for storage in a BinaryField"""
+    return np.ascontiguousarray(descriptor, dtype=DESCRIPTOR_DTYPE).tobytes()
+
+
+def descriptor_from_bytes(data):
+    """Deserialize a descriptor stored with descriptor_to_bytes"""
+    return np.frombuffer(bytes(data), dtype=DESCRIPTOR_DTYPE)
+
+
+def refresh_criminal_descriptor(criminal, force=False):
+    """
+    Recompute the stored descriptor for a criminal when its photo changed.
+
+    Returns True if the descriptor was (re)computed. The row is updated with a
+    queryset update so no save signals fire again; updated_at is bumped by
+    hand, as a queryset update skips auto_now.
+    """
+    from .models import Criminal
+
+    photo_name = criminal.photo.name if criminal.photo else ''
+    is_current = criminal.descriptor_version == DESCRIPTOR_VERSION or not photo_name
+    if not force and is_current and criminal.descriptor_photo == photo_name:
+        return False
+
+    descriptor = None
+    if photo_name:
+        try:
+            descriptor = compute_descriptor_for_photo(criminal.photo.path)
+        except Exception as e:
+            print(f"Error computing descriptor for {criminal.name}: {e}")
+
+    criminal.face_descriptor = descriptor_to_bytes(descriptor) if descriptor is not None else None
+    criminal.descriptor_version = DESCRIPTOR_VERSION if descriptor is not None else 0
+    criminal.descriptor_photo = photo_name
+    Criminal.objects.filter(pk=criminal.pk).update(
+        face_descriptor=criminal.face_descriptor,
+        descriptor_version=criminal.descriptor_version,
+        descriptor_photo=criminal.descriptor_photo,
+        updated_at=timezone.now(),
+    )
+    return True
@@ -0,0 +1,401 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+import cv2
+import numpy as np
+from django.conf import settings
+from .profiling import lap
+
+
+# Haar cascades used for face detection, keyed by short name
+CASCADE_FILES = {
+    'default': 'haarcascade_frontalface_default.xml',
+    'alt2': 'haarcascade_frontalface_alt2.xml',
+}
+
+# Cascade passes of the thorough profile, in order, with their
+# detectMultiScale parameters. Results of all passes are merged.
+CASCADE_PASSES = (
+    ('default', {'scaleFactor': 1.05, 'minNeighbors': 3, 'minSize': (30, 30)}),
+    ('alt2', {'scaleFactor': 1.08, 'minNeighbors': 2, 'minSize': (25, 25)}),
+)
+
+# Named detection profiles. With confident_neighbors set, later passes are
+# skipped once a face has been confirmed by that many neighbouring
+# detections, so the second cascade only runs when the first found nothing
+# or only weak candidates.
+DETECTION_PROFILES = {
+    'fast': {
+        'passes': (('default', {'scaleFactor': 1.1, 'minNeighbors': 4, 'minSize': (30, 30)}),),
+        'confident_neighbors': None,
+    },
+    'balanced': {'passes': CASCADE_PASSES, 'confident_neighbors': 10},
+    'thorough': {'passes': CASCADE_PASSES, 'confident_neighbors': None},
+}
+
+# A face found on a downscaled frame is searched for again at full resolution
+# in its box grown by this fraction on each side, at sizes within this ratio
+REFINE_MARGIN = 0.25
+REFINE_SIZE_RATIO = 1.25
+
+# Tiled detection: tiles of at most DETECTION_TILE_SIZE, spread evenly so
+# neighbours share about DETECTION_TILE_OVERLAP pixels. Tiles only look for
+# faces up to the overlap, which always fit whole inside some tile; larger
+# faces are found by one extra pass over the frame shrunk so that size
+# becomes the cascades' minimum. While tiles run in parallel OpenCV's own
+# threading is switched off (it is process-wide), so the two do not compete.
+_tile_pools = {}
+_tile_pools_lock = threading.Lock()
+_tiled_runs = {'active': 0, 'opencv_threads': None}
+
+# Classifiers are cached per thread: OpenCV does not promise that one
+# CascadeClassifier can be shared safely by concurrent detectMultiScale calls.
+# Web workers are single threaded, so in practice this is one load per process.
+_local = threading.local()
+
+_stats_lock = threading.Lock()
+_stats = {
+    'load_ms': {},
+    'warmup_ms': None,
+}
+
+
+def cascade_path(name):
+    """Return the path of the XML file for a cascade name"""
+    filename = CASCADE_FILES[name]
+    try:
+        return cv2.data.haarcascades + filename
+    except AttributeError:
+        # Fallback path if cv2.data is not available
+        return 'cv2/data/' + filename
+
+
+def get_cascade(name):
+    """Return the cached CascadeClassifier for name, loading it on first use"""
+    cascades = getattr(_local, 'cascades', None)
+    if cascades is None:
+        cascades = _local.cascades = {}
+
+    cascade = cascades.get(name)
+    if cascade is None:
+        start = time.perf_counter()
+        cascade = cv2.CascadeClassifier(cascade_path(name))
+        if cascade.empty():
+            raise RuntimeError(f"Could not load cascade {name} from {cascade_path(name)}")
+        cascades[name] = cascade
+        with _stats_lock:
+            _stats['load_ms'][name] = round((time.perf_counter() - start) * 1000, 2)
+    return cascade
+
+
+def load_cascades():
+    """Load every known cascade into the current thread's cache"""
+    return {name: get_cascade(name) for name in CASCADE_FILES}
+
+
+def warm_up():
+    """
+    Load the cascades and run one detection pass with each so the first real
+    upload does not pay for parsing the XML files or OpenCV's lazy allocations.
+    """
+    try:
+        cascades = load_cascades()
+
+        if getattr(settings, 'DETECTION_WARMUP', True):
+            start = time.perf_counter()
+            # Mid-grey frame with a dark ellipse so the cascades do some real work
+            sample = np.full((480, 640), 128, dtype=np.uint8)
+            cv2.ellipse(sample, (320, 240), (90, 120), 0, 0, 360, 40, -1)
+            sample = cv2.equalizeHist(sample)
+            for cascade in cascades.values():
+                cascade.detectMultiScale(sample, scaleFactor=1.1, minNeighbors=3, minSize=(30, 30))
+            with _stats_lock:
+                _stats['warmup_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+        stats = detector_stats()
+        loads = ', '.join(f"{name} in {ms}ms" for name, ms in stats['load_ms'].items())
+        print(f"Detector registry ready (pid {stats['pid']}): loaded {loads}; warm-up {stats['warmup_ms']}ms")
+    except Exception as e:
+        print(f"Error warming up detectors: {e}")
+
+
+def detector_stats():
+    """Return cascade load and warm-up timings for this process"""
+    with _stats_lock:
+        return {
+            'pid': os.getpid(),
+            'load_ms': dict(_stats['load_ms']),
+            'warmup_ms': _stats['warmup_ms'],
+        }
+
+
+def max_detection_dimension():
+    return getattr(settings, 'DETECTION_MAX_DIMENSION', 0)
+
+
+def detection_frame(img, max_dimension=0):
+    """
+    Return the grayscale frame the cascades run on and its scale to img.
+
+    The frame is shrunk so its long edge is at most max_dimension (0 keeps
+    full resolution), then equalized and lightly blurred.
+    """
+    gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    scale = 1.0
+    long_edge = max(gray_img.shape[:2])
+    if max_dimension and long_edge > max_dimension:
+        scale = max_dimension / long_edge
+        gray_img = cv2.resize(gray_img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    # Apply histogram equalization to improve contrast
+    gray_img = cv2.equalizeHist(gray_img)
+    # Apply Gaussian blur to reduce noise
+    gray_img = cv2.GaussianBlur(gray_img, (3, 3), 0)
+    return gray_img, scale
+
+
+def merge_overlapping(faces, threshold=0.5):
+    """
+    Drop boxes covering more than threshold of a smaller box kept before them.
+
+    Greedy in input order, like a non-maximum suppression with no scores: each
+    kept box is compared with all later boxes at once.
+    """
+    boxes = np.asarray(faces, dtype=np.int64).reshape(-1, 4)
+    left, top = boxes[:, 0], boxes[:, 1]
+    right, bottom = left + boxes[:, 2], top + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+
+    alive = np.ones(len(boxes), dtype=bool)
+    kept = []
+    for i in range(len(boxes)):
+        if not alive[i]:
+            continue
+        kept.append(i)
+        later = np.flatnonzero(alive[i + 1:]) + i + 1
+        if len(later) == 0:
+            break
+        overlap_w = np.minimum(right[i], right[later]) - np.maximum(left[i], left[later])
+        overlap_h = np.minimum(bottom[i], bottom[later]) - np.maximum(top[i], top[later])
+        overlap_area = np.clip(overlap_w, 0, None) * np.clip(overlap_h, 0, None)
+        duplicate = (overlap_w > 0) & (overlap_h > 0) & (overlap_area > threshold * np.minimum(areas[i], areas[later]))
+        alive[later[duplicate]] = False
+    return [tuple(int(value) for value in boxes[i]) for i in kept]
+
+
+def refine_box(img, box):
+    """
+    Re-detect a face at full resolution around a box mapped up from a
+    downscaled frame. Returns the closest full resolution detection, or box
+    unchanged when the cascade finds nothing there.
+    """
+    x, y, w, h = box
+    margin_x, margin_y = int(w * REFINE_MARGIN), int(h * REFINE_MARGIN)
+    left, top = max(0, x - margin_x), max(0, y - margin_y)
+    right, bottom = min(img.shape[1], x + w + margin_x), min(img.shape[0], y + h + margin_y)
+
+    region = cv2.cvtColor(img[top:bottom, left:right], cv2.COLOR_BGR2GRAY)
+    region = cv2.GaussianBlur(cv2.equalizeHist(region), (3, 3), 0)
+    size = min(w, h)
+    found = get_cascade('default').detectMultiScale(
+        region,
+        scaleFactor=1.05,
+        minNeighbors=3,
+        minSize=(int(size / REFINE_SIZE_RATIO), int(size / REFINE_SIZE_RATIO)),
+        maxSize=(int(size * REFINE_SIZE_RATIO), int(size * REFINE_SIZE_RATIO)),
+        flags=cv2.CASCADE_SCALE_IMAGE
+    )
+    if len(found) == 0:
+        return box
+
+    center_x, center_y = x + w / 2 - left, y + h / 2 - top
+    fx, fy, fw, fh = min(found, key=lambda f: (f[0] + f[2] / 2 - center_x) ** 2 + (f[1] + f[3] / 2 - center_y) ** 2)
+    return int(fx + left), int(fy + top), int(fw), int(fh)
+
+
+def detection_profile(request=None):
+    """
+    Return the name of the detection profile to use.
+
+    The DETECTION_PROFILE setting picks the default; a request can choose
+    another with a 'profile' field. Raises ValueError for unknown names.
+    """
+    profile = getattr(settings, 'DETECTION_PROFILE', 'thorough')
+    if request is not None:
+        profile = request.POST.get('profile', request.GET.get('profile', '')) or profile
+    if profile not in DETECTION_PROFILES:
+        raise ValueError(f"Unknown detection profile {profile}, expected one of {', '.join(DETECTION_PROFILES)}")
+    return profile
+
+
+def run_cascade_passes(gray_img, profile, max_face=None):
+    """Run the cascade passes of a profile over a frame; return the faces and the cascades run"""
+    passes = DETECTION_PROFILES[profile]
+    size_limit = {'maxSize': (max_face, max_face)} if max_face else {}
+    faces = []
+    cascades_run = []
+    for name, params in passes['passes']:
+        found, neighbours = get_cascade(name).detectMultiScale2(
+            gray_img, flags=cv2.CASCADE_SCALE_IMAGE, **params, **size_limit
+        )
+        faces.extend(found)
+        cascades_run.append(name)
+        lap(f'cascade_{name}')
+        threshold = passes['confident_neighbors']
+        if threshold is not None and len(neighbours) and max(neighbours) >= threshold:
+            break
+    return faces, cascades_run
+
+
+def _cascade_order(names):
+    """Cascade names in CASCADE_FILES order, without duplicates"""
+    names = set(names)
+    return [name for name in CASCADE_FILES if name in names]
+
+
+def detect_faces(img, max_dimension=None, profile='thorough'):
+    """
+    Find faces in a BGR image with a detection profile.
+
+    Returns the (x, y, w, h) boxes and the names of the cascades that ran.
+    The cascades run on a frame capped to max_dimension on its long edge
+    (DETECTION_MAX_DIMENSION by default, 0 for full resolution). Boxes found on
+    a smaller frame are scaled back and refined against img, so they are
+    always in the pixels of img.
+    """
+    if max_dimension is None:
+        max_dimension = max_detection_dimension()
+    gray_img, scale = detection_frame(img, max_dimension)
+    lap('preprocess')
+
+    faces, cascades_run = run_cascade_passes(gray_img, profile)
+    faces = merge_overlapping(faces)
+    lap('merge')
+
+    if scale != 1.0 and faces:
+        faces = [
+            refine_box(img, tuple(int(round(value / scale)) for value in face))
+            for face in faces
+        ]
+        # Two small-frame boxes can refine onto the same face
+        faces = merge_overlapping(faces)
+        lap('refine')
+    return [tuple(int(value) for value in face) for face in faces], cascades_run
+
+def tiled_detection_enabled(request=None):
+    """
+    Return True if faces should be found with detect_faces_tiled.
+
+    The DETECTION_TILED setting picks the default; a request can override it
+    with a 'tiled' field of 'true' or 'false'.
+    """
+    enabled = getattr(settings, 'DETECTION_TILED', False)
+    if request is not None:
+        requested = request.POST.get('tiled', request.GET.get('tiled', ''))
+        if requested.lower() in ('true', '1'):
+            enabled = True
+        elif requested.lower() in ('false', '0'):
+            enabled = False
+    return enabled
+
+
+def _tile_pool(workers):
+    with _tile_pools_lock:
+        pool = _tile_pools.get(workers)
+        if pool is None:
+            pool = _tile_pools[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='face-tiles')
+        return pool
+
+
+@contextmanager
+def _single_threaded_opencv():
+    """Limit OpenCV to one thread while any tiled detection runs in this process"""
+    with _tile_pools_lock:
+        if _tiled_runs['active'] == 0:
+            _tiled_runs['opencv_threads'] = cv2.getNumThreads()
+            cv2.setNumThreads(1)
+        _tiled_runs['active'] += 1
+    try:
+        yield
+    finally:
+        with _tile_pools_lock:
+            _tiled_runs['active'] -= 1
+            if _tiled_runs['active'] == 0:
+                cv2.setNumThreads(_tiled_runs['opencv_threads'])
+
+
+def tile_spans(length, tile_size, overlap):
+    """
+    (start, size) of the tiles covering length: as few tiles of at most
+    tile_size as share overlap pixels with their neighbours, spread evenly
+    """
+    if length <= tile_size:
+        return [(0, length)]
+    count = math.ceil((length - overlap) / (tile_size - overlap))
+    size = math.ceil((length + (count - 1) * overlap) / count)
+    return [(index * (length - size) // (count - 1), size) for index in range(count)]
+
+
+def _detect_in_tile(gray_img, x, y, width, height, max_face, profile):
+    """Cascade passes over one tile, boxes in frame coordinates"""
+    region = gray_img[y:y + height, x:x + width]
+    found, cascades_run = run_cascade_passes(region, profile, max_face)
+    return [(fx + x, fy + y, fw, fh) for fx, fy, fw, fh in found], cascades_run
+
+
+def _detect_large_faces(gray_img, min_face, profile):
+    """Cascade passes over the frame shrunk so faces of min_face pixels meet the cascades' minimum"""
+    # Every pass must reach down to min_face, so scale for the largest minimum size
+    minimum = max(params['minSize'][0] for _, params in DETECTION_PROFILES[profile]['passes'])
+    scale = min(1.0, minimum / min_face)
+    frame = cv2.resize(gray_img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray_img
+    found, cascades_run = run_cascade_passes(frame, profile)
+    return [tuple(int(round(value / scale)) for value in face) for face in found], scale, cascades_run
+
+
+def detect_faces_tiled(img, tile_size=None, overlap=None, workers=None, profile='thorough'):
+    """
+    Find faces in a BGR image by running the cascades over overlapping tiles
+    concurrently, for crowd and CCTV stills with many small faces.
+
+    OpenCV releases the GIL in detectMultiScale, so tiles run in parallel on a
+    thread pool of DETECTION_TILE_WORKERS threads (one per core by default).
+    Returns boxes in the pixels of img and the names of the cascades that ran
+    on any tile.
+    """
+    tile_size = tile_size or getattr(settings, 'DETECTION_TILE_SIZE', 1024)
+    overlap = overlap or getattr(settings, 'DETECTION_TILE_OVERLAP', 192)
+    workers = workers or getattr(settings, 'DETECTION_TILE_WORKERS', 0) or os.cpu_count() or 1
+    overlap = min(overlap, tile_size // 2)
+
+    gray_img, _ = detection_frame(img)
+    lap('preprocess')
+
+    height, width = gray_img.shape[:2]
+    pool = _tile_pool(workers)
+    with _single_threaded_opencv() if workers > 1 else nullcontext():
+        large = pool.submit(_detect_large_faces, gray_img, overlap, profile)
+        tiles = [
+            pool.submit(_detect_in_tile, gray_img, x, y, tile_width, tile_height, overlap, profile)
+            for y, tile_height in tile_spans(height, tile_size, overlap)
+            for x, tile_width in tile_spans(width, tile_size, overlap)
+        ]
+        small_faces = []
+        cascades_run = []
+        for tile in tiles:
+            tile_faces, tile_cascades = tile.result()
+            small_faces.extend(tile_faces)
+            cascades_run.extend(tile_cascades)
+        large_faces, scale, large_cascades = large.result()
+    cascades_run.extend(large_cascades)
+    lap('cascade_tiles')
+
+    # Large faces found on the shrunk frame take their full resolution box
+    if scale < 1:
+        large_faces = [refine_box(img, face) for face in merge_overlapping(large_faces)]
+    faces = merge_overlapping(large_faces + small_faces)
+    lap('merge')
+    return faces, _cascade_order(cascades_run)
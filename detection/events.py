@@ -0,0 +1,173 @@
+import asyncio
+import os
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+
+
+# Change notifications between processes. Writers announce every recorded
+# change (see stats.record_report_change); each ASGI worker runs one listener
+# that wakes all of its event streams. On PostgreSQL with psycopg2 this is
+# LISTEN/NOTIFY, delivered only when the writing transaction commits. Other
+# databases fall back to a file whose modification time the listener polls,
+# which only reaches processes on the same machine.
+CHANNEL = 'detection_changes'
+CHANGE_FILENAME = 'last_change'
+
+
+def events_enabled():
+    return getattr(settings, 'DETECTION_EVENTS', False)
+
+
+def _use_notify():
+    return connection.vendor == 'postgresql' and connection.Database.__name__ == 'psycopg2'
+
+
+def _change_file():
+    return os.path.join(settings.DETECTION_EVENTS_DIR, CHANGE_FILENAME)
+
+
+def _write_change_file(change_seq):
+    try:
+        os.makedirs(settings.DETECTION_EVENTS_DIR, exist_ok=True)
+        temp_path = f'{_change_file()}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(str(change_seq))
+        os.replace(temp_path, _change_file())
+    except Exception as e:
+        print(f"Error announcing detection change: {e}")
+
+
+def announce_change(change_seq):
+    """Tell the event stream listeners of every process that change_seq was recorded"""
+    if not events_enabled():
+        return
+    if _use_notify():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, str(change_seq)])
+    else:
+        transaction.on_commit(lambda: _write_change_file(change_seq))
+
+
+class ChangeBroadcaster:
+    """
+    Fan-out of change notifications to the event streams of one process.
+
+    A single listener task runs while any stream is subscribed. After each
+    notification the dashboard feed is computed once per cursor and shared by
+    every stream waiting on it.
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        self._task = None
+        self._generation = 0
+        self._feeds = {}
+
+    def subscribe(self):
+        """Return an asyncio.Event set whenever a change is announced"""
+        wake = asyncio.Event()
+        self._subscribers.add(wake)
+        if self._task is None or self._task.done() or self._task.get_loop() is not asyncio.get_running_loop():
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+        return wake
+
+    def unsubscribe(self, wake):
+        self._subscribers.discard(wake)
+
+    def wake_all(self):
+        self._generation += 1
+        self._feeds.clear()
+        for wake in self._subscribers:
+            wake.set()
+
+    async def feed(self, since):
+        """views.feed_payload(since), shared by all streams until the next change"""
+        from .views import feed_payload
+
+        key = (self._generation, since)
+        pending = self._feeds.get(key)
+        if pending is None:
+            pending = self._feeds[key] = asyncio.ensure_future(sync_to_async(feed_payload)(since))
+        try:
+            return await asyncio.shield(pending)
+        except Exception:
+            self._feeds.pop(key, None)
+            raise
+
+    async def _listen(self):
+        while self._subscribers:
+            try:
+                if _use_notify():
+                    await self._listen_notify()
+                else:
+                    await self._watch_file()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error listening for detection changes: {e}")
+                await asyncio.sleep(5)
+
+    async def _listen_notify(self):
+        params = await sync_to_async(connection.get_connection_params)()
+        listener = connection.Database.connect(**params)
+        listener.set_isolation_level(0)  # Autocommit, so notifications arrive as soon as they are sent
+        listener.cursor().execute(f'LISTEN {CHANNEL}')
+        notified = asyncio.Event()
+        failure = []
+
+        def on_readable():
+            try:
+                listener.poll()
+            except Exception as e:
+                failure.append(e)
+            if listener.notifies or failure:
+                listener.notifies.clear()
+                notified.set()
+
+        loop = asyncio.get_running_loop()
+        loop.add_reader(listener.fileno(), on_readable)
+        try:
+            # Changes made while nobody was listening
+            self.wake_all()
+            while self._subscribers:
+                try:
+                    await asyncio.wait_for(notified.wait(), timeout=settings.DETECTION_EVENTS_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    continue
+                notified.clear()
+                if failure:
+                    raise failure[0]
+                self.wake_all()
+        finally:
+            loop.remove_reader(listener.fileno())
+            listener.close()
+
+    async def _watch_file(self):
+        def signature():
+            try:
+                stat = os.stat(_change_file())
+            except FileNotFoundError:
+                return None
+            return (stat.st_ino, stat.st_mtime_ns)
+
+        last = signature()
+        self.wake_all()
+        while self._subscribers:
+            await asyncio.sleep(settings.DETECTION_EVENTS_POLL_INTERVAL)
+            current = signature()
+            if current != last:
+                last = current
+                self.wake_all()
+
+
+broadcaster = ChangeBroadcaster()
+
+
+def format_event(event, data, event_id=None):
+    """One Server-Sent Events message; data is already JSON"""
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {data}')
+    return '\n'.join(lines) + '\n\n'
@@ -0,0 +1,456 @@
+import os
+import struct
+import threading
+from contextlib import contextmanager
+import numpy as np
+from django.conf import settings
+from .descriptors import DESCRIPTOR_DTYPE, DESCRIPTOR_LENGTH, DESCRIPTOR_VERSION, descriptor_from_bytes, vector_moments
+from .shortlist import THUMBNAIL_LENGTH, perceptual_hashes, thumbnail_vectors
+
+try:
+    import fcntl
+except ImportError:
+    # Windows development machines: publishing is not serialized across processes
+    fcntl = None
+
+
+# On-disk gallery layout:
+#   header (64 bytes): magic, format, descriptor length, row count, row capacity, gallery version
+#   then one section per row field, each holding capacity rows (see ROW_SECTIONS)
+# Only the first row count rows are in use; the spare capacity takes new rows
+# in place, so small changes do not rewrite the whole file.
+GALLERY_MAGIC = b'CDGALLRY'
+GALLERY_FORMAT = 4
+HEADER_STRUCT = struct.Struct('<8sIIQQQ')
+HEADER_SIZE = 64
+ID_SIZE = 36
+PAGE_SIZE = 4096
+
+# (name, dtype, per-row shape) in file order:
+#   ids: 36-byte ASCII UUIDs
+#   live: False once a row has been removed or replaced
+#   moments: mean, variance and squared norm, computed once per row
+#   hashes, thumbnails: first-stage shortlist features (see shortlist.py)
+#   matrix: the descriptors themselves, starting on a page boundary
+ROW_SECTIONS = (
+    ('ids', np.dtype(f'S{ID_SIZE}'), ()),
+    ('live', np.dtype(np.bool_), ()),
+    ('moments', np.dtype(np.float64), (3,)),
+    ('hashes', np.dtype(np.uint64), ()),
+    ('thumbnails', np.dtype(np.float32), (THUMBNAIL_LENGTH,)),
+    ('matrix', np.dtype(DESCRIPTOR_DTYPE), (DESCRIPTOR_LENGTH,)),
+)
+
+CURRENT_FILENAME = 'gallery.current'
+LOCK_FILENAME = 'gallery.lock'
+# Older versions kept on disk so workers still reading them are not surprised
+KEEP_VERSIONS = 2
+# Spare rows reserved when a gallery file is written
+MIN_SPARE_ROWS = 64
+SPARE_FRACTION = 0.25
+# Rewrite the file once this share of its rows are dead
+MAX_DEAD_FRACTION = 0.25
+
+_cache_lock = threading.Lock()
+_cache = {'key': None, 'gallery': None}
+
+
+class Gallery:
+    """All criminal descriptors stacked into one contiguous (criminals x pixels) matrix"""
+
+    version = 0
+    # Boolean mask of rows still in use, or None when every row is
+    live = None
+
+    def __init__(self, ids, matrix, moments=None):
+        self.ids = list(ids)
+        self.matrix = np.ascontiguousarray(matrix, dtype=DESCRIPTOR_DTYPE).reshape(len(self.ids), DESCRIPTOR_LENGTH)
+        self._moments = moments
+        self._hashes = None
+        self._thumbnails = None
+        self._rows = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def moments(self):
+        """Return a (rows x 3) array of each row's mean, variance and squared norm"""
+        if self._moments is None:
+            self._moments = np.stack(vector_moments(self.matrix), axis=1)
+        return self._moments
+
+    def hashes(self):
+        """Return each row's 64-bit perceptual hash"""
+        if self._hashes is None:
+            self._hashes = perceptual_hashes(self.matrix)
+        return self._hashes
+
+    def thumbnails(self):
+        """Return each row's normalized 16x16 grayscale thumbnail"""
+        if self._thumbnails is None:
+            self._thumbnails = thumbnail_vectors(self.matrix)
+        return self._thumbnails
+
+    def live_rows(self):
+        """Return the row numbers currently in use"""
+        if self.live is None:
+            return np.arange(len(self.ids))
+        return np.flatnonzero(self.live)
+
+    def row_numbers(self, ids):
+        """Return the live matrix rows of the given criminal ids, skipping unknown ones"""
+        if self._rows is None:
+            self._rows = {self.ids[row]: int(row) for row in self.live_rows()}
+        rows = [self._rows[criminal_id] for criminal_id in ids if criminal_id in self._rows]
+        if self.live is not None:
+            # A row may have been removed since the lookup table was built
+            rows = [row for row in rows if self.live[row]]
+        return rows
+
+    def subset(self, rows):
+        """Return an in-memory Gallery holding only the given rows"""
+        rows = np.asarray(sorted(rows), dtype=np.int64)
+        return Gallery([self.ids[row] for row in rows], self.matrix[rows], self.moments()[rows])
+
+
+class MappedGallery(Gallery):
+    """
+    A published gallery file opened with numpy.memmap, shared through the page cache.
+
+    The mapping is shared with the writer, so a row marked dead in the file
+    stops matching immediately, even before this reader reopens the file for
+    the new version.
+    """
+
+    def __init__(self, path, mode='r'):
+        self.path = path
+        self._header = np.memmap(path, dtype=np.uint8, mode=mode, shape=(HEADER_SIZE,))
+        magic, file_format, length, count, capacity, version = self.header()
+        if magic != GALLERY_MAGIC or file_format != GALLERY_FORMAT or length != DESCRIPTOR_LENGTH:
+            raise ValueError(f"{path} is not a compatible gallery file")
+
+        self.version = version
+        self.capacity = capacity
+        self.count = count
+        # Writers need the spare rows too
+        self.sections = _map_sections(path, mode, capacity, capacity if mode == 'r+' else count)
+        self._ids = self.sections['ids']
+        self.ids = [criminal_id.decode('ascii') for criminal_id in self._ids[:count]]
+        self.live = self.sections['live'][:count]
+        self.matrix = self.sections['matrix'][:count]
+        self._moments = self.sections['moments'][:count]
+        self._hashes = self.sections['hashes'][:count]
+        self._thumbnails = self.sections['thumbnails'][:count]
+        self._rows = None
+
+    def header(self):
+        """Unpack the header as it is in the file right now"""
+        return HEADER_STRUCT.unpack(self._header[:HEADER_STRUCT.size].tobytes())
+
+    def file_version(self):
+        """Gallery version currently recorded in the file, which may be newer than self.version"""
+        return self.header()[5]
+
+
+def _section_offsets(capacity):
+    """Byte offset of every row section for a file with room for capacity rows"""
+    offsets = {}
+    offset = HEADER_SIZE
+    for name, dtype, shape in ROW_SECTIONS:
+        # The matrix is page aligned, everything else 8-byte aligned
+        alignment = PAGE_SIZE if name == 'matrix' else 8
+        offset = (offset + alignment - 1) // alignment * alignment
+        offsets[name] = offset
+        offset += capacity * dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+    offsets['end'] = offset
+    return offsets
+
+
+def _map_sections(path, mode, capacity, rows):
+    """Map the first rows rows of every section of a gallery file"""
+    offsets = _section_offsets(capacity)
+    sections = {}
+    for name, dtype, shape in ROW_SECTIONS:
+        if rows:
+            sections[name] = np.memmap(path, dtype=dtype, mode=mode, offset=offsets[name], shape=(rows,) + shape)
+        else:
+            sections[name] = np.empty((0,) + shape, dtype=dtype)
+    return sections
+
+
+def _row_features(matrix):
+    """Compute the derived per-row sections for a block of descriptors"""
+    return {
+        'moments': np.stack(vector_moments(matrix), axis=1),
+        'hashes': perceptual_hashes(matrix),
+        'thumbnails': thumbnail_vectors(matrix),
+    }
+
+
+def gallery_dir():
+    return settings.DETECTION_INDEX_DIR
+
+
+def gallery_queryset():
+    """Criminals that belong in the gallery"""
+    from .models import Criminal
+
+    # Criminals no longer wanted are not matched against
+    return Criminal.objects.filter(
+        is_wanted=True,
+        face_descriptor__isnull=False,
+        descriptor_version=DESCRIPTOR_VERSION
+    )
+
+
+def load_gallery(ids=None):
+    """Build an in-memory Gallery straight from the database, optionally only for ids"""
+    criminals = gallery_queryset()
+    if ids is not None:
+        criminals = criminals.filter(id__in=list(ids))
+    rows = criminals.values_list('id', 'face_descriptor')
+
+    ids = []
+    matrix = np.empty((len(rows), DESCRIPTOR_LENGTH), dtype=DESCRIPTOR_DTYPE)
+    for row_num, (criminal_id, descriptor) in enumerate(rows):
+        ids.append(str(criminal_id))
+        matrix[row_num] = descriptor_from_bytes(descriptor)
+    return Gallery(ids, matrix)
+
+
+@contextmanager
+def _publish_lock():
+    """Serialize gallery publishing across processes"""
+    os.makedirs(gallery_dir(), exist_ok=True)
+    with open(os.path.join(gallery_dir(), LOCK_FILENAME), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _current_filename():
+    try:
+        with open(os.path.join(gallery_dir(), CURRENT_FILENAME)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def current_version():
+    """
+    Version of the currently published gallery, or 0 if none is published.
+
+    Every published file and every in-place change bumps the version by one,
+    so it only ever increases and caches derived from the gallery can key on it.
+    """
+    filename = _current_filename()
+    if not filename:
+        return 0
+    try:
+        with open(os.path.join(gallery_dir(), filename), 'rb') as f:
+            return HEADER_STRUCT.unpack(f.read(HEADER_STRUCT.size))[5]
+    except (OSError, struct.error):
+        return 0
+
+
+def publish_gallery(batch_size=500):
+    """
+    Write every current descriptor to a new versioned gallery file and make it current.
+
+    The file is fully written and flushed before the pointer file is swapped
+    with os.replace, so readers only ever see complete galleries.
+    """
+    with _publish_lock():
+        return _publish(batch_size)
+
+
+def ensure_gallery_published():
+    """Publish a gallery if none exists yet, e.g. on a fresh deploy"""
+    if _current_filename():
+        return current_version()
+    with _publish_lock():
+        # Another worker may have published while we waited for the lock
+        if _current_filename():
+            return current_version()
+        return _publish()
+
+
+def _publish(batch_size=500):
+    """Write and swap in a new gallery version; the caller holds the publish lock"""
+    version = current_version() + 1
+    filename = f'gallery-{version:010d}.bin'
+    path = os.path.join(gallery_dir(), filename)
+    temp_path = f'{path}.tmp'
+
+    # Snapshot the ids first; criminals saved afterwards publish again themselves
+    ids = [str(criminal_id) for criminal_id in gallery_queryset().values_list('id', flat=True)]
+    count = len(ids)
+    capacity = count + max(MIN_SPARE_ROWS, int(count * SPARE_FRACTION))
+
+    with open(temp_path, 'wb') as f:
+        f.truncate(_section_offsets(capacity)['end'])
+
+    written = 0
+    sections = _map_sections(temp_path, 'r+', capacity, capacity)
+    for start in range(0, count, batch_size):
+        batch = gallery_queryset().filter(id__in=ids[start:start + batch_size])
+        first = written
+        for criminal_id, descriptor in batch.values_list('id', 'face_descriptor'):
+            # Rows deleted since the snapshot are skipped
+            sections['ids'][written] = str(criminal_id).encode('ascii')
+            sections['matrix'][written] = descriptor_from_bytes(descriptor)
+            sections['live'][written] = True
+            written += 1
+        if written > first:
+            for name, values in _row_features(sections['matrix'][first:written]).items():
+                sections[name][first:written] = values
+    for mapped in sections.values():
+        mapped.flush()
+    del sections
+
+    with open(temp_path, 'r+b') as f:
+        f.write(HEADER_STRUCT.pack(GALLERY_MAGIC, GALLERY_FORMAT, DESCRIPTOR_LENGTH, written, capacity, version))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+    # Atomically point readers at the new version
+    pointer_temp = os.path.join(gallery_dir(), f'{CURRENT_FILENAME}.{os.getpid()}.tmp')
+    with open(pointer_temp, 'w') as f:
+        f.write(filename)
+    os.replace(pointer_temp, os.path.join(gallery_dir(), CURRENT_FILENAME))
+
+    _remove_old_versions(version)
+    return version
+
+
+def apply_gallery_changes(criminal_ids):
+    """
+    Bring the published gallery in line with the database for a few criminals.
+
+    Each criminal is added, replaced or removed in the current file rather
+    than rewriting it: new descriptors go into spare rows, and the rows they
+    replace, or of criminals that were deleted or are no longer wanted, are
+    marked dead. The header version is bumped once the rows are in place.
+    The file is rewritten from scratch only when it runs out of spare rows or
+    has too many dead ones. Returns the new gallery version.
+    """
+    criminal_ids = {str(criminal_id) for criminal_id in criminal_ids}
+    with _publish_lock():
+        filename = _current_filename()
+        if not filename:
+            return _publish()
+        try:
+            gallery = MappedGallery(os.path.join(gallery_dir(), filename), mode='r+')
+        except (OSError, ValueError) as e:
+            print(f"Error opening gallery for update, rewriting it: {e}")
+            return _publish()
+
+        wanted = {
+            str(criminal_id): descriptor_from_bytes(descriptor)
+            for criminal_id, descriptor in gallery_queryset().filter(
+                id__in=list(criminal_ids)
+            ).values_list('id', 'face_descriptor')
+        }
+
+        removals = []
+        additions = []
+        for criminal_id in criminal_ids:
+            rows = gallery.row_numbers([criminal_id])
+            descriptor = wanted.get(criminal_id)
+            if descriptor is not None and rows and np.array_equal(gallery.matrix[rows[0]], descriptor):
+                continue
+            removals.extend(rows)
+            if descriptor is not None:
+                additions.append((criminal_id, descriptor))
+
+        if not removals and not additions:
+            return gallery.version
+
+        count = gallery.count + len(additions)
+        dead = gallery.count - int(np.count_nonzero(gallery.live)) + len(removals)
+        if count > gallery.capacity or dead > count * MAX_DEAD_FRACTION:
+            del gallery
+            return _publish()
+
+        # Write new rows past the end before any reader can see them
+        if additions:
+            rows = slice(gallery.count, count)
+            sections = gallery.sections
+            sections['ids'][rows] = [criminal_id.encode('ascii') for criminal_id, _ in additions]
+            sections['matrix'][rows] = np.stack([descriptor for _, descriptor in additions])
+            for name, values in _row_features(sections['matrix'][rows]).items():
+                sections[name][rows] = values
+            sections['live'][rows] = True
+            for mapped in sections.values():
+                mapped.flush()
+
+        # Dead rows stop matching in every worker as soon as this is written
+        if removals:
+            gallery.live[removals] = False
+            gallery.live.flush()
+
+        version = gallery.version + 1
+        gallery._header[:HEADER_STRUCT.size] = np.frombuffer(HEADER_STRUCT.pack(
+            GALLERY_MAGIC, GALLERY_FORMAT, DESCRIPTOR_LENGTH, count, gallery.capacity, version
+        ), dtype=np.uint8)
+        gallery._header.flush()
+        return version
+
+
+def _remove_old_versions(version):
+    """Delete gallery files older than the last KEEP_VERSIONS versions"""
+    for filename in os.listdir(gallery_dir()):
+        if filename.startswith('gallery-') and filename.endswith('.bin'):
+            try:
+                file_version = int(filename[len('gallery-'):-len('.bin')])
+            except ValueError:
+                continue
+            if file_version <= version - KEEP_VERSIONS:
+                try:
+                    # Workers that still map the file keep their pages until they reopen
+                    os.unlink(os.path.join(gallery_dir(), filename))
+                except OSError:
+                    pass
+
+
+def get_gallery():
+    """
+    Return the currently published MappedGallery, or None if none is published.
+
+    The pointer file and the mapped header are checked on every call, so
+    workers switch to a newly published file or pick up rows added in place
+    on their next request without restarting.
+    """
+    try:
+        pointer = os.stat(os.path.join(gallery_dir(), CURRENT_FILENAME))
+    except OSError:
+        return None
+    key = (pointer.st_ino, pointer.st_mtime_ns)
+
+    with _cache_lock:
+        cached = _cache['gallery']
+        if cached is None or _cache['key'] != key or cached.file_version() != cached.version:
+            filename = _current_filename()
+            try:
+                _cache['gallery'] = MappedGallery(os.path.join(gallery_dir(), filename))
+                _cache['key'] = key
+            except Exception as e:
+                print(f"Error opening gallery {filename}: {e}")
+                return None
+        return _cache['gallery']
+
+
+def warm_up_gallery():
+    """Publish the gallery if needed and map it, so the first upload does not wait"""
+    try:
+        ensure_gallery_published()
+        gallery = get_gallery()
+        if gallery is not None:
+            print(f"Gallery ready (pid {os.getpid()}): version {gallery.version}, {len(gallery)} criminals")
+    except Exception as e:
+        print(f"Error warming up gallery: {e}")
@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import socket
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import DetectionJob, DetectionReport
+from .metrics import increment, observe_stages
+from .profiling import start_timings, stop_timings
+from .stats import record_report_change
+
+logger = logging.getLogger(__name__)
+
+
+def async_detection_enabled(request=None):
+    """
+    Return True if an upload should be queued instead of processed inline.
+
+    The DETECTION_ASYNC setting picks the default; a request can override it
+    with an 'async' field of 'true' or 'false'.
+    """
+    enabled = getattr(settings, 'DETECTION_ASYNC', False)
+    if request is not None:
+        requested = request.POST.get('async', request.GET.get('async', ''))
+        if requested.lower() in ('true', '1'):
+            enabled = True
+        elif requested.lower() in ('false', '0'):
+            enabled = False
+    return enabled
+
+
+def default_worker_name():
+    """Identify this worker process in claimed jobs"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_detection(report):
+    """Queue a saved report for detection and mark it as not yet processed"""
+    with transaction.atomic():
+        if report.is_processed:
+            report.is_processed = False
+            report.status = DetectionReport.STATUS_PENDING
+            report.save(update_fields=['is_processed', 'status'])
+            record_report_change(report, pending_review=1)
+        job, created = DetectionJob.objects.get_or_create(report=report)
+        if not created:
+            # Re-queue an existing job, e.g. to re-run detection on a report
+            job.status = DetectionJob.STATUS_PENDING
+            job.error = ''
+            job.result = ''
+            job.save(update_fields=['status', 'error', 'result'])
+    return job
+
+
+def claim_next_job(worker_name):
+    """
+    Atomically claim the oldest pending job, or return None if the queue is empty.
+
+    Databases that support SELECT ... FOR UPDATE SKIP LOCKED (PostgreSQL) let
+    concurrent workers skip rows another worker is claiming. Elsewhere (SQLite)
+    a job is claimed with a conditional UPDATE, so two workers racing for the
+    same row cannot both win.
+    """
+    pending = DetectionJob.objects.filter(status=DetectionJob.STATUS_PENDING).order_by('created_at')
+    claim = {
+        'status': DetectionJob.STATUS_RUNNING,
+        'worker': worker_name[:100],
+        'started_at': timezone.now(),
+        'attempts': F('attempts') + 1,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = pending.select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            DetectionJob.objects.filter(pk=job.pk).update(**claim)
+        job.refresh_from_db()
+        return job
+
+    # Fallback: try the oldest few candidates until a conditional update wins
+    for job_id in pending.values_list('id', flat=True)[:10]:
+        claimed = DetectionJob.objects.filter(
+            pk=job_id, status=DetectionJob.STATUS_PENDING
+        ).update(**claim)
+        if claimed:
+            return DetectionJob.objects.get(pk=job_id)
+    return None
+
+
+def run_job(job, max_attempts=3):
+    """Run detection for a claimed job and record the outcome"""
+    # Imported here because views imports this module for enqueueing
+    from .views import process_image_for_detection, save_detection_results
+
+    report = job.report
+    timings = start_timings()
+    try:
+        # Errors reach the except below, so the job is retried or marked failed
+        detection_results = process_image_for_detection(report, raise_errors=True)
+        with transaction.atomic():
+            save_detection_results(report, detection_results)
+            job.status = DetectionJob.STATUS_DONE
+            job.result = json.dumps(detection_results)
+            job.error = ''
+            job.finished_at = timezone.now()
+            job.save(update_fields=['status', 'result', 'error', 'finished_at'])
+        observe_stages(timings)
+    except Exception as e:
+        logger.exception("Error running detection job %s", job.id)
+        # Leave the job for another attempt unless it keeps failing
+        job.status = DetectionJob.STATUS_PENDING if job.attempts < max_attempts else DetectionJob.STATUS_FAILED
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+    finally:
+        stop_timings()
+    increment('detection_jobs_total', status=job.status)
+    return job
+
+
+def requeue_stale_jobs(timeout_seconds, max_attempts=3):
+    """Return jobs stuck in running (e.g. after a worker crash) to the queue"""
+    cutoff = timezone.now() - timedelta(seconds=timeout_seconds)
+    stale = DetectionJob.objects.filter(status=DetectionJob.STATUS_RUNNING, started_at__lt=cutoff)
+    requeued = stale.filter(attempts__lt=max_attempts).update(status=DetectionJob.STATUS_PENDING)
+    failed = stale.update(status=DetectionJob.STATUS_FAILED, error='Timed out')
+    return requeued, failed
+
+
+def queue_depth():
+    """Number of jobs waiting to be claimed"""
+    return DetectionJob.objects.filter(status=DetectionJob.STATUS_PENDING).count()
@@ -0,0 +1,366 @@
+import io
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from detection.models import Criminal, DetectionReport
+from detection.ann import ann_enabled, get_index
+from detection.descriptors import (
+    DESCRIPTOR_VERSION, decode_image, descriptor_from_image, descriptor_to_bytes, locate_face,
+)
+from detection.detectors import detect_faces, detect_faces_tiled, warm_up
+from detection.gallery import publish_gallery
+from detection.profiling import start_timings, stop_timings
+from detection.views import process_image_for_detection, save_detection_results
+from .populate_criminals import draw_sample_face
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak RSS is then left out
+    resource = None
+
+# The many face contact sheet is also scaled up to a 12 MP phone photo, and
+# a 12 MP crowd of 300 small faces is added, to compare detection modes
+LARGE_PROBE_SIZE = (4032, 3024)
+CROWD_GRID = (20, 15)
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark process_image_for_detection against synthetic galleries and write '
+        'per-stage p50/p95/p99 timings and peak memory as JSON. Runs in a throwaway '
+        'test database; a 100k gallery needs roughly 25 GB of free disk.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='10,1000,10000,100000',
+            help='Comma-separated gallery sizes, benchmarked in increasing order',
+        )
+        parser.add_argument(
+            '--probes',
+            default='none,one,many',
+            help='Comma-separated probe images: none (no faces), one, many',
+        )
+        parser.add_argument('--iterations', type=int, default=20, help='Timed runs per gallery size and probe')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed runs before timing')
+        parser.add_argument(
+            '--probe-photo',
+            default=os.path.join(settings.BASE_DIR, '1.jpg'),
+            help='Photo with one real face used to build the one and many face probes',
+        )
+        parser.add_argument('--label', default='', help='Free-form label stored in the output, e.g. a commit id')
+        parser.add_argument('--output', default='', help='Write the JSON here instead of standard output')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic gallery faces')
+        parser.add_argument(
+            '--max-dimensions',
+            default='1280,1920',
+            help='Comma-separated detection long-edge caps compared with full resolution '
+                 '(speedup and recall per probe); empty to skip',
+        )
+        parser.add_argument(
+            '--tile-workers',
+            default=f'1,{os.cpu_count() or 1}',
+            help='Comma-separated thread counts for tiled detection, compared with single-pass '
+                 'full resolution detection; empty to skip',
+        )
+        parser.add_argument('--resolution-iterations', type=int, default=5, help='Timed runs per probe and mode')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(value) for value in options['sizes'].split(',') if value.strip())
+        probe_names = [value.strip() for value in options['probes'].split(',') if value.strip()]
+        workdir = tempfile.mkdtemp(prefix='detection-benchmark-')
+
+        # Keep the throwaway database on disk: large galleries do not fit in memory
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        if connection.vendor == 'sqlite':
+            test_settings['NAME'] = os.path.join(workdir, 'benchmark.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(
+                MEDIA_ROOT=os.path.join(workdir, 'media'),
+                DETECTION_INDEX_DIR=os.path.join(workdir, 'gallery'),
+                DETECTION_ASYNC=False,
+            ):
+                warm_up()
+                report = self.run(sizes, probe_names, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Wrote benchmark results to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def run(self, sizes, probe_names, options):
+        probes = self.build_probes(options['probe_photo'], probe_names)
+        rng = np.random.default_rng(options['seed'])
+
+        # The probe photo's own face is in every gallery so the one face probe has a true match
+        probe_face = cv2.imread(options['probe_photo'])
+        self.add_criminals([descriptor_from_image(probe_face, locate_face(probe_face))], 'Probe')
+
+        results = []
+        for size in sizes:
+            start = time.perf_counter()
+            self.grow_gallery(size, rng)
+            build_seconds = time.perf_counter() - start
+            self.stderr.write(f'Gallery of {size} criminals ready in {build_seconds:.1f}s')
+
+            for probe_name, probe_bytes in probes.items():
+                results.append(self.measure(size, probe_name, probe_bytes, options))
+                self.stderr.write(
+                    f"  {probe_name}: total p50 {results[-1]['stages']['total']['wall_ms']['p50']:.1f}ms"
+                )
+
+        max_dimensions = [int(value) for value in options['max_dimensions'].split(',') if value.strip()]
+        worker_counts = [int(value) for value in options['tile_workers'].split(',') if value.strip()]
+        images = self.detection_images(probes) if max_dimensions or worker_counts else {}
+        resolution = self.compare_resolutions(images, max_dimensions, options) if max_dimensions else []
+        tiling = self.compare_tiling(images, worker_counts, options) if worker_counts else []
+
+        return {
+            'label': options['label'],
+            'created_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'opencv': cv2.__version__,
+                'database': connection.vendor,
+                'cpu_count': os.cpu_count(),
+            },
+            'settings': {
+                name: getattr(settings, name, None) for name in (
+                    'DETECTION_SCORING', 'DETECTION_SHORTLIST_METHOD', 'DETECTION_SHORTLIST_SIZE',
+                    'DETECTION_ANN_ENABLED', 'DETECTION_ANN_MIN_GALLERY', 'DETECTION_ANN_NPROBE',
+                    'DETECTION_ANN_CANDIDATES', 'DETECTION_MAX_DIMENSION', 'DETECTION_TILE_SIZE',
+                    'DETECTION_TILE_OVERLAP', 'DETECTION_PROFILE',
+                )
+            },
+            'iterations': options['iterations'],
+            'results': results,
+            'resolution': resolution,
+            'tiling': tiling,
+        }
+
+    def build_probes(self, probe_photo, probe_names):
+        """Encode the probe images as JPEG bytes, keyed by probe name"""
+        face = cv2.imread(probe_photo)
+        if face is None and any(name != 'none' for name in probe_names):
+            raise ValueError(f'Could not read probe photo {probe_photo}')
+
+        probes = {}
+        for name in probe_names:
+            if name == 'none':
+                # A noisy empty frame: the cascades scan everything and find nothing
+                image = np.random.default_rng(1).integers(90, 160, size=(720, 1280, 3), dtype=np.uint8)
+            elif name == 'one':
+                image = face
+            elif name == 'many':
+                # Six copies of the face on one 3x2 contact sheet
+                tile = cv2.resize(face, (640, int(face.shape[0] * 640 / face.shape[1])))
+                image = np.vstack([np.hstack([tile] * 3)] * 2)
+            else:
+                raise ValueError(f'Unknown probe {name}, expected none, one or many')
+            probes[name] = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+        return probes
+
+    def grow_gallery(self, size, rng, batch_size=500):
+        """Add drawn criminals until the gallery has size entries, then republish it"""
+        missing = size - Criminal.objects.count()
+        while missing > 0:
+            count = min(batch_size, missing)
+            # Descriptors of the whole drawing, as for gallery photos without a detectable face
+            descriptors = [descriptor_from_image(draw_sample_face(f'S{row}', rng)) for row in range(count)]
+            self.add_criminals(descriptors, 'Synthetic')
+            missing -= count
+
+        publish_gallery()
+        if size >= getattr(settings, 'DETECTION_ANN_MIN_GALLERY', 5000) and getattr(settings, 'DETECTION_ANN_ENABLED', True):
+            call_command('build_gallery_index', retrain=True, stdout=io.StringIO())
+
+    def add_criminals(self, descriptors, prefix):
+        # bulk_create skips the post_save signals; the gallery is published once per size instead
+        Criminal.objects.bulk_create([
+            Criminal(
+                name=f'{prefix} {row}',
+                photo='criminal_photos/synthetic.jpg',
+                face_descriptor=descriptor_to_bytes(descriptor),
+                descriptor_version=DESCRIPTOR_VERSION,
+                descriptor_photo='criminal_photos/synthetic.jpg',
+            )
+            for row, descriptor in enumerate(descriptors)
+        ])
+
+    def measure(self, size, probe_name, probe_bytes, options):
+        """Run detection on one probe repeatedly and summarize every stage"""
+        samples = []
+        faces_detected = 0
+        for iteration in range(options['warmup'] + options['iterations']):
+            report = DetectionReport(location='benchmark', detection_time=timezone.now())
+            report.photo.save('probe.jpg', ContentFile(probe_bytes), save=True)
+
+            timings = start_timings()
+            start = time.perf_counter()
+            cpu_start = time.thread_time()
+            detection_results = process_image_for_detection(report)
+            save_detection_results(report, detection_results)
+            total = ((time.perf_counter() - start) * 1000, (time.thread_time() - cpu_start) * 1000)
+            stop_timings()
+
+            if iteration >= options['warmup']:
+                sample = dict(timings.stages)
+                sample['total'] = total
+                samples.append(sample)
+                # One best candidate per matched face, alternatives have rank > 1
+                faces_detected = len([result for result in detection_results if result.get('rank', 1) == 1])
+            report.photo.delete(save=False)
+
+        # One more run under tracemalloc for the peak Python/numpy allocation
+        report = DetectionReport(location='benchmark', detection_time=timezone.now())
+        report.photo.save('probe.jpg', ContentFile(probe_bytes), save=True)
+        tracemalloc.start()
+        process_image_for_detection(report)
+        peak_traced = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        report.photo.delete(save=False)
+
+        stages = {}
+        for name in dict.fromkeys(name for sample in samples for name in sample):
+            values = [sample[name] for sample in samples if name in sample]
+            stages[name] = {
+                'count': len(values),
+                'wall_ms': self.percentiles([wall for wall, _ in values]),
+                'cpu_ms': self.percentiles([cpu for _, cpu in values]),
+            }
+
+        return {
+            'gallery_size': size,
+            'probe': probe_name,
+            # Faces matched in the probe, each reported with up to DETECTION_TOP_K candidates
+            'faces_reported': faces_detected,
+            'ann_index_used': ann_enabled(get_index()),
+            'stages': stages,
+            'peak_traced_mb': round(peak_traced / 2 ** 20, 2),
+            # Process-wide high-water mark, so it only grows from one scenario to the next
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1) if resource else None,
+        }
+
+    def detection_images(self, probes):
+        """Decoded probe images plus the 12 MP large and crowd images, keyed by name"""
+        images = {name: decode_image(probe_bytes) for name, probe_bytes in probes.items()}
+        if images.get('many') is not None:
+            images['large'] = cv2.resize(images['many'], LARGE_PROBE_SIZE, interpolation=cv2.INTER_CUBIC)
+        if images.get('one') is not None:
+            columns, rows = CROWD_GRID
+            small = cv2.resize(images['one'], (LARGE_PROBE_SIZE[0] // columns, LARGE_PROBE_SIZE[1] // rows))
+            images['crowd'] = np.vstack([np.hstack([small] * columns)] * rows)
+        return images
+
+    def time_detection(self, detect, image, options):
+        """Run detect(image) repeatedly; return the last faces and the timing percentiles"""
+        times = []
+        for _ in range(options['resolution_iterations']):
+            start = time.perf_counter()
+            faces = detect(image)
+            times.append((time.perf_counter() - start) * 1000)
+        return faces, self.percentiles(times)
+
+    def compare_resolutions(self, images, max_dimensions, options):
+        """
+        Time face detection with each long-edge cap against full resolution.
+
+        recall is the share of full resolution boxes also found with the cap
+        (intersection over union of at least 0.5).
+        """
+        results = []
+        for probe_name, image in images.items():
+            reference = None
+            for max_dimension in [0] + max_dimensions:
+                faces, detect_ms = self.time_detection(lambda img: detect_faces(img, max_dimension)[0], image, options)
+                result = {
+                    'probe': probe_name,
+                    'image_size': [image.shape[1], image.shape[0]],
+                    'max_dimension': max_dimension,
+                    'faces': len(faces),
+                    'detect_ms': detect_ms,
+                }
+                if reference is None:
+                    reference = (faces, detect_ms['p50'])
+                else:
+                    result['speedup'] = round(reference[1] / max(detect_ms['p50'], 1e-6), 2)
+                    result['recall'] = self.recall(reference[0], faces)
+                results.append(result)
+                self.stderr.write(
+                    f"  {probe_name} at {max_dimension or 'full'}: detect p50 {detect_ms['p50']:.1f}ms, "
+                    f"{len(faces)} faces"
+                )
+        return results
+
+    def compare_tiling(self, images, worker_counts, options):
+        """
+        Time tiled detection with each thread count against a single full
+        resolution pass, with the recall of the tiled boxes.
+        """
+        results = []
+        for probe_name, image in images.items():
+            reference, reference_ms = self.time_detection(lambda img: detect_faces(img, 0)[0], image, options)
+            for workers in worker_counts:
+                faces, detect_ms = self.time_detection(
+                    lambda img: detect_faces_tiled(img, workers=workers)[0], image, options
+                )
+                results.append({
+                    'probe': probe_name,
+                    'image_size': [image.shape[1], image.shape[0]],
+                    'workers': workers,
+                    'faces': len(faces),
+                    'detect_ms': detect_ms,
+                    'single_pass_ms': reference_ms,
+                    'speedup': round(reference_ms['p50'] / max(detect_ms['p50'], 1e-6), 2),
+                    'recall': self.recall(reference, faces),
+                })
+                self.stderr.write(
+                    f"  {probe_name} tiled on {workers} threads: detect p50 {detect_ms['p50']:.1f}ms, "
+                    f"{len(faces)} faces (single pass {reference_ms['p50']:.1f}ms, {len(reference)} faces)"
+                )
+        return results
+
+    def recall(self, reference, found, threshold=0.5):
+        """Share of reference boxes matched by a found box, or None without reference boxes"""
+        if not reference:
+            return None
+
+        def iou(a, b):
+            x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+            x2, y2 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+            inter = max(0, x2 - x1) * max(0, y2 - y1)
+            return inter / (a[2] * a[3] + b[2] * b[3] - inter)
+
+        matched = sum(1 for box in reference if any(iou(box, other) >= threshold for other in found))
+        return round(matched / len(reference), 3)
+
+    def percentiles(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        return {
+            'p50': round(float(np.percentile(values, 50)), 3),
+            'p95': round(float(np.percentile(values, 95)), 3),
+            'p99': round(float(np.percentile(values, 99)), 3),
+            'mean': round(float(values.mean()), 3),
+        }
@@ -0,0 +1,164 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from detection.ann import COARSE_SIZE, IVFIndex, coarse_vectors, get_index, index_path
+from detection.descriptors import descriptor_from_bytes
+from detection.gallery import gallery_queryset
+from detection.matching import score_faces
+
+class Command(BaseCommand):
+    help = 'Build or incrementally update the approximate nearest-neighbour gallery index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retrain',
+            action='store_true',
+            help='Retrain the coarse quantizer from scratch instead of updating the existing index',
+        )
+        parser.add_argument(
+            '--nlist',
+            type=int,
+            default=None,
+            help='Number of index cells when training (default: about 4 * sqrt(gallery size))',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Number of descriptors to load from the database at a time',
+        )
+        parser.add_argument(
+            '--evaluate',
+            action='store_true',
+            help='Report recall@k and latency against brute force after building',
+        )
+        parser.add_argument('--queries', type=int, default=100, help='Number of evaluation queries')
+        parser.add_argument('--k', type=int, default=50, help='Candidates per query when evaluating')
+        parser.add_argument(
+            '--nprobe',
+            default='1,4,8,16,32',
+            help='Comma-separated nprobe values to evaluate',
+        )
+
+    def handle(self, *args, **options):
+        # Anything changed after this moment is picked up by the detection path
+        # as a recent criminal, so take the timestamp before reading
+        built_at = timezone.now()
+        criminals = gallery_queryset()
+
+        index = None if options['retrain'] else get_index()
+        start = time.perf_counter()
+        if index is None:
+            ids, vectors = self.load_vectors(criminals, options['batch_size'])
+            if len(ids) == 0:
+                self.stdout.write(self.style.WARNING('No criminal descriptors to index'))
+                return
+            index = IVFIndex.train(ids, vectors, nlist=options['nlist'])
+            self.stdout.write(f'Trained index with {len(index.centroids)} cells over {len(index)} criminals')
+        else:
+            current_ids = {str(criminal_id) for criminal_id in criminals.values_list('id', flat=True)}
+            removed = [criminal_id for criminal_id in index.ids.tolist() if criminal_id not in current_ids]
+            index.remove(removed)
+
+            indexed_ids = set(index.ids.tolist())
+            changed = criminals.filter(updated_at__gt=index.built_at)
+            missing = [criminal_id for criminal_id in current_ids if criminal_id not in indexed_ids]
+            ids, vectors = self.load_vectors(changed, options['batch_size'])
+            missing_ids, missing_vectors = self.load_vectors(
+                criminals.filter(id__in=missing), options['batch_size']
+            )
+            index.add(ids + missing_ids, np.concatenate([vectors, missing_vectors]))
+            self.stdout.write(
+                f'Updated index: {len(ids) + len(missing_ids)} added or refreshed, {len(removed)} removed'
+            )
+
+        index.built_at = built_at
+        index.save(index_path())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Saved index of {len(index)} criminals to {index_path()} in {time.perf_counter() - start:.2f}s'
+            )
+        )
+
+        if options['evaluate']:
+            self.evaluate(index, criminals, options)
+
+    def load_vectors(self, criminals, batch_size):
+        """Return (ids, coarse vectors) for a queryset of criminals"""
+        ids = []
+        batches = []
+        batch = []
+        for criminal_id, descriptor in criminals.values_list('id', 'face_descriptor').iterator(chunk_size=batch_size):
+            ids.append(str(criminal_id))
+            batch.append(descriptor_from_bytes(descriptor))
+            if len(batch) == batch_size:
+                batches.append(coarse_vectors(np.stack(batch)))
+                batch = []
+        if batch:
+            batches.append(coarse_vectors(np.stack(batch)))
+        if not batches:
+            return [], np.empty((0, COARSE_SIZE * COARSE_SIZE), dtype=np.float32)
+        return ids, np.concatenate(batches)
+
+    def evaluate(self, index, criminals, options):
+        """Compare ANN candidates with brute-force search over the same gallery"""
+        rng = np.random.default_rng(0)
+        query_ids = rng.choice(index.ids, min(options['queries'], len(index)), replace=False)
+
+        # Queries are noisy copies of gallery faces, like a new photo of a known person
+        query_descriptors = []
+        for descriptor in criminals.filter(id__in=query_ids.tolist()).values_list('face_descriptor', flat=True):
+            original = descriptor_from_bytes(descriptor)
+            noisy = original + rng.normal(0, 0.05, size=original.shape)
+            query_descriptors.append(np.clip(noisy, 0, 1).astype(np.float32))
+        query_descriptors = np.stack(query_descriptors)
+        queries = coarse_vectors(query_descriptors)
+        k = options['k']
+
+        # Exact best match per query under the full MSE/SSIM/NCC blend, scored in chunks
+        start = time.perf_counter()
+        best_scores = np.full(len(queries), -1.0)
+        best_ids = np.empty(len(queries), dtype='U36')
+        rows = criminals.values_list('id', 'face_descriptor').iterator(chunk_size=options['batch_size'])
+        while True:
+            chunk = [row for _, row in zip(range(options['batch_size']), rows)]
+            if not chunk:
+                break
+            chunk_ids = np.array([str(criminal_id) for criminal_id, _ in chunk])
+            chunk_matrix = np.stack([descriptor_from_bytes(descriptor) for _, descriptor in chunk])
+            scores = score_faces(query_descriptors, chunk_matrix)
+            columns = scores.argmax(axis=1)
+            chunk_best = scores[np.arange(len(queries)), columns]
+            better = chunk_best > best_scores
+            best_scores[better] = chunk_best[better]
+            best_ids[better] = chunk_ids[columns[better]]
+        exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        # Brute-force top k over the coarse vectors
+        start = time.perf_counter()
+        similarities = queries @ index.vectors.T
+        brute_top = np.argpartition(-similarities, min(k, len(index)) - 1, axis=1)[:, :k]
+        brute_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        brute_sets = [set(index.ids[row].tolist()) for row in brute_top]
+
+        self.stdout.write(
+            f'Brute force: {brute_ms:.2f} ms/query over coarse vectors, '
+            f'{exact_ms:.1f} ms/query for the exact blended score'
+        )
+        for nprobe in [int(value) for value in options['nprobe'].split(',') if value.strip()]:
+            start = time.perf_counter()
+            results = index.search(queries, k=k, nprobe=nprobe)
+            ann_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+            recall = np.mean([
+                len(brute & set(found.tolist())) / max(1, len(brute))
+                for brute, (found, _) in zip(brute_sets, results)
+            ])
+            best_recall = np.mean([
+                best_id in set(found.tolist()) for best_id, (found, _) in zip(best_ids, results)
+            ])
+            self.stdout.write(
+                f'nprobe={nprobe}: recall@{k}={recall:.3f} best-match recall={best_recall:.3f} '
+                f'latency={ann_ms:.2f} ms/query ({brute_ms / ann_ms if ann_ms else 0:.1f}x vs brute force)'
+            )
@@ -2,6 +2,7 @@ import os
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from detection.models import Criminal, DetectionReport, DetectionResult
+from detection.stats import reconcile_stats
 
 class Command(BaseCommand):
     help = 'Clear all data from the database and media files'
@@ -39,6 +40,9 @@ class Command(BaseCommand):
                 self.style.SUCCESS(f'Deleted all detection reports')
             )
 
+            # Reset the dashboard statistics
+            reconcile_stats()
+            
             # Delete all criminals
             Criminal.objects.all().delete()
             self.stdout.write(
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from detection.models import Criminal
+from detection.descriptors import DESCRIPTOR_VERSION, refresh_criminal_descriptor
+from detection.gallery import apply_gallery_changes
+
+class Command(BaseCommand):
+    help = 'Compute face descriptors for criminals that are missing or have stale ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Recompute descriptors for every criminal, not just stale ones',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Number of criminals to load from the database at a time',
+        )
+
+    def handle(self, *args, **options):
+        criminals = Criminal.objects.exclude(photo='')
+        if not options['force']:
+            # Stale when never computed, computed by an older version, or the photo changed
+            criminals = criminals.filter(
+                Q(face_descriptor__isnull=True) |
+                ~Q(descriptor_version=DESCRIPTOR_VERSION) |
+                ~Q(descriptor_photo=F('photo'))
+            )
+
+        total = criminals.count()
+        self.stdout.write(f'Computing descriptors for {total} criminals...')
+
+        updated_count = 0
+        failed_count = 0
+        refreshed_ids = []
+        for criminal in criminals.iterator(chunk_size=options['batch_size']):
+            refresh_criminal_descriptor(criminal, force=True)
+            refreshed_ids.append(criminal.pk)
+            if criminal.face_descriptor is None:
+                failed_count += 1
+                self.stdout.write(
+                    self.style.WARNING(f'Could not compute descriptor for {criminal.name} ({criminal.id})')
+                )
+            else:
+                updated_count += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully computed {updated_count} descriptors ({failed_count} failed)'
+            )
+        )
+
+        # Descriptors are written with queryset updates, which fire no save
+        # signals, so the published gallery is brought up to date here
+        if refreshed_ids:
+            version = apply_gallery_changes(refreshed_ids)
+            self.stdout.write(self.style.SUCCESS(f'Gallery updated to version {version}'))
@@ -0,0 +1,100 @@
+import time
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand
+from detection.models import DetectionReport
+from detection.descriptors import descriptor_from_image, locate_face
+from detection.gallery import get_gallery, load_gallery
+from detection.matching import score_gallery
+from detection.shortlist import SHORTLIST_METHODS, shortlist_rows
+
+class Command(BaseCommand):
+    help = 'Measure how often the two-stage matcher misses the best full-score match'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--methods',
+            default='thumbnail,phash',
+            help='Comma-separated first-stage methods to evaluate',
+        )
+        parser.add_argument(
+            '--sizes',
+            default='10,50,100,500',
+            help='Comma-separated shortlist sizes to evaluate',
+        )
+        parser.add_argument('--queries', type=int, default=100, help='Number of synthetic queries')
+        parser.add_argument(
+            '--from-reports',
+            type=int,
+            default=0,
+            help='Use the faces in this many recent detection reports instead of synthetic queries',
+        )
+
+    def handle(self, *args, **options):
+        gallery = get_gallery() or load_gallery()
+        live_rows = gallery.live_rows()
+        if len(live_rows) == 0:
+            self.stdout.write(self.style.WARNING('The gallery is empty'))
+            return
+
+        if options['from_reports']:
+            queries = self.report_queries(options['from_reports'])
+        else:
+            queries = self.synthetic_queries(gallery, live_rows, options['queries'])
+        if len(queries) == 0:
+            self.stdout.write(self.style.WARNING('No query faces found'))
+            return
+
+        # The reference: best match under the full MSE/SSIM/NCC blend
+        start = time.perf_counter()
+        best_rows = score_gallery(queries, gallery).argmax(axis=1)
+        full_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        self.stdout.write(
+            f'{len(queries)} queries against {len(live_rows)} criminals: '
+            f'{full_ms:.2f} ms/query for full scoring'
+        )
+
+        for method in [value.strip() for value in options['methods'].split(',') if value.strip()]:
+            if method not in SHORTLIST_METHODS or method == 'none':
+                self.stdout.write(self.style.ERROR(f'Unknown method {method}'))
+                continue
+            for size in [int(value) for value in options['sizes'].split(',') if value.strip()]:
+                start = time.perf_counter()
+                shortlists = shortlist_rows(queries, gallery, size, method)
+                first_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+                start = time.perf_counter()
+                for query, rows in zip(queries, shortlists):
+                    score_gallery(query[None, :], gallery.subset(rows))
+                second_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+                misses = sum(best not in set(rows.tolist()) for best, rows in zip(best_rows, shortlists))
+                total_ms = first_ms + second_ms
+                self.stdout.write(
+                    f'{method} top {size}: best match outside shortlist {misses}/{len(queries)} '
+                    f'({misses / len(queries):.1%}), {first_ms:.2f} + {second_ms:.2f} ms/query '
+                    f'({full_ms / total_ms if total_ms else 0:.1f}x vs full scoring)'
+                )
+
+    def synthetic_queries(self, gallery, live_rows, count):
+        """Noisy copies of gallery faces, like a new photo of a known person"""
+        rng = np.random.default_rng(0)
+        rows = rng.choice(live_rows, min(count, len(live_rows)), replace=False)
+        noisy = np.asarray(gallery.matrix[np.sort(rows)]) + rng.normal(0, 0.05, size=(len(rows), gallery.matrix.shape[1]))
+        return np.clip(noisy, 0, 1).astype(np.float32)
+
+    def report_queries(self, count):
+        """The largest face of each of the most recent detection reports"""
+        queries = []
+        for report in DetectionReport.objects.order_by('-created_at')[:count]:
+            try:
+                img = cv2.imread(report.photo.path)
+            except Exception as e:
+                print(f"Error reading report {report.id}: {e}")
+                continue
+            if img is None:
+                continue
+            box = locate_face(img)
+            if box is not None:
+                queries.append(descriptor_from_image(img, box))
+        return np.array(queries, dtype=np.float32)
@@ -0,0 +1,133 @@
+import re
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from detection.models import Criminal, DetectionJob, DetectionReport, DetectionResult
+from detection.gallery import gallery_queryset
+from detection.views import DASHBOARD_REPORTS, FEED_MAX_CHANGES, REPORT_SUMMARY_VALUES
+
+# Plan lines that read a whole table: PostgreSQL "Seq Scan on t", SQLite "SCAN t"
+# (but not "SCAN t USING INDEX ...", which walks an index in order)
+SEQ_SCAN_PATTERNS = (
+    re.compile(r'Seq Scan on (\w+)'),
+    re.compile(r'\bSCAN (\w+)(?! USING)\s*$'),
+)
+SORT_PATTERNS = (
+    re.compile(r'^\W*Sort\b'),
+    re.compile(r'USE TEMP B-TREE FOR ORDER BY'),
+)
+
+
+def hot_queries():
+    """The querysets behind the request paths that run most often, by name"""
+    now = timezone.now()
+    some_id = uuid.uuid4()
+    return {
+        'dashboard latest reports': (
+            DetectionReport.objects.order_by('-created_at', '-id').values(*REPORT_SUMMARY_VALUES)[:DASHBOARD_REPORTS]
+        ),
+        'report page after cursor': (
+            DetectionReport.objects.filter(Q(created_at__lte=now), Q(created_at__lt=now) | Q(id__lt=some_id))
+            .order_by('-created_at', '-id').values(*REPORT_SUMMARY_VALUES)[:DASHBOARD_REPORTS + 1]
+        ),
+        'unprocessed reports': (
+            DetectionReport.objects.filter(is_processed=False).order_by('-created_at', '-id')[:DASHBOARD_REPORTS + 1]
+        ),
+        'reports by review status': (
+            DetectionReport.objects.filter(status__in=[DetectionReport.STATUS_DETECTED])
+            .order_by('-created_at', '-id')[:DASHBOARD_REPORTS + 1]
+        ),
+        'feed changes since cursor': (
+            DetectionReport.objects.filter(change_seq__gt=0).order_by('-change_seq')
+            .values(*REPORT_SUMMARY_VALUES)[:FEED_MAX_CHANGES + 1]
+        ),
+        'report results by confidence': (
+            DetectionResult.objects.filter(report_id=some_id).order_by('-confidence')
+        ),
+        'detections awaiting review': (
+            DetectionResult.objects.filter(is_verified=False).order_by('-detected_at')[:DASHBOARD_REPORTS]
+        ),
+        'verified incorrect detections': (
+            DetectionResult.objects.filter(is_verified=True, is_correct=False).values('id')
+        ),
+        'unknown person placeholder': Criminal.objects.filter(name='Unknown Person'),
+        'criminals changed since index build': (
+            Criminal.objects.filter(updated_at__gt=now).values_list('id', flat=True)
+        ),
+        'gallery criminals': gallery_queryset().values_list('id', flat=True),
+        'oldest pending job': (
+            DetectionJob.objects.filter(status=DetectionJob.STATUS_PENDING).order_by('created_at')[:1]
+        ),
+    }
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot queries against the configured database and flag sequential scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-rows',
+            type=int,
+            default=1000,
+            help='Only flag sequential scans of tables with at least this many rows; '
+                 'planners rightly scan small tables',
+        )
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='Run EXPLAIN ANALYZE on PostgreSQL (executes the queries)',
+        )
+        parser.add_argument('--query', default='', help='Only explain queries whose name contains this text')
+        parser.add_argument('--fail', action='store_true', help='Exit with an error when a scan is flagged')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Explaining hot queries on {connection.vendor} ({connection.settings_dict["NAME"]})')
+        explain_options = {'analyze': True} if options['analyze'] and connection.vendor == 'postgresql' else {}
+        table_rows = {}
+        flagged = []
+
+        for name, queryset in hot_queries().items():
+            if options['query'] and options['query'].lower() not in name.lower():
+                continue
+            plan = queryset.explain(**explain_options)
+            scans = sorted({
+                match.group(1) for line in plan.splitlines() for pattern in SEQ_SCAN_PATTERNS
+                for match in [pattern.search(line)] if match
+            })
+            sorts = any(pattern.search(line) for line in plan.splitlines() for pattern in SORT_PATTERNS)
+
+            problems = []
+            for table in scans:
+                if table not in table_rows:
+                    table_rows[table] = self.count_rows(table)
+                if table_rows[table] >= options['min_rows']:
+                    problems.append(f'sequential scan of {table} ({table_rows[table]} rows)')
+                else:
+                    self.stdout.write(f'  {name}: scans {table}, ignored at {table_rows[table]} rows')
+            if sorts:
+                self.stdout.write(f'  {name}: sorts its result instead of reading an index in order')
+
+            if problems:
+                flagged.append(name)
+                self.stdout.write(self.style.ERROR(f'{name}: {"; ".join(problems)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: uses indexes'))
+            if problems or options['verbosity'] > 1:
+                for line in plan.splitlines():
+                    self.stdout.write(f'    {line}')
+
+        if flagged and options['fail']:
+            raise CommandError(f'{len(flagged)} queries scan whole tables: {", ".join(flagged)}')
+        if not flagged:
+            self.stdout.write(self.style.SUCCESS('No sequential scans of large tables'))
+
+    def count_rows(self, table):
+        """Row count of a table named in a plan, or 0 if it is not one of ours"""
+        known = {model._meta.db_table for model in (Criminal, DetectionJob, DetectionReport, DetectionResult)}
+        if table not in known:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+            return cursor.fetchone()[0]
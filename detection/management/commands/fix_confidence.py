@@ -2,6 +2,7 @@ import os
 import sys
 from django.core.management.base import BaseCommand
 from detection.models import DetectionResult
+from detection.stats import reconcile_stats
 
 class Command(BaseCommand):
     help = 'Fix confidence values that are outside the 0-100 range'
@@ -23,6 +24,10 @@ class Command(BaseCommand):
                 fixed_count += 1
                 self.stdout.write(f"Fixed record {result.id}: {old_confidence} -> {clamped_confidence}")
         
+        if fixed_count:
+            # The confidence sum behind the dashboard accuracy changed
+            reconcile_stats()
+        
         self.stdout.write(
             self.style.SUCCESS(
                 f"Successfully fixed {fixed_count} records with incorrect confidence values"
@@ -73,38 +73,7 @@ class Command(BaseCommand):
     def add_sample_photo(self, criminal):
         """Add a sample photo for the criminal"""
         try:
-            # Create a better quality sample image with a realistic face
-            img = np.ones((300, 300, 3), dtype=np.uint8) * 255  # White background
-            
-            # Draw a more realistic face pattern
-            # Face outline (ellipse)
-            cv2.ellipse(img, (150, 150), (100, 120), 0, 0, 360, (0, 0, 0), 2)
-            
-            # Eyes
-            cv2.ellipse(img, (120, 130), (20, 25), 0, 0, 360, (0, 0, 0), -1)
-            cv2.ellipse(img, (180, 130), (20, 25), 0, 0, 360, (0, 0, 0), -1)
-            cv2.circle(img, (120, 130), 8, (255, 255, 255), -1)
-            cv2.circle(img, (180, 130), 8, (255, 255, 255), -1)
-            
-            # Eyebrows
-            cv2.ellipse(img, (120, 110), (25, 10), 0, 0, 180, (0, 0, 0), 3)
-            cv2.ellipse(img, (180, 110), (25, 10), 0, 0, 180, (0, 0, 0), 3)
-            
-            # Nose
-            cv2.ellipse(img, (150, 150), (15, 20), 0, 0, 360, (0, 0, 0), -1)
-            
-            # Mouth
-            cv2.ellipse(img, (150, 190), (30, 15), 0, 0, 180, (0, 0, 0), 2)
-            
-            # Add some facial features to make it look more realistic
-            # Cheeks
-            cv2.circle(img, (100, 160), 15, (200, 200, 200), -1)
-            cv2.circle(img, (200, 160), 15, (200, 200, 200), -1)
-            
-            # Add text with criminal's name
-            first_name = criminal.name.split()[0]
-            cv2.putText(img, first_name, (20, 40), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+            img = draw_sample_face(criminal.name.split()[0])
             
             # Save the image
             filename = f"{criminal.name.replace(' ', '_').lower()}_{np.random.randint(1000, 9999)}.jpg"
@@ -121,4 +90,52 @@ class Command(BaseCommand):
             criminal.save()
             
         except Exception as e:
-            self.stdout.write(f'Could not add photo for {criminal.name}: {e}')
\ No newline at end of file
+            self.stdout.write(f'Could not add photo for {criminal.name}: {e}')
+
+
+def draw_sample_face(label, rng=None):
+    """
+    Draw a 300x300 synthetic face with label written above it.
+
+    Passing a numpy Generator as rng shifts and resizes the features slightly,
+    so many distinct faces can be drawn (used by benchmark_detection).
+    """
+    def jitter(value, spread):
+        return value if rng is None else int(value + rng.integers(-spread, spread + 1))
+
+    # Create a better quality sample image with a realistic face
+    img = np.ones((300, 300, 3), dtype=np.uint8) * 255  # White background
+    
+    # Draw a more realistic face pattern
+    # Face outline (ellipse)
+    cv2.ellipse(img, (150, 150), (jitter(100, 8), jitter(120, 8)), 0, 0, 360, (0, 0, 0), 2)
+    
+    # Eyes
+    eye_y = jitter(130, 6)
+    eye_gap = jitter(30, 4)
+    eye_size = (jitter(20, 3), jitter(25, 3))
+    cv2.ellipse(img, (150 - eye_gap, eye_y), eye_size, 0, 0, 360, (0, 0, 0), -1)
+    cv2.ellipse(img, (150 + eye_gap, eye_y), eye_size, 0, 0, 360, (0, 0, 0), -1)
+    cv2.circle(img, (150 - eye_gap, eye_y), 8, (255, 255, 255), -1)
+    cv2.circle(img, (150 + eye_gap, eye_y), 8, (255, 255, 255), -1)
+    
+    # Eyebrows
+    cv2.ellipse(img, (150 - eye_gap, eye_y - 20), (25, 10), 0, 0, 180, (0, 0, 0), 3)
+    cv2.ellipse(img, (150 + eye_gap, eye_y - 20), (25, 10), 0, 0, 180, (0, 0, 0), 3)
+    
+    # Nose
+    cv2.ellipse(img, (150, jitter(150, 4)), (jitter(15, 3), jitter(20, 3)), 0, 0, 360, (0, 0, 0), -1)
+    
+    # Mouth
+    cv2.ellipse(img, (150, jitter(190, 6)), (jitter(30, 6), jitter(15, 4)), 0, 0, 180, (0, 0, 0), 2)
+    
+    # Add some facial features to make it look more realistic
+    # Cheeks
+    cheek_shade = jitter(200, 30)
+    cv2.circle(img, (100, 160), 15, (cheek_shade,) * 3, -1)
+    cv2.circle(img, (200, 160), 15, (cheek_shade,) * 3, -1)
+    
+    # Add text with criminal's name
+    cv2.putText(img, label, (20, 40), 
+               cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+    return img
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from detection.gallery import get_gallery, publish_gallery
+
+class Command(BaseCommand):
+    help = 'Publish a new version of the shared memory-mapped criminal gallery'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of descriptors to load from the database at a time',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        version = publish_gallery(batch_size=options['batch_size'])
+        gallery = get_gallery()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Published gallery version {version} with {len(gallery) if gallery else 0} criminals '
+                f'in {time.perf_counter() - start:.2f}s'
+            )
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from detection.stats import STATS_FIELDS, reconcile_stats
+
+class Command(BaseCommand):
+    help = 'Recompute the running dashboard statistics from the report and result tables'
+
+    def handle(self, *args, **options):
+        drift = reconcile_stats()
+        for field in STATS_FIELDS:
+            if drift[field]:
+                self.stdout.write(self.style.WARNING(f'{field} was off by {drift[field]:+g}'))
+
+        if any(drift.values()):
+            self.stdout.write(self.style.SUCCESS('Successfully corrected the detection statistics'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Detection statistics are up to date'))
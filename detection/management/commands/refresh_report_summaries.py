@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from detection.models import DetectionReport
+
+class Command(BaseCommand):
+    help = 'Recompute the dashboard summary of detection reports from their results'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of reports to load from the database at a time',
+        )
+
+    def handle(self, *args, **options):
+        reports = DetectionReport.objects.only('id', 'is_processed', *DetectionReport.SUMMARY_FIELDS)
+        self.stdout.write(f'Refreshing summaries of {reports.count()} reports...')
+
+        changed_count = 0
+        for report in reports.iterator(chunk_size=options['batch_size']):
+            before = [getattr(report, field) for field in DetectionReport.SUMMARY_FIELDS]
+            report.refresh_summary(save=False)
+            if [getattr(report, field) for field in DetectionReport.SUMMARY_FIELDS] != before:
+                report.save(update_fields=DetectionReport.SUMMARY_FIELDS)
+                changed_count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully refreshed {changed_count} out-of-date summaries'))
@@ -0,0 +1,105 @@
+import signal
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from detection.detectors import warm_up
+from detection.jobs import claim_next_job, default_worker_name, requeue_stale_jobs, run_job
+
+class Command(BaseCommand):
+    help = 'Process queued detection jobs (uploads made with DETECTION_ASYNC or async=true)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=2,
+            help='Number of worker threads claiming jobs',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait before checking an empty queue again',
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=3,
+            help='Mark a job failed after this many attempts',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=600,
+            help='Re-queue jobs that have been running for longer than this many seconds',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is empty instead of waiting for new jobs',
+        )
+
+    def handle(self, *args, **options):
+        self.stop_event = threading.Event()
+        self.options = options
+        self.processed_count = 0
+        self.count_lock = threading.Lock()
+
+        # Stop cleanly on Ctrl+C or a SIGTERM from the process manager
+        signal.signal(signal.SIGINT, self.request_stop)
+        signal.signal(signal.SIGTERM, self.request_stop)
+
+        warm_up()
+        requeued, failed = requeue_stale_jobs(options['stale_after'], options['max_attempts'])
+        if requeued or failed:
+            self.stdout.write(f'Re-queued {requeued} stale jobs, failed {failed}')
+
+        concurrency = max(1, options['concurrency'])
+        self.stdout.write(f'Starting {concurrency} detection workers...')
+
+        threads = []
+        for worker_num in range(concurrency):
+            thread = threading.Thread(
+                target=self.work,
+                args=(f'{default_worker_name()}:{worker_num}',),
+                daemon=True,
+            )
+            thread.start()
+            threads.append(thread)
+
+        # Join with a timeout so the main thread keeps receiving signals
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=0.5)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Detection workers stopped after processing {self.processed_count} jobs')
+        )
+
+    def request_stop(self, signum, frame):
+        self.stdout.write('Stopping detection workers after their current job...')
+        self.stop_event.set()
+
+    def work(self, worker_name):
+        """Claim and run jobs until asked to stop"""
+        try:
+            while not self.stop_event.is_set():
+                close_old_connections()
+                job = claim_next_job(worker_name)
+                if job is None:
+                    if self.options['once']:
+                        break
+                    self.stop_event.wait(self.options['poll_interval'])
+                    continue
+
+                start = time.perf_counter()
+                job = run_job(job, max_attempts=self.options['max_attempts'])
+                elapsed = time.perf_counter() - start
+                with self.count_lock:
+                    self.processed_count += 1
+                self.stdout.write(f'[{worker_name}] Report {job.report_id}: {job.status} in {elapsed:.2f}s')
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'[{worker_name}] Worker crashed: {e}'))
+        finally:
+            connection.close()
@@ -0,0 +1,154 @@
+import numpy as np
+from django.conf import settings
+from .ann import ann_enabled, coarse_vectors, get_index
+from .descriptors import DESCRIPTOR_DTYPE, vector_moments
+from .gallery import get_gallery, load_gallery
+from .shortlist import shortlist_rows
+
+
+# SSIM constants of the MSE/SSIM/NCC similarity blend (see score_faces)
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+# Minimum blended score for a criminal to count as a match
+MATCH_THRESHOLD = 5
+
+
+def load_candidate_gallery(face_pixels):
+    """
+    Return the gallery entries worth scoring exactly for these faces.
+
+    This is the published memory-mapped gallery, scored in full for small
+    galleries. With DETECTION_SHORTLIST_METHOD set, only the closest
+    DETECTION_SHORTLIST_SIZE criminals per face under a cheap first-stage
+    comparison are kept. Once the ANN index is in use only the rows of its
+    top candidates for each face, plus criminals changed since the index was
+    built, are copied out for exact rescoring.
+    """
+    from .models import Criminal
+
+    gallery = get_gallery()
+    if gallery is None:
+        # Nothing published yet, read the descriptors from the database
+        gallery = load_gallery()
+
+    index = get_index()
+    if not ann_enabled(index):
+        method = getattr(settings, 'DETECTION_SHORTLIST_METHOD', 'none')
+        size = getattr(settings, 'DETECTION_SHORTLIST_SIZE', 100)
+        if method == 'none' or len(gallery) <= size:
+            return gallery
+        # Cheap first stage over the stored thumbnails or hashes
+        rows = set()
+        for face_rows in shortlist_rows(face_pixels, gallery, size, method):
+            rows.update(face_rows.tolist())
+        return gallery.subset(rows)
+
+    candidates = set()
+    searches = index.search(
+        coarse_vectors(face_pixels),
+        k=getattr(settings, 'DETECTION_ANN_CANDIDATES', 50),
+        nprobe=getattr(settings, 'DETECTION_ANN_NPROBE', 8),
+    )
+    for candidate_ids, _ in searches:
+        candidates.update(candidate_ids.tolist())
+
+    # Criminals added or re-photographed after the build are not in the index yet
+    recent = Criminal.objects.filter(updated_at__gt=index.built_at).values_list('id', flat=True)
+    candidates.update(str(criminal_id) for criminal_id in recent)
+    return gallery.subset(gallery.row_numbers(candidates))
+
+
+def score_gallery(face_pixels, gallery):
+    """
+    Score faces against a Gallery, honouring its live rows and the scoring mode.
+
+    In the default 'fused' DETECTION_SCORING mode the gallery's stored
+    per-entry moments are used, so the gallery matrix is only read once, by
+    the matrix product. 'batched' recomputes them from the matrix on every
+    call, which is the reference the stored moments must agree with.
+    """
+    moments = None
+    if getattr(settings, 'DETECTION_SCORING', 'fused') == 'fused':
+        moments = gallery.moments()
+    return score_faces(face_pixels, gallery.matrix, live=gallery.live, gallery_moments=moments)
+
+
+def score_faces(face_pixels, gallery_matrix, live=None, gallery_moments=None):
+    """
+    Score every face against every gallery entry in a few matrix operations.
+
+    face_pixels is a (faces x pixels) array and gallery_matrix a (criminals x pixels)
+    array. Returns a (faces x criminals) array holding a 0-100 blend of MSE,
+    SSIM and NCC similarity, weighted 0.4/0.4/0.2. Rows where the optional live mask
+    is False score 0 so they can never match. gallery_moments, the
+    (means, variances, squared norms) of the gallery rows, saves computing
+    them here, as a (criminals x 3) array.
+    """
+    probes = np.atleast_2d(np.asarray(face_pixels, dtype=DESCRIPTOR_DTYPE))
+    gallery_matrix = np.atleast_2d(np.asarray(gallery_matrix, dtype=DESCRIPTOR_DTYPE))
+    if probes.shape[0] == 0 or gallery_matrix.shape[0] == 0:
+        return np.zeros((probes.shape[0], gallery_matrix.shape[0]))
+
+    pixel_count = probes.shape[1]
+
+    # Per-vector moments; each probe is read once for its sum and sum of squares
+    probe_mean, probe_var, probe_sq = (moment[:, None] for moment in vector_moments(probes))
+    if gallery_moments is None:
+        gallery_moments = vector_moments(gallery_matrix)
+    else:
+        gallery_moments = np.asarray(gallery_moments).T
+    gallery_mean, gallery_var, gallery_sq = (moment[None, :] for moment in gallery_moments)
+
+    # The only faces x criminals x pixels work is this single matrix product
+    cross = (probes @ gallery_matrix.T).astype(np.float64)
+
+    scores = _blend_scores(cross, pixel_count, probe_mean, probe_var, probe_sq,
+                           gallery_mean, gallery_var, gallery_sq)
+    if live is not None:
+        # Read the mask after scoring so a row removed meanwhile is still dropped
+        scores[:, ~np.asarray(live, dtype=bool)] = 0
+    return scores
+
+
+def _blend_scores(cross, pixel_count, probe_mean, probe_var, probe_sq,
+                  gallery_mean, gallery_var, gallery_sq):
+    """Turn dot products and per-vector moments into the blended 0-100 score"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Method 1: Mean Squared Error expanded as |a|^2 - 2a.b + |b|^2
+        mse = (probe_sq - 2 * cross + gallery_sq) / pixel_count
+
+        # Method 2: SSIM approximation
+        covariance = cross / pixel_count - probe_mean * gallery_mean
+        ssim = ((2 * probe_mean * gallery_mean + SSIM_C1) * (2 * covariance + SSIM_C2)) / \
+               ((probe_mean ** 2 + gallery_mean ** 2 + SSIM_C1) * (probe_var + gallery_var + SSIM_C2))
+
+        # Method 3: Normalized Cross-Correlation
+        ncc = covariance / np.sqrt(probe_var * gallery_var)
+
+    mse_similarity = np.maximum(0, (1 - mse) * 100)
+    ssim_similarity = np.maximum(0, (ssim + 1) * 50)
+    # Flat images have no defined correlation and contribute nothing, as before
+    ncc_similarity = np.where(np.isfinite(ncc), np.maximum(0, (ncc + 1) * 50), 0)
+
+    final_similarity = mse_similarity * 0.4 + ssim_similarity * 0.4 + ncc_similarity * 0.2
+    return np.clip(np.nan_to_num(final_similarity), 0.0, 100.0)
+
+
+def top_matches(scores, k):
+    """Return, for each face row, up to k (column index, score) pairs above MATCH_THRESHOLD, best first"""
+    if scores.shape[1] == 0 or k < 1:
+        return [[] for _ in range(scores.shape[0])]
+
+    k = min(k, scores.shape[1])
+    # Partition out the k best columns per row, then sort only those
+    columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, columns, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    columns = np.take_along_axis(columns, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    return [
+        [(int(column), float(score)) for column, score in zip(row_columns, row_scores) if score > MATCH_THRESHOLD]
+        for row_columns, row_scores in zip(columns, top_scores)
+    ]
+
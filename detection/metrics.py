@@ -0,0 +1,334 @@
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from django.conf import settings
+from .profiling import current_timings, start_timings, stop_timings
+
+try:
+    import fcntl
+except ImportError:
+    # Windows development machines: archiving is not serialized across processes
+    fcntl = None
+
+
+# Each process keeps its own counters and histograms in memory and writes
+# them to metrics-<pid>.json in DETECTION_METRICS_DIR at most once per
+# DETECTION_METRICS_FLUSH_INTERVAL seconds. The metrics endpoint sums every
+# file, so all gunicorn workers are reported together. Files of processes
+# that have exited are folded into metrics-archive.json, so counters keep
+# growing across worker restarts.
+ARCHIVE_FILENAME = 'metrics-archive.json'
+LOCK_FILENAME = 'metrics.lock'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FACE_BUCKETS = (0, 1, 2, 3, 5, 10, 20)
+
+HELP = {
+    'detection_requests_total': ('counter', 'Requests handled, by view and HTTP status'),
+    'detection_request_seconds': ('histogram', 'Request latency by view'),
+    'detection_stage_seconds': ('histogram', 'Wall time of each detection pipeline stage'),
+    'detection_faces_per_image': ('histogram', 'Faces found in each processed image'),
+    'detection_quality_rejections_total': ('counter', 'Uploads turned away by the quality gate, by reason'),
+    'detection_jobs_total': ('counter', 'Background detection jobs finished, by status'),
+    'detection_bulk_import_rows_total': ('counter', 'Criminal CSV rows imported or rejected by bulk upload'),
+    'detection_gallery_size': ('gauge', 'Criminals in the published gallery'),
+    'detection_gallery_version': ('gauge', 'Version of the published gallery'),
+    'detection_queue_depth': ('gauge', 'Detection jobs waiting for a worker'),
+}
+
+_lock = threading.Lock()
+_state = {'counters': {}, 'histograms': {}, 'flushed_at': 0.0, 'claimed_pid': None}
+
+
+def metrics_enabled():
+    return getattr(settings, 'DETECTION_METRICS', True)
+
+
+def metrics_dir():
+    return settings.DETECTION_METRICS_DIR
+
+
+def _key(name, labels):
+    """Series key: metric name plus its labels in Prometheus syntax"""
+    label_text = ','.join(f'{label}="{value}"' for label, value in sorted(labels.items()))
+    return f'{name}|{label_text}'
+
+
+def increment(name, amount=1, **labels):
+    """Add amount to a counter"""
+    if not metrics_enabled():
+        return
+    key = _key(name, labels)
+    with _lock:
+        _state['counters'][key] = _state['counters'].get(key, 0) + amount
+    _maybe_flush()
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """Record one observation in a histogram"""
+    if not metrics_enabled():
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _state['histograms'].get(key)
+        if histogram is None:
+            histogram = _state['histograms'][key] = {
+                'le': list(buckets),
+                'counts': [0] * len(buckets),
+                'sum': 0.0,
+                'count': 0,
+            }
+        for position, bound in enumerate(histogram['le']):
+            if value <= bound:
+                histogram['counts'][position] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+    _maybe_flush()
+
+
+def observe_stages(timings):
+    """Record every stage of a StageTimings collector"""
+    for stage, (wall_ms, _) in timings.stages.items():
+        observe('detection_stage_seconds', wall_ms / 1000, stage=stage)
+
+
+def observe_faces(count):
+    observe('detection_faces_per_image', count, buckets=FACE_BUCKETS)
+
+
+def tracked_view(name):
+    """
+    Count requests to a view and record its latency and stage timings.
+
+    Stages are collected into the timings already being gathered for the
+    request (see profiling.timed_view) or into a collector started here.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not metrics_enabled():
+                return view(request, *args, **kwargs)
+
+            view_name = name(request) if callable(name) else name
+            timings = current_timings()
+            owned = timings is None
+            if owned:
+                timings = start_timings()
+            start = time.perf_counter()
+            status = 500
+            try:
+                response = view(request, *args, **kwargs)
+                status = response.status_code
+                return response
+            finally:
+                if owned:
+                    stop_timings()
+                increment('detection_requests_total', view=view_name, status=status)
+                observe('detection_request_seconds', time.perf_counter() - start, view=view_name)
+                observe_stages(timings)
+        return wrapper
+    return decorator
+
+
+def _process_path(pid=None):
+    return os.path.join(metrics_dir(), f'metrics-{pid or os.getpid()}.json')
+
+
+@contextmanager
+def _archive_lock():
+    """Serialize reading and archiving the metric files across processes"""
+    os.makedirs(metrics_dir(), exist_ok=True)
+    with open(os.path.join(metrics_dir(), LOCK_FILENAME), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def claim_process_file():
+    """
+    Archive the metrics file an exited process left under this process's pid.
+
+    Pids are reused, so without this a new worker's first flush would
+    overwrite the counters of a dead one that collect() had not archived yet.
+    Runs once per process, before its first flush; gunicorn workers call it
+    when they start.
+    """
+    pid = os.getpid()
+    if _state.get('claimed_pid') == pid:
+        return
+    _state['claimed_pid'] = pid
+    path = _process_path(pid)
+    if not os.path.exists(path):
+        return
+    with _archive_lock():
+        data = _read_json(path)
+        if data is not None:
+            archive_path = os.path.join(metrics_dir(), ARCHIVE_FILENAME)
+            archive = _read_json(archive_path) or {'counters': {}, 'histograms': {}}
+            _merge(archive, data)
+            _write_json(archive_path, archive)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def _write_json(path, data):
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
+def _maybe_flush():
+    if time.monotonic() - _state['flushed_at'] >= getattr(settings, 'DETECTION_METRICS_FLUSH_INTERVAL', 1.0):
+        flush()
+
+
+def flush():
+    """Write this process's metrics to its file in the metrics directory"""
+    with _lock:
+        _state['flushed_at'] = time.monotonic()
+        snapshot = {'counters': dict(_state['counters']), 'histograms': {
+            key: dict(histogram, counts=list(histogram['counts']))
+            for key, histogram in _state['histograms'].items()
+        }}
+    if not snapshot['counters'] and not snapshot['histograms']:
+        return
+    try:
+        claim_process_file()
+        os.makedirs(metrics_dir(), exist_ok=True)
+        _write_json(_process_path(), snapshot)
+    except Exception as e:
+        print(f"Error writing metrics: {e}")
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        if metrics_enabled():
+            flush()
+    except Exception:
+        pass
+
+
+def _merge(total, data):
+    for key, value in data.get('counters', {}).items():
+        total['counters'][key] = total['counters'].get(key, 0) + value
+    for key, histogram in data.get('histograms', {}).items():
+        merged = total['histograms'].get(key)
+        if merged is None or merged['le'] != histogram['le']:
+            total['histograms'][key] = dict(histogram, counts=list(histogram['counts']))
+            continue
+        merged['counts'] = [a + b for a, b in zip(merged['counts'], histogram['counts'])]
+        merged['sum'] += histogram['sum']
+        merged['count'] += histogram['count']
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect():
+    """
+    Sum the metrics of every process, archiving the files of exited ones.
+
+    Returns {'counters': {...}, 'histograms': {...}} keyed like the in-memory state.
+    """
+    flush()
+    with _archive_lock():
+        archive_path = os.path.join(metrics_dir(), ARCHIVE_FILENAME)
+        archive = _read_json(archive_path) or {'counters': {}, 'histograms': {}}
+        total = {'counters': {}, 'histograms': {}}
+        _merge(total, archive)
+
+        archived = False
+        for filename in os.listdir(metrics_dir()):
+            if not (filename.startswith('metrics-') and filename.endswith('.json')) or filename == ARCHIVE_FILENAME:
+                continue
+            try:
+                pid = int(filename[len('metrics-'):-len('.json')])
+            except ValueError:
+                continue
+            data = _read_json(os.path.join(metrics_dir(), filename))
+            if data is None:
+                continue
+            _merge(total, data)
+            if not _pid_alive(pid):
+                # The worker is gone: its final numbers move into the archive
+                _merge(archive, data)
+                os.unlink(os.path.join(metrics_dir(), filename))
+                archived = True
+        if archived:
+            _write_json(archive_path, archive)
+    return total
+
+
+def gauges():
+    """Current values computed at scrape time"""
+    from .gallery import get_gallery
+    from .jobs import queue_depth
+
+    values = {}
+    gallery = get_gallery()
+    if gallery is not None:
+        values['detection_gallery_size|'] = len(gallery.live_rows())
+        values['detection_gallery_version|'] = gallery.version
+    try:
+        values['detection_queue_depth|'] = queue_depth()
+    except Exception as e:
+        print(f"Error reading queue depth: {e}")
+    return values
+
+
+def _series(key, suffix='', extra=''):
+    name, labels = key.split('|', 1)
+    labels = ','.join(part for part in (labels, extra) if part)
+    return f'{name}{suffix}{{{labels}}}' if labels else f'{name}{suffix}'
+
+
+def render_prometheus(data, gauge_values):
+    """Format collected metrics in the Prometheus text exposition format"""
+    series = {}
+    for key, value in sorted(data['counters'].items()):
+        series.setdefault(key.split('|', 1)[0], []).append(f'{_series(key)} {value}')
+    for key, value in sorted(gauge_values.items()):
+        series.setdefault(key.split('|', 1)[0], []).append(f'{_series(key)} {value}')
+    for key, histogram in sorted(data['histograms'].items()):
+        lines = series.setdefault(key.split('|', 1)[0], [])
+        # Counts were recorded per bucket already cumulatively
+        for bound, count in zip(histogram['le'] + ['+Inf'], histogram['counts'] + [histogram['count']]):
+            bucket_label = 'le="%s"' % bound
+            lines.append(f"{_series(key, '_bucket', bucket_label)} {count}")
+        lines.append(f'{_series(key, "_sum")} {histogram["sum"]}')
+        lines.append(f'{_series(key, "_count")} {histogram["count"]}')
+
+    output = []
+    for name in sorted(series):
+        metric_type, help_text = HELP.get(name, ('untyped', ''))
+        output.append(f'# HELP {name} {help_text}')
+        output.append(f'# TYPE {name} {metric_type}')
+        output.extend(series[name])
+    return '\n'.join(output) + '\n'
@@ -0,0 +1,58 @@
+import asyncio
+import time
+from functools import wraps
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware as DjangoSessionMiddleware
+from django.utils.cache import patch_vary_headers
+
+
+# Session key holding when the session was last saved, in epoch seconds
+SAVED_AT_KEY = '_saved_at'
+
+
+def read_only_session(view):
+    """
+    Mark a polled view as not needing SESSION_SAVE_EVERY_REQUEST.
+
+    SessionMiddleware below then leaves an unmodified session alone, except
+    to renew its expiry once half of SESSION_COOKIE_AGE has passed.
+    """
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            request.read_only_session = True
+            return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.read_only_session = True
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+class SessionMiddleware(DjangoSessionMiddleware):
+    """
+    Django's session middleware, without the session write on every poll.
+
+    With SESSION_SAVE_EVERY_REQUEST each dashboard refresh would update the
+    session row. Views decorated with read_only_session skip that save while
+    the session was saved recently; other requests save as before and note
+    when they did.
+    """
+
+    def process_response(self, request, response):
+        session = getattr(request, 'session', None)
+        if session is None or session.is_empty():
+            return super().process_response(request, response)
+
+        if getattr(request, 'read_only_session', False) and not session.modified:
+            saved_at = session.get(SAVED_AT_KEY, 0)
+            if time.time() - saved_at < settings.SESSION_COOKIE_AGE / 2:
+                if session.accessed:
+                    patch_vary_headers(response, ('Cookie',))
+                return response
+
+        if session.modified or settings.SESSION_SAVE_EVERY_REQUEST:
+            session[SAVED_AT_KEY] = int(time.time())
+        return super().process_response(request, response)
@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-17 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0003_detectionresult_is_correct_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='criminal',
+            name='descriptor_photo',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='criminal',
+            name='descriptor_version',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='criminal',
+            name='face_descriptor',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.1 on 2026-10-17 18:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_report_summaries(apps, schema_editor):
+    """Summarize the results of existing reports, as DetectionReport.refresh_summary does"""
+    DetectionReport = apps.get_model('detection', 'DetectionReport')
+    DetectionResult = apps.get_model('detection', 'DetectionResult')
+    for report in DetectionReport.objects.iterator(chunk_size=500):
+        results = list(
+            DetectionResult.objects.filter(report=report).order_by('detected_at', 'id')
+            .values_list('id', 'criminal__name', 'confidence', 'is_verified')
+        )
+        report.detection_count = len(results)
+        if results:
+            top = max(results, key=lambda row: row[2])
+            report.top_criminal_name = top[1]
+            report.top_confidence = max(0.0, min(100.0, float(top[2])))
+            report.first_detection_id = results[0][0]
+        if not report.is_processed:
+            report.status = 'pending'
+        elif not results:
+            report.status = 'no_match'
+        elif all(row[3] for row in results):
+            report.status = 'verified'
+        else:
+            report.status = 'detected'
+        report.save(update_fields=['detection_count', 'top_criminal_name', 'top_confidence', 'first_detection_id', 'status'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0005_detectionjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionreport',
+            name='detection_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='detectionreport',
+            name='first_detection_id',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='detectionreport',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('no_match', 'No Match'), ('detected', 'Criminal Detected'), ('verified', 'Verified')], default='pending', editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='detectionreport',
+            name='top_confidence',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='detectionreport',
+            name='top_criminal_name',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='detectionreport',
+            index=models.Index(fields=['-created_at'], name='detection_report_recent_idx'),
+        ),
+        migrations.RunPython(fill_report_summaries, migrations.RunPython.noop),
+    ]
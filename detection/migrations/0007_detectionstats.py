@@ -0,0 +1,50 @@
+# Generated by Django 5.1 on 2026-10-17 18:46
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def count_existing_stats(apps, schema_editor):
+    """Start the running totals from the reports and results already stored"""
+    DetectionReport = apps.get_model('detection', 'DetectionReport')
+    DetectionResult = apps.get_model('detection', 'DetectionResult')
+    DetectionStats = apps.get_model('detection', 'DetectionStats')
+    reports = DetectionReport.objects.aggregate(
+        total_reports=Count('id'),
+        pending_review=Count('id', filter=Q(is_processed=False)),
+    )
+    results = DetectionResult.objects.aggregate(
+        total_detections=Count('id'),
+        verified_correct=Count('id', filter=Q(is_verified=True, is_correct=True)),
+        verified_incorrect=Count('id', filter=Q(is_verified=True, is_correct=False)),
+        confidence_sum=Sum('confidence'),
+    )
+    results['confidence_sum'] = results['confidence_sum'] or 0.0
+    DetectionStats.objects.update_or_create(pk=1, defaults={**reports, **results})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0006_detectionreport_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectionStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_reports', models.IntegerField(default=0)),
+                ('total_detections', models.IntegerField(default=0)),
+                ('pending_review', models.IntegerField(default=0)),
+                ('verified_correct', models.IntegerField(default=0)),
+                ('verified_incorrect', models.IntegerField(default=0)),
+                ('confidence_sum', models.FloatField(default=0.0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'detection stats',
+            },
+        ),
+        migrations.RunPython(count_existing_stats, migrations.RunPython.noop),
+    ]
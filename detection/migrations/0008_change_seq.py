@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-17 18:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0007_detectionstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionreport',
+            name='change_seq',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='detectionstats',
+            name='change_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1 on 2026-10-17 18:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0008_change_seq'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='detectionreport',
+            name='detection_report_recent_idx',
+        ),
+        migrations.AddIndex(
+            model_name='detectionreport',
+            index=models.Index(fields=['-created_at', '-id'], name='detection_report_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionreport',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='detection_report_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionreport',
+            index=models.Index(fields=['is_processed', '-created_at', '-id'], name='detection_report_processed_idx'),
+        ),
+    ]
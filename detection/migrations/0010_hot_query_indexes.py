@@ -0,0 +1,39 @@
+# Generated by Django 5.1 on 2026-10-17 18:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0009_report_listing_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='criminal',
+            index=models.Index(fields=['name'], name='criminal_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='criminal',
+            index=models.Index(fields=['updated_at'], name='criminal_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='criminal',
+            index=models.Index(condition=models.Q(('face_descriptor__isnull', False), ('is_wanted', True)), fields=['descriptor_version'], name='criminal_gallery_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionresult',
+            index=models.Index(fields=['report', '-confidence'], name='detection_result_report_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionresult',
+            index=models.Index(condition=models.Q(('is_verified', False)), fields=['-detected_at'], name='detection_result_review_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='detectionresult',
+            index=models.Index(fields=['is_verified', 'is_correct'], name='detection_result_verify_idx'),
+        ),
+    ]
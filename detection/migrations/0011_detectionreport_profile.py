@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-17 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0010_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionreport',
+            name='cascades_run',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='detectionreport',
+            name='detection_profile',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+    ]
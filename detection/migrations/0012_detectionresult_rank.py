@@ -0,0 +1,72 @@
+# Generated by Django 5.1 on 2026-10-17 19:22
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def rank_existing_results(apps, schema_editor):
+    """
+    Rank the stored candidates of each face, best first, then recount what
+    only the best candidates should count: the summaries of reports that held
+    alternatives, and the running totals.
+    """
+    DetectionReport = apps.get_model('detection', 'DetectionReport')
+    DetectionResult = apps.get_model('detection', 'DetectionResult')
+    DetectionStats = apps.get_model('detection', 'DetectionStats')
+
+    alternatives = []
+    face, rank = None, 0
+    results = DetectionResult.objects.order_by('report_id', 'face_coordinates', '-confidence', 'detected_at', 'id')
+    for result_id, report_id, face_coordinates in results.values_list('id', 'report_id', 'face_coordinates').iterator(chunk_size=2000):
+        # Candidates of one face share its report and coordinates
+        rank = rank + 1 if (report_id, face_coordinates) == face else 1
+        face = (report_id, face_coordinates)
+        if rank > 1:
+            alternatives.append((result_id, report_id, rank))
+
+    # Written after the read, as SQLite gives no isolation within one connection
+    reranked = set()
+    for result_id, report_id, rank in alternatives:
+        DetectionResult.objects.filter(pk=result_id).update(rank=rank)
+        reranked.add(report_id)
+
+    for report in DetectionReport.objects.filter(id__in=reranked):
+        # As DetectionReport.refresh_summary does
+        rows = list(
+            DetectionResult.objects.filter(report=report, rank=1).order_by('-confidence', 'detected_at', 'id')
+            .values_list('id', 'criminal__name', 'confidence', 'is_verified')
+        )
+        report.detection_count = len(rows)
+        if rows:
+            report.top_criminal_name = rows[0][1]
+            report.top_confidence = max(0.0, min(100.0, float(rows[0][2])))
+            report.first_detection_id = rows[0][0]
+        if report.is_processed and rows:
+            report.status = 'verified' if all(row[3] for row in rows) else 'detected'
+        report.save(update_fields=['detection_count', 'top_criminal_name', 'top_confidence', 'first_detection_id', 'status'])
+
+    if reranked:
+        totals = DetectionResult.objects.filter(rank=1).aggregate(
+            total_detections=Count('id'),
+            verified_correct=Count('id', filter=Q(is_verified=True, is_correct=True)),
+            verified_incorrect=Count('id', filter=Q(is_verified=True, is_correct=False)),
+            confidence_sum=Sum('confidence'),
+        )
+        totals['confidence_sum'] = totals['confidence_sum'] or 0.0
+        DetectionStats.objects.filter(pk=1).update(**totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0011_detectionreport_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionresult',
+            name='rank',
+            field=models.PositiveSmallIntegerField(default=1, editable=False),
+        ),
+        migrations.RunPython(rank_existing_results, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-17 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('detection', '0012_detectionresult_rank'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionreport',
+            name='rejection_reason',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+    ]
@@ -12,6 +12,26 @@ class Criminal(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Precomputed face descriptor (see detection/descriptors.py) so matching
+    # never has to reopen criminal photos
+    face_descriptor = models.BinaryField(null=True, blank=True, editable=False)
+    descriptor_version = models.PositiveSmallIntegerField(default=0, editable=False)
+    descriptor_photo = models.CharField(max_length=255, blank=True, editable=False)  # Photo the descriptor was computed from
+    
+    class Meta:
+        indexes = [
+            # get_or_create of the "Unknown Person" placeholder on every unmatched face
+            models.Index(fields=['name'], name='criminal_name_idx'),
+            # Criminals changed since the ANN index was built, looked up on every match
+            models.Index(fields=['updated_at'], name='criminal_updated_idx'),
+            # Gallery loads: wanted criminals with a descriptor (see gallery.gallery_queryset)
+            models.Index(
+                fields=['descriptor_version'],
+                condition=models.Q(is_wanted=True, face_descriptor__isnull=False),
+                name='criminal_gallery_idx',
+            ),
+        ]
+    
     def __str__(self):
         return self.name
 
@@ -24,8 +44,75 @@ class DetectionReport(models.Model):
     is_processed = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    STATUS_PENDING = 'pending'
+    STATUS_NO_MATCH = 'no_match'
+    STATUS_DETECTED = 'detected'
+    STATUS_VERIFIED = 'verified'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_NO_MATCH, 'No Match'),
+        (STATUS_DETECTED, 'Criminal Detected'),
+        (STATUS_VERIFIED, 'Verified'),
+    ]
+    SUMMARY_FIELDS = ['detection_count', 'top_criminal_name', 'top_confidence', 'first_detection_id', 'status']
+    
+    # Summary of the report's results, kept up to date by refresh_summary() so
+    # the police dashboard can list reports without querying DetectionResult
+    detection_count = models.PositiveIntegerField(default=0, editable=False)
+    top_criminal_name = models.CharField(max_length=100, blank=True, editable=False)
+    top_confidence = models.FloatField(null=True, blank=True, editable=False)
+    first_detection_id = models.UUIDField(null=True, blank=True, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, editable=False)
+    # Sequence number of the last change, the cursor of the dashboard feed (see stats.record_report_change)
+    change_seq = models.BigIntegerField(default=0, db_index=True, editable=False)
+    # Detection profile the report was processed with and the cascades that actually ran (comma-separated)
+    detection_profile = models.CharField(max_length=20, blank=True, editable=False)
+    cascades_run = models.CharField(max_length=100, blank=True, editable=False)
+    # Quality gate reason code when the photo was rejected before matching (see quality.py)
+    rejection_reason = models.CharField(max_length=20, blank=True, editable=False)
+    
+    class Meta:
+        indexes = [
+            # Report listings are keyset-paginated newest first on (created_at, id),
+            # optionally filtered by review status or processed state
+            models.Index(fields=['-created_at', '-id'], name='detection_report_recent_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='detection_report_status_idx'),
+            models.Index(fields=['is_processed', '-created_at', '-id'], name='detection_report_processed_idx'),
+        ]
+    
     def __str__(self):
         return f"Report {self.id} - {self.detection_time}"
+    
+    def refresh_summary(self, save=True):
+        """Recompute the summary fields from this report's results"""
+        # Best match first: only the best candidate of each face counts as a
+        # detection, and first_detection_id is the one the dashboard offers for review
+        results = list(
+            self.results.filter(rank=1).order_by('-confidence', 'detected_at', 'id')
+            .values_list('id', 'criminal__name', 'confidence', 'is_verified')
+        )
+        self.detection_count = len(results)
+        if results:
+            top = max(results, key=lambda row: row[2])
+            self.top_criminal_name = top[1]
+            self.top_confidence = max(0.0, min(100.0, float(top[2])))
+            self.first_detection_id = results[0][0]
+        else:
+            self.top_criminal_name = ''
+            self.top_confidence = None
+            self.first_detection_id = None
+        
+        if not self.is_processed:
+            self.status = self.STATUS_PENDING
+        elif not results:
+            self.status = self.STATUS_NO_MATCH
+        elif all(row[3] for row in results):
+            self.status = self.STATUS_VERIFIED
+        else:
+            self.status = self.STATUS_DETECTED
+        
+        if save:
+            self.save(update_fields=self.SUMMARY_FIELDS)
 
 class DetectionResult(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -33,6 +120,9 @@ class DetectionResult(models.Model):
     criminal = models.ForeignKey(Criminal, on_delete=models.CASCADE)
     confidence = models.FloatField()
     face_coordinates = models.TextField()  # Store face bounding box coordinates as JSON string
+    # 1 for the best candidate of a face, the detection that is counted and
+    # reviewed; higher ranks are alternatives kept for the police to compare
+    rank = models.PositiveSmallIntegerField(default=1, editable=False)
     detected_at = models.DateTimeField(auto_now_add=True)
     
     # Verification fields for accuracy tracking
@@ -42,5 +132,74 @@ class DetectionResult(models.Model):
     verification_notes = models.TextField(blank=True)
     verified_at = models.DateTimeField(null=True, blank=True)
     
+    class Meta:
+        indexes = [
+            # A report's results, best match first
+            models.Index(fields=['report', '-confidence'], name='detection_result_report_idx'),
+            # Detections awaiting police review, newest first
+            models.Index(
+                fields=['-detected_at'],
+                condition=models.Q(is_verified=False),
+                name='detection_result_review_idx',
+            ),
+            # Verified correct/incorrect counts (see stats.count_stats)
+            models.Index(fields=['is_verified', 'is_correct'], name='detection_result_verify_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Detection of {self.criminal.name} in report {self.report}"
+
+class DetectionJob(models.Model):
+    """Queued face detection for a report, processed by run_detection_workers"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    report = models.OneToOneField(DetectionReport, on_delete=models.CASCADE, related_name='job')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)  # Worker that claimed the job
+    result = models.TextField(blank=True)  # Detection results as a JSON string
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # Workers claim the oldest pending job first
+            models.Index(fields=['status', 'created_at'], name='detection_job_queue_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Job for report {self.report_id} ({self.status})"
+
+class DetectionStats(models.Model):
+    """
+    Running totals behind the dashboard statistics, kept in a single row.
+    
+    Updated alongside the writes they count (see detection/stats.py) so
+    reading them never scans reports or results.
+    """
+    total_reports = models.IntegerField(default=0)
+    total_detections = models.IntegerField(default=0)
+    pending_review = models.IntegerField(default=0)  # Reports not processed yet
+    verified_correct = models.IntegerField(default=0)
+    verified_incorrect = models.IntegerField(default=0)
+    confidence_sum = models.FloatField(default=0.0)  # Sum of all detection confidences
+    change_seq = models.BigIntegerField(default=0)  # Advanced by every recorded change
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'detection stats'
+    
     def __str__(self):
-        return f"Detection of {self.criminal.name} in report {self.report}"
\ No newline at end of file
+        return f"{self.total_reports} reports, {self.total_detections} detections"
@@ -0,0 +1,124 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from .models import DetectionReport
+
+logger = logging.getLogger(__name__)
+
+
+# Uploads are decoded in memory for detection, so the original photo is only
+# needed later, for review. The report row is created with the photo's final
+# name, and with DETECTION_DEFER_PHOTO_WRITE the bytes are written to media
+# storage by one background thread per process while detection runs. Pending
+# writes are finished when the process exits normally.
+_writer = None
+_writer_lock = threading.Lock()
+
+# Uploads are read this much at a time, so an oversized body is rejected
+# before it is buffered
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+def max_upload_bytes():
+    return getattr(settings, 'DETECTION_MAX_UPLOAD_BYTES', 16 * 1024 * 1024)
+
+
+def read_upload(chunks, length=None):
+    """
+    Join the chunks of an uploaded image into one bytes object.
+
+    length is the size announced by the client, if any. Raises UploadTooLarge
+    as soon as the announced or received size passes DETECTION_MAX_UPLOAD_BYTES.
+    """
+    limit = max_upload_bytes()
+    if length is not None and length > limit:
+        raise UploadTooLarge(f'Image is larger than {limit} bytes')
+    received = []
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        if size > limit:
+            raise UploadTooLarge(f'Image is larger than {limit} bytes')
+        received.append(chunk)
+    return b''.join(received)
+
+
+def read_request_image(request):
+    """Read a raw image/* request body in chunks"""
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0) or None
+    except ValueError:
+        length = None
+    return read_upload(iter(lambda: request.read(UPLOAD_CHUNK_SIZE), b''), length)
+
+
+def read_uploaded_file(uploaded_file):
+    """Read a multipart file part (e.g. a Blob) in chunks"""
+    return read_upload(uploaded_file.chunks(UPLOAD_CHUNK_SIZE), uploaded_file.size)
+
+
+def defer_photo_write_enabled():
+    return getattr(settings, 'DETECTION_DEFER_PHOTO_WRITE', True)
+
+
+def assign_report_photo(report):
+    """Give an unsaved report the storage name its photo will be written under"""
+    report.photo.name = report.photo.field.generate_filename(report, f'report_{report.id}.jpg')
+
+
+def write_report_photo(report_id, name, data):
+    """
+    Write photo bytes under name, recording the name storage actually used.
+
+    When the write fails the report's photo is cleared, so it does not point
+    reviewers at a file that was never written, and None is returned.
+    """
+    try:
+        stored_name = DetectionReport._meta.get_field('photo').storage.save(name, ContentFile(data))
+        if stored_name != name:
+            # Storage picked another name because one was taken
+            DetectionReport.objects.filter(pk=report_id).update(photo=stored_name)
+        return stored_name
+    except Exception:
+        logger.exception("Error saving photo of report %s", report_id)
+        DetectionReport.objects.filter(pk=report_id).update(photo='')
+        return None
+
+
+def _write_in_background(report_id, name, data):
+    try:
+        return write_report_photo(report_id, name, data)
+    finally:
+        # The writer thread outlives requests, so it tidies up its own connection
+        close_old_connections()
+
+
+def _writer_pool():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='report-photos')
+        return _writer
+
+
+def store_report_photo(report, data, defer=None):
+    """
+    Save the photo bytes of a report created with assign_report_photo.
+
+    Returns a Future when the write was handed to the background thread, or
+    None once it has been written here. Pass defer=False when something reads
+    the file right away, such as a detection worker.
+    """
+    if defer is None:
+        defer = defer_photo_write_enabled()
+    if defer:
+        return _writer_pool().submit(_write_in_background, report.id, report.photo.name, data)
+    report.photo.name = write_report_photo(report.id, report.photo.name, data) or ''
+    return None
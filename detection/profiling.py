@@ -0,0 +1,119 @@
+import json
+import threading
+import time
+from functools import wraps
+from django.conf import settings
+
+
+# Stage timings are collected per thread, and only while a collector is
+# active; otherwise lap() is a single attribute lookup.
+_local = threading.local()
+
+
+class StageTimings:
+    """Wall-clock and CPU time spent in each named stage of one request"""
+
+    def __init__(self):
+        self.stages = {}
+        self._last = None
+
+    def restart(self):
+        """Start timing the next stage from now"""
+        self._last = (time.perf_counter(), time.thread_time())
+
+    def lap(self, name):
+        """Charge the time since the previous lap (or restart) to stage name"""
+        now = (time.perf_counter(), time.thread_time())
+        if self._last is not None:
+            self.add(name, now[0] - self._last[0], now[1] - self._last[1])
+        self._last = now
+
+    def add(self, name, wall_seconds, cpu_seconds):
+        wall_ms, cpu_ms = self.stages.get(name, (0.0, 0.0))
+        self.stages[name] = (wall_ms + wall_seconds * 1000, cpu_ms + cpu_seconds * 1000)
+
+    def as_dict(self):
+        """Return {stage: {'wall_ms': ..., 'cpu_ms': ...}} rounded for display"""
+        return {
+            name: {'wall_ms': round(wall_ms, 3), 'cpu_ms': round(cpu_ms, 3)}
+            for name, (wall_ms, cpu_ms) in self.stages.items()
+        }
+
+
+def start_timings():
+    """Start collecting stage timings in this thread and return the collector"""
+    _local.timings = StageTimings()
+    _local.timings.restart()
+    return _local.timings
+
+
+def stop_timings():
+    """Stop collecting in this thread and return what was collected, or None"""
+    timings = getattr(_local, 'timings', None)
+    _local.timings = None
+    return timings
+
+
+def current_timings():
+    """Return the collector active in this thread, or None"""
+    return getattr(_local, 'timings', None)
+
+
+def restart_stage_clock():
+    """Start timing the next stage from now, e.g. at the top of a function"""
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings.restart()
+
+
+def lap(name):
+    """Record the time since the previous lap as stage name, if collecting"""
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings.lap(name)
+
+
+def timings_enabled():
+    return getattr(settings, 'DETECTION_TIMINGS', False)
+
+
+def server_timing_header(timings):
+    """Format timings as a Server-Timing header value, with CPU time in the description"""
+    return ', '.join(
+        f'{name};dur={wall_ms:.1f};desc="cpu {cpu_ms:.1f}ms"'
+        for name, (wall_ms, cpu_ms) in timings.stages.items()
+    )
+
+
+def timed_view(view):
+    """
+    Time the stages of a view when DETECTION_TIMINGS is on.
+
+    The stages go into a Server-Timing header, and into a 'timings' block of
+    the JSON response when the request asks for it with timings=true. When the
+    setting is off the view is called directly.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not timings_enabled():
+            return view(request, *args, **kwargs)
+
+        timings = start_timings()
+        start = (time.perf_counter(), time.thread_time())
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            stop_timings()
+        timings.add('total', time.perf_counter() - start[0], time.thread_time() - start[1])
+
+        response['Server-Timing'] = server_timing_header(timings)
+        requested = request.POST.get('timings', request.GET.get('timings', ''))
+        if requested.lower() in ('true', '1') and response.get('Content-Type') == 'application/json':
+            try:
+                data = json.loads(response.content)
+                data['timings'] = timings.as_dict()
+                response.content = json.dumps(data)
+            except ValueError as e:
+                print(f"Error adding timings to response: {e}")
+        return response
+    return wrapper
@@ -0,0 +1,66 @@
+import cv2
+import numpy as np
+from django.conf import settings
+from .metrics import increment
+
+
+# Frames that can never match (blurred, too dark, blown out, or with only
+# tiny faces) are rejected before the cascades or the gallery scan run.
+# The image checks look at a gray copy shrunk to QUALITY_SIZE on its long
+# edge, so they cost a few milliseconds whatever the upload's resolution.
+# Rejections carry a reason code the camera page uses to ask for a retake.
+QUALITY_SIZE = 512
+# Share of pixels crushed to black (< 16) or clipped to white (>= 240) that
+# rejects a frame even when its mean brightness is acceptable
+CLIPPED_SHARE = 0.5
+
+REJECTION_MESSAGES = {
+    'too_dark': 'The photo is too dark. Please retake it with more light.',
+    'overexposed': 'The photo is overexposed. Please retake it away from bright light.',
+    'blurry': 'The photo is too blurry. Please hold the camera steady and retake it.',
+    'face_too_small': 'The face is too small to identify. Please move closer and retake the photo.',
+}
+
+
+def quality_gate_enabled():
+    return getattr(settings, 'DETECTION_QUALITY_GATE', False)
+
+
+def frame_quality(img):
+    """Sharpness (variance of the Laplacian) and brightness measures of a BGR image"""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    scale = QUALITY_SIZE / max(gray.shape[:2])
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    histogram = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel() / gray.size
+    return {
+        'sharpness': float(cv2.Laplacian(gray, cv2.CV_64F).var()),
+        'brightness': float(np.dot(histogram, np.arange(256))),
+        'dark_share': float(histogram[:16].sum()),
+        'bright_share': float(histogram[240:].sum()),
+    }
+
+
+def frame_rejection(img):
+    """Reason code when the image is too dark, overexposed or blurry, else None"""
+    quality = frame_quality(img)
+    # Exposure first: a dark frame also has little detail to measure
+    if quality['brightness'] < getattr(settings, 'DETECTION_MIN_BRIGHTNESS', 40) or quality['dark_share'] > CLIPPED_SHARE:
+        return 'too_dark'
+    if quality['brightness'] > getattr(settings, 'DETECTION_MAX_BRIGHTNESS', 220) or quality['bright_share'] > CLIPPED_SHARE:
+        return 'overexposed'
+    if quality['sharpness'] < getattr(settings, 'DETECTION_MIN_SHARPNESS', 15):
+        return 'blurry'
+    return None
+
+
+def large_enough_faces(faces):
+    """The face boxes at least DETECTION_MIN_FACE_SIZE pixels on their short side"""
+    min_size = getattr(settings, 'DETECTION_MIN_FACE_SIZE', 25)
+    return [face for face in faces if min(face[2], face[3]) >= min_size]
+
+
+def reject_frame(report, reason):
+    """Record a quality rejection on the report and count it"""
+    report.rejection_reason = reason
+    increment('detection_quality_rejections_total', reason=reason)
@@ -0,0 +1,119 @@
+import base64
+import uuid
+from datetime import datetime, time
+from django.db.models import Q
+from django.utils import timezone
+from .models import DetectionReport
+
+
+# Report listings are paged by keyset on (created_at, id), newest first: a
+# page starts after (or before) the last row of the previous one, so every
+# page is one index range scan whatever its position. Cursors are opaque
+# url-safe strings of that (created_at, id) pair. The row comparison is
+# spelled created_at <= x AND (created_at < x OR id < y) so the leading
+# created_at bound is an index range condition on every database.
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(report):
+    """Cursor of a report, from a DetectionReport or a values() row"""
+    created_at, report_id = (
+        (report['created_at'], report['id']) if isinstance(report, dict) else (report.created_at, report.id)
+    )
+    raw = f'{created_at.isoformat()}|{report_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the (created_at, id) of a cursor, raising ValueError when it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, report_id = raw.split('|')
+        return datetime.fromisoformat(created_at), uuid.UUID(report_id)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+
+def _parse_date(value, end_of_day=False):
+    """A YYYY-MM-DD date (the whole day) or an ISO datetime, as an aware datetime"""
+    parsed = datetime.fromisoformat(value)
+    if len(value) == 10:
+        parsed = datetime.combine(parsed.date(), time.max if end_of_day else time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_reports(params):
+    """
+    Apply the listing filters in params (request.GET) to the reports.
+
+    processed=true|false, verified=true|false (all detections verified, or
+    detections still awaiting review), status=<review status>[,...],
+    date_from / date_to (YYYY-MM-DD or ISO datetime, compared with when the
+    report was created) and location (case-insensitive substring). Raises
+    ValueError for values it cannot read.
+    """
+    reports = DetectionReport.objects.all()
+
+    processed = params.get('processed', '').lower()
+    if processed in ('true', 'false'):
+        reports = reports.filter(is_processed=processed == 'true')
+    elif processed:
+        raise ValueError('processed must be true or false')
+
+    verified = params.get('verified', '').lower()
+    if verified in ('true', 'false'):
+        reports = reports.filter(
+            status=DetectionReport.STATUS_VERIFIED if verified == 'true' else DetectionReport.STATUS_DETECTED
+        )
+    elif verified:
+        raise ValueError('verified must be true or false')
+
+    if params.get('status'):
+        statuses = [value.strip() for value in params['status'].split(',') if value.strip()]
+        known = {value for value, _ in DetectionReport.STATUS_CHOICES}
+        if not set(statuses) <= known:
+            raise ValueError(f"status must be one of {', '.join(sorted(known))}")
+        reports = reports.filter(status__in=statuses)
+
+    if params.get('date_from'):
+        reports = reports.filter(created_at__gte=_parse_date(params['date_from']))
+    if params.get('date_to'):
+        reports = reports.filter(created_at__lte=_parse_date(params['date_to'], end_of_day=True))
+
+    if params.get('location'):
+        reports = reports.filter(location__icontains=params['location'])
+    return reports
+
+
+def paginate_reports(reports, limit, after=None, before=None):
+    """
+    Return one page of reports, newest first, with the cursors around it.
+
+    after continues to older reports from a next_cursor, before goes back to
+    newer ones from a previous_cursor. Returns (rows, next_cursor,
+    previous_cursor); a cursor is None when there is nothing in that direction.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if before:
+        created_at, report_id = decode_cursor(before)
+        page = list(
+            reports.filter(Q(created_at__gte=created_at), Q(created_at__gt=created_at) | Q(id__gt=report_id))
+            .order_by('created_at', 'id')[:limit + 1]
+        )
+        has_newer = len(page) > limit
+        rows = page[:limit][::-1]
+        has_older = True
+    else:
+        if after:
+            created_at, report_id = decode_cursor(after)
+            reports = reports.filter(Q(created_at__lte=created_at), Q(created_at__lt=created_at) | Q(id__lt=report_id))
+        page = list(reports.order_by('-created_at', '-id')[:limit + 1])
+        has_older = len(page) > limit
+        rows = page[:limit]
+        has_newer = bool(after)
+
+    next_cursor = encode_cursor(rows[-1]) if rows and has_older else None
+    previous_cursor = encode_cursor(rows[0]) if rows and has_newer else None
+    return rows, next_cursor, previous_cursor
@@ -0,0 +1,79 @@
+import cv2
+import numpy as np
+from .descriptors import DESCRIPTOR_SIZE
+
+
+# First-stage matchers that pick a shortlist of criminals for full scoring.
+# 'thumbnail' compares 16x16 grayscale thumbnails by correlation, 'phash'
+# compares 64-bit DCT perceptual hashes by Hamming distance.
+SHORTLIST_METHODS = ('none', 'thumbnail', 'phash')
+THUMBNAIL_SIZE = 16
+THUMBNAIL_LENGTH = THUMBNAIL_SIZE * THUMBNAIL_SIZE
+HASH_DCT_SIZE = 32
+HASH_SIZE = 8
+
+# Number of set bits in every byte value, for popcount on older numpy
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def _gray_images(descriptors):
+    """Reshape (n x 30000) RGB descriptors into (n x 100 x 100) grayscale images"""
+    descriptors = np.atleast_2d(np.asarray(descriptors, dtype=np.float32))
+    images = descriptors.reshape(len(descriptors), DESCRIPTOR_SIZE[1], DESCRIPTOR_SIZE[0], 3)
+    return images @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def thumbnail_vectors(descriptors):
+    """Reduce descriptors to mean-centred, unit-length 16x16 grayscale thumbnails"""
+    gray = _gray_images(descriptors)
+    thumbs = np.empty((len(gray), THUMBNAIL_LENGTH), dtype=np.float32)
+    for row, image in enumerate(gray):
+        thumbs[row] = cv2.resize(image, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), interpolation=cv2.INTER_AREA).ravel()
+    thumbs -= thumbs.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(thumbs, axis=1, keepdims=True)
+    return thumbs / np.where(norms > 0, norms, 1)
+
+
+def perceptual_hashes(descriptors):
+    """Return a 64-bit DCT perceptual hash per descriptor as uint64"""
+    gray = _gray_images(descriptors)
+    bits = np.empty((len(gray), HASH_SIZE * HASH_SIZE), dtype=bool)
+    for row, image in enumerate(gray):
+        small = cv2.resize(image, (HASH_DCT_SIZE, HASH_DCT_SIZE), interpolation=cv2.INTER_AREA)
+        low = cv2.dct(small)[:HASH_SIZE, :HASH_SIZE].ravel()
+        # Compare against the median of the low frequencies, ignoring the DC term
+        bits[row] = low > np.median(low[1:])
+    return np.packbits(bits, axis=1).view(np.uint64).ravel()
+
+
+def hamming_distances(probe_hash, hashes):
+    """Number of differing bits between one hash and each of an array of hashes"""
+    differences = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.uint64(probe_hash))
+    return _POPCOUNT[differences.view(np.uint8)].reshape(len(differences), 8).sum(axis=1)
+
+
+def shortlist_rows(face_pixels, gallery, size, method='thumbnail'):
+    """
+    Return, for each face, the live gallery rows of its size closest criminals.
+
+    Only the small per-criminal features stored in the gallery are read, never
+    the full descriptors.
+    """
+    live_rows = gallery.live_rows()
+    if len(live_rows) <= size:
+        return [live_rows for _ in range(len(face_pixels))]
+
+    if method == 'phash':
+        hashes = gallery.hashes()[live_rows]
+        # Smaller distance is closer, so negate it to rank like a similarity
+        similarities = [-hamming_distances(probe, hashes) for probe in perceptual_hashes(face_pixels)]
+    elif method == 'thumbnail':
+        similarities = thumbnail_vectors(face_pixels) @ np.asarray(gallery.thumbnails()[live_rows]).T
+    else:
+        raise ValueError(f"Unknown shortlist method {method!r}, expected one of {', '.join(SHORTLIST_METHODS)}")
+
+    shortlists = []
+    for face_similarities in similarities:
+        top = np.argpartition(-face_similarities, size - 1)[:size]
+        shortlists.append(live_rows[top])
+    return shortlists
@@ -0,0 +1,53 @@
+import threading
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Criminal
+from .descriptors import refresh_criminal_descriptor
+from .gallery import apply_gallery_changes
+
+# Criminals changed in this thread whose gallery rows are not updated yet.
+# The first commit callback applies them all in one go and the rest find
+# nothing to do; ids left over from a rolled back transaction are simply
+# re-checked against the database with the next batch.
+_pending = threading.local()
+
+
+def queue_gallery_change(criminal_id):
+    """Apply a criminal's gallery change once the current transaction commits"""
+    if getattr(_pending, 'ids', None) is None:
+        _pending.ids = set()
+    _pending.ids.add(str(criminal_id))
+    transaction.on_commit(apply_pending_gallery_changes)
+
+
+def apply_pending_gallery_changes():
+    changed = getattr(_pending, 'ids', None)
+    _pending.ids = None
+    if not changed:
+        return
+    try:
+        apply_gallery_changes(changed)
+    except Exception as e:
+        print(f"Error updating gallery: {e}")
+
+
+@receiver(post_save, sender=Criminal)
+def update_criminal_descriptor(sender, instance, raw=False, **kwargs):
+    """Recompute the face descriptor whenever a criminal's photo changes"""
+    if raw:
+        # Skip fixture loading
+        return
+    try:
+        refresh_criminal_descriptor(instance)
+    except Exception as e:
+        print(f"Error updating descriptor for {instance.name}: {e}")
+    # Covers new criminals, new photos and is_wanted toggles; no-op otherwise
+    queue_gallery_change(instance.pk)
+
+
+@receiver(post_delete, sender=Criminal)
+def remove_criminal_from_gallery(sender, instance, **kwargs):
+    """Stop matching against a deleted criminal"""
+    if instance.face_descriptor is not None:
+        queue_gallery_change(instance.pk)
@@ -0,0 +1,103 @@
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from .events import announce_change
+from .models import DetectionReport, DetectionResult, DetectionStats
+
+
+# The totals live in one DetectionStats row. Writers add their changes with
+# F() expressions in the same transaction as the rows being counted, so the
+# totals commit or roll back with them; reconcile_detection_stats recomputes
+# them from the tables, e.g. after rows were deleted in the admin.
+#
+# Every change also advances change_seq. Writers hold the row lock until they
+# commit, so sequence numbers become visible in order and the dashboard feed
+# can use them as a cursor without missing a change.
+STATS_ID = 1
+STATS_FIELDS = (
+    'total_reports', 'total_detections', 'pending_review',
+    'verified_correct', 'verified_incorrect', 'confidence_sum',
+)
+
+
+def record_stats(**changes):
+    """
+    Add changes to the running totals, e.g. record_stats(total_reports=1), and
+    return the new change sequence number.
+    
+    Call it after writing the rows it counts, inside the same transaction.
+    """
+    updates = {field: F(field) + amount for field, amount in changes.items() if amount}
+    updated = DetectionStats.objects.filter(pk=STATS_ID).update(change_seq=F('change_seq') + 1, **updates)
+    if not updated:
+        # No totals yet: counting the tables includes the rows just written
+        reconcile_stats()
+    return current_change_seq()
+
+
+def record_report_change(report, **changes):
+    """record_stats for a change to report, stamping the report with the new sequence number"""
+    report.change_seq = record_stats(**changes)
+    DetectionReport.objects.filter(pk=report.pk).update(change_seq=report.change_seq)
+    announce_change(report.change_seq)
+    return report.change_seq
+
+
+def current_change_seq():
+    """Sequence number of the last recorded change"""
+    change_seq = DetectionStats.objects.filter(pk=STATS_ID).values_list('change_seq', flat=True).first()
+    return get_stats().change_seq if change_seq is None else change_seq
+
+
+def verification_changes(was_verified, was_correct, is_correct):
+    """Changes to the verified counts when a detection is (re-)verified"""
+    changes = {'verified_correct': 0, 'verified_incorrect': 0}
+    if was_verified and was_correct is not None:
+        changes['verified_correct' if was_correct else 'verified_incorrect'] -= 1
+    changes['verified_correct' if is_correct else 'verified_incorrect'] += 1
+    return changes
+
+
+def count_stats():
+    """Compute every total from the report and result tables"""
+    reports = DetectionReport.objects.aggregate(
+        total_reports=Count('id'),
+        pending_review=Count('id', filter=Q(is_processed=False)),
+    )
+    # Alternative candidates of a face are not detections of their own
+    results = DetectionResult.objects.filter(rank=1).aggregate(
+        total_detections=Count('id'),
+        verified_correct=Count('id', filter=Q(is_verified=True, is_correct=True)),
+        verified_incorrect=Count('id', filter=Q(is_verified=True, is_correct=False)),
+        confidence_sum=Sum('confidence'),
+    )
+    results['confidence_sum'] = results['confidence_sum'] or 0.0
+    return {**reports, **results}
+
+
+def reconcile_stats():
+    """Recompute the running totals and return how far off each one was"""
+    with transaction.atomic():
+        # Writers update the same row, so they wait until the recount is saved
+        stats, _ = DetectionStats.objects.select_for_update().get_or_create(pk=STATS_ID)
+        counted = count_stats()
+        drift = {field: counted[field] - getattr(stats, field) for field in STATS_FIELDS}
+        if abs(drift['confidence_sum']) < 1e-6:
+            # Float rounding from adding confidences one report at a time
+            drift['confidence_sum'] = 0
+        for field in STATS_FIELDS:
+            setattr(stats, field, counted[field])
+        # Never move the feed cursor back behind a report, and tell feed
+        # clients about corrections
+        last_report_change = DetectionReport.objects.aggregate(last=Max('change_seq'))['last'] or 0
+        stats.change_seq = max(stats.change_seq, last_report_change) + (1 if any(drift.values()) else 0)
+        stats.save()
+    return drift
+
+
+def get_stats():
+    """Return the DetectionStats row, counting the tables only if it is missing"""
+    stats = DetectionStats.objects.filter(pk=STATS_ID).first()
+    if stats is None:
+        reconcile_stats()
+        stats = DetectionStats.objects.get(pk=STATS_ID)
+    return stats
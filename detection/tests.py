@@ -1,3 +1,263 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from .ann import coarse_vectors, get_index
+from .descriptors import DESCRIPTOR_LENGTH, compute_descriptor_for_photo, descriptor_from_bytes, descriptor_to_bytes
+from .gallery import Gallery, get_gallery, publish_gallery
+from .jobs import claim_next_job, enqueue_detection, run_job
+from .matching import load_candidate_gallery, score_gallery
+from .metrics import _process_path, _state, collect, increment
+from .models import Criminal, DetectionJob, DetectionReport, DetectionResult
+from .photos import assign_report_photo, store_report_photo
+from .stats import get_stats, reconcile_stats, record_report_change
+from .views import save_detection_results
 
-# Create your tests here.
+SAMPLE_PHOTO = os.path.join(settings.BASE_DIR, '1.jpg')
+
+
+class TemporaryStorageTestCase(TestCase):
+    """Keeps media files and the published gallery of each test in a temporary directory"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, ignore_errors=True)
+        storage_settings = override_settings(
+            MEDIA_ROOT=os.path.join(self.temp_dir, 'media'),
+            DETECTION_INDEX_DIR=os.path.join(self.temp_dir, 'gallery'),
+            DETECTION_METRICS_DIR=os.path.join(self.temp_dir, 'metrics'),
+        )
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+
+    def create_criminal(self, name='Test Criminal'):
+        with open(SAMPLE_PHOTO, 'rb') as f:
+            criminal = Criminal(name=name)
+            criminal.photo.save('sample.jpg', File(f), save=False)
+            criminal.save()
+        return criminal
+
+
+class ComputeFaceDescriptorsTests(TemporaryStorageTestCase):
+
+    def test_backfilled_criminal_is_matchable(self):
+        criminal = self.create_criminal()
+        # A criminal whose descriptor was never computed, as before the backfill
+        Criminal.objects.filter(pk=criminal.pk).update(face_descriptor=None, descriptor_version=0)
+        publish_gallery()
+        self.assertEqual(get_gallery().row_numbers([str(criminal.pk)]), [])
+
+        call_command('compute_face_descriptors', stdout=StringIO())
+
+        gallery = get_gallery()
+        self.assertEqual(len(gallery.row_numbers([str(criminal.pk)])), 1)
+        face = compute_descriptor_for_photo(SAMPLE_PHOTO)
+        self.assertIn(str(criminal.pk), load_candidate_gallery(face[None, :]).ids)
+
+
+class GalleryIndexTests(TemporaryStorageTestCase):
+
+    def test_recomputed_descriptor_is_reindexed(self):
+        criminal = self.create_criminal()
+        # A stale descriptor, as left by an older descriptor version
+        stale = np.random.default_rng(0).random(len(descriptor_from_bytes(criminal.face_descriptor)))
+        Criminal.objects.filter(pk=criminal.pk).update(face_descriptor=descriptor_to_bytes(stale))
+        call_command('build_gallery_index', stdout=StringIO())
+
+        call_command('compute_face_descriptors', '--force', stdout=StringIO())
+        # Picked up by the detection path as changed since the build...
+        index = get_index()
+        self.assertTrue(Criminal.objects.filter(pk=criminal.pk, updated_at__gt=index.built_at).exists())
+
+        # ...and refreshed by the next incremental build
+        out = StringIO()
+        call_command('build_gallery_index', stdout=out)
+        self.assertIn('1 added or refreshed', out.getvalue())
+        index = get_index()
+        current = descriptor_from_bytes(Criminal.objects.get(pk=criminal.pk).face_descriptor)
+        row = index.ids.tolist().index(str(criminal.pk))
+        np.testing.assert_allclose(index.vectors[row], coarse_vectors(current[None, :])[0], atol=1e-6)
+
+
+def pairwise_similarity(arr1, arr2):
+    """The per-pair MSE/SSIM/NCC blend the batched scoring replaced, kept as the reference"""
+    arr1, arr2 = arr1.astype(np.float64), arr2.astype(np.float64)
+    mse = np.mean((arr1 - arr2) ** 2)
+    mean1, std1 = np.mean(arr1), np.std(arr1)
+    mean2, std2 = np.mean(arr2), np.std(arr2)
+    covariance = np.mean((arr1 - mean1) * (arr2 - mean2))
+    C1 = (0.01 * 255) ** 2
+    C2 = (0.03 * 255) ** 2
+    ssim = ((2 * mean1 * mean2 + C1) * (2 * covariance + C2)) / \
+           ((mean1 ** 2 + mean2 ** 2 + C1) * (std1 ** 2 + std2 ** 2 + C2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        norm1 = (arr1 - mean1) / (std1 * len(arr1))
+        norm2 = (arr2 - mean2) / std2
+        ncc = np.correlate(norm1, norm2)[0]
+    final_similarity = max(0, (1 - mse) * 100) * 0.4 + max(0, (ssim + 1) * 50) * 0.4 + max(0, (ncc + 1) * 50) * 0.2
+    return min(100.0, max(0.0, final_similarity))
+
+
+class ScoringTests(SimpleTestCase):
+
+    def test_gallery_scores_match_the_pairwise_blend(self):
+        rng = np.random.default_rng(0)
+        faces = rng.random((3, DESCRIPTOR_LENGTH), dtype=np.float32)
+        gallery_rows = np.concatenate([
+            rng.random((4, DESCRIPTOR_LENGTH), dtype=np.float32),
+            # Near copies of the faces, the scores that decide a match
+            np.clip(faces + rng.normal(0, 0.05, faces.shape), 0, 1).astype(np.float32),
+            # A flat crop, which has no defined correlation
+            np.full((1, DESCRIPTOR_LENGTH), 0.5, dtype=np.float32),
+        ])
+        gallery = Gallery([str(row) for row in range(len(gallery_rows))], gallery_rows)
+        expected = np.array([[pairwise_similarity(face, row) for row in gallery_rows] for face in faces])
+
+        for scoring in ('fused', 'batched'):
+            with self.subTest(scoring=scoring), override_settings(DETECTION_SCORING=scoring):
+                np.testing.assert_allclose(score_gallery(faces, gallery), expected, atol=1e-3)
+
+
+class DetectionJobTests(TemporaryStorageTestCase):
+
+    def test_unreadable_photo_is_retried_then_failed(self):
+        report = DetectionReport(location='test')
+        report.photo.save('broken.jpg', ContentFile(b'not an image'), save=True)
+        job = enqueue_detection(report)
+
+        with self.assertLogs('detection.jobs', level='ERROR'):
+            job = run_job(claim_next_job('test'), max_attempts=2)
+        self.assertEqual(job.status, DetectionJob.STATUS_PENDING)
+        self.assertIn('Could not read photo', job.error)
+
+        with self.assertLogs('detection.jobs', level='ERROR'):
+            job = run_job(claim_next_job('test'), max_attempts=2)
+        self.assertEqual(job.status, DetectionJob.STATUS_FAILED)
+        self.assertEqual(job.attempts, 2)
+        report.refresh_from_db()
+        self.assertFalse(report.is_processed)
+
+    def test_status_is_only_shown_to_staff_and_the_submitter(self):
+        citizen = User.objects.create_user('citizen', password='pw')
+        report = DetectionReport(location='test', citizen=citizen)
+        report.photo.save('probe.jpg', ContentFile(b''), save=True)
+        job = enqueue_detection(report)
+        DetectionJob.objects.filter(pk=job.pk).update(
+            status=DetectionJob.STATUS_FAILED, error='Could not read photo detection_reports/probe.jpg'
+        )
+        status_url = reverse('report_status', args=[report.id])
+
+        self.client.force_login(User.objects.create_user('neighbour', password='pw'))
+        self.assertEqual(self.client.get(status_url).status_code, 403)
+
+        for user in (citizen, User.objects.create_user('officer', password='pw', is_staff=True)):
+            self.client.force_login(user)
+            response = self.client.get(status_url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['error'], 'Detection failed')
+
+    @override_settings(DETECTION_ASYNC=True)
+    def test_anonymous_uploader_can_poll_their_report(self):
+        with open(SAMPLE_PHOTO, 'rb') as f:
+            response = self.client.post(reverse('upload_image'), {'image': f})
+        status_url = response.json()['status_url']
+        self.assertEqual(self.client.get(status_url).status_code, 200)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(status_url).status_code, 403)
+
+
+class ReportPhotoTests(TemporaryStorageTestCase):
+
+    def test_failed_write_clears_the_photo(self):
+        report = DetectionReport(location='test')
+        assign_report_photo(report)
+        report.save()
+        storage = DetectionReport._meta.get_field('photo').storage
+
+        with mock.patch.object(storage, 'save', side_effect=OSError('No space left on device')), \
+                self.assertLogs('detection.photos', level='ERROR'):
+            store_report_photo(report, b'image bytes', defer=False)
+
+        self.assertEqual(report.photo.name, '')
+        report.refresh_from_db()
+        self.assertFalse(report.photo)
+
+
+class UploadTests(TemporaryStorageTestCase):
+
+    def test_unknown_profile_is_rejected(self):
+        with open(SAMPLE_PHOTO, 'rb') as f:
+            response = self.client.post(reverse('upload_image'), {'image': f, 'profile': 'turbo'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'profile must be one of fast, balanced, thorough')
+        self.assertFalse(DetectionReport.objects.exists())
+
+
+class CandidateRankTests(TemporaryStorageTestCase):
+
+    def test_only_best_candidates_are_counted_and_reviewed(self):
+        best, alternative = self.create_criminal('Best Match'), self.create_criminal('Alternative')
+        report = DetectionReport(location='test')
+        report.photo.save('probe.jpg', ContentFile(b''), save=True)
+        # Counted as the upload view counts a new report
+        record_report_change(report, total_reports=1, pending_review=1)
+        face = {'x': 0, 'y': 0, 'width': 100, 'height': 100}
+        save_detection_results(report, [
+            {'face_index': 0, 'rank': 1, 'face_coordinates': face, 'criminal_id': str(best.id),
+             'criminal_name': best.name, 'confidence': 80.0, 'is_criminal': True},
+            {'face_index': 0, 'rank': 2, 'face_coordinates': face, 'criminal_id': str(alternative.id),
+             'criminal_name': alternative.name, 'confidence': 79.0, 'is_criminal': False},
+        ])
+
+        report.refresh_from_db()
+        self.assertEqual(DetectionResult.objects.filter(report=report).count(), 2)
+        self.assertEqual(report.detection_count, 1)
+        self.assertEqual(report.top_criminal_name, 'Best Match')
+        stats = get_stats()
+        self.assertEqual(stats.total_detections, 1)
+        self.assertAlmostEqual(stats.confidence_sum, 80.0)
+        self.assertFalse(any(reconcile_stats().values()))
+
+        # Ruling on the best candidate alone verifies the report
+        officer = User.objects.create_user('officer', password='pw', is_staff=True)
+        self.client.force_login(officer)
+        primary = DetectionResult.objects.get(report=report, rank=1)
+        response = self.client.post(reverse('verify_detection', args=[primary.id]), {'is_correct': 'true'})
+        self.assertTrue(response.json()['success'])
+        report.refresh_from_db()
+        self.assertEqual(report.status, DetectionReport.STATUS_VERIFIED)
+        self.assertEqual(get_stats().verified_correct, 1)
+        self.assertFalse(any(reconcile_stats().values()))
+
+
+class MetricsTests(TemporaryStorageTestCase):
+
+    def test_reused_pid_keeps_the_dead_process_counters(self):
+        os.makedirs(settings.DETECTION_METRICS_DIR)
+        # Left behind by an exited worker that had the same pid
+        with open(_process_path(), 'w') as f:
+            json.dump({'counters': {'detection_jobs_total|status="done"': 5}, 'histograms': {}}, f)
+        claimed_pid = _state['claimed_pid']
+        _state['claimed_pid'] = None
+        self.addCleanup(_state.__setitem__, 'claimed_pid', claimed_pid)
+
+        # This process's first flush must not overwrite them
+        increment('detection_jobs_total', status='failed')
+        counters = collect()['counters']
+        self.assertGreaterEqual(counters['detection_jobs_total|status="done"'], 5)
+
+    @override_settings(DETECTION_METRICS_TOKEN='secret')
+    def test_scraper_token(self):
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
@@ -4,8 +4,12 @@ from . import views
 urlpatterns = [
     path('', views.index, name='citizen_dashboard'),
     path('police/', views.police_dashboard, name='police_dashboard'),
+    path('police/feed/', views.dashboard_feed, name='dashboard_feed'),
+    path('police/events/', views.dashboard_events, name='dashboard_events'),
+    path('api/reports/', views.reports_api, name='reports_api'),
     path('upload/', views.upload_image, name='upload_image'),
     path('report/<uuid:report_id>/', views.get_report_details, name='report_details'),
+    path('report/<uuid:report_id>/status/', views.get_report_status, name='report_status'),
     path('verify/<uuid:detection_id>/', views.verify_detection, name='verify_detection'),
     path('confirm-criminal/<uuid:detection_id>/', views.confirm_criminal_status, name='confirm_criminal'),
     path('bulk-upload-criminals/', views.bulk_upload_criminals, name='bulk_upload_criminals'),
@@ -15,5 +19,6 @@ urlpatterns = [
     path('police/logout/', views.police_logout, name='police_logout'),
     path('register/', views.register_citizen, name='register_citizen'),
     path('camera/', views.camera_page, name='camera_page'),
+    path('metrics/', views.metrics, name='metrics'),
     path('test/', views.test_view, name='test_view'),  # Test view for debugging
 ]
\ No newline at end of file
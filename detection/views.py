@@ -1,14 +1,18 @@
 from django.http.response import HttpResponse, HttpResponsePermanentRedirect, HttpResponseRedirect
 
 
+import asyncio
+import hmac
 import os
 import cv2
 import numpy as np
 import json
 import csv
 import io
+import time
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.urls import reverse
+from django.http import HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
@@ -16,10 +20,29 @@ from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
 from django.utils import timezone
-from .models import Criminal, DetectionReport, DetectionResult
+from .models import Criminal, DetectionJob, DetectionReport, DetectionResult
+from .descriptors import decode_image, descriptor_from_image
+from .detectors import DETECTION_PROFILES, detect_faces, detect_faces_tiled, detection_profile, tiled_detection_enabled
+from .matching import load_candidate_gallery, score_gallery, top_matches
+from .quality import REJECTION_MESSAGES, frame_rejection, large_enough_faces, quality_gate_enabled, reject_frame
+from .jobs import async_detection_enabled, enqueue_detection
+from .photos import (
+    UploadTooLarge, assign_report_photo, read_request_image, read_uploaded_file, store_report_photo,
+)
+from .stats import current_change_seq, get_stats, record_report_change, verification_changes
+from .profiling import lap, restart_stage_clock, timed_view
+from .metrics import collect, gauges, increment, observe_faces, render_prometheus, tracked_view
+from .middleware import read_only_session
+from .events import broadcaster, events_enabled, format_event
+from .reports import filter_reports, paginate_reports
 from datetime import datetime
-from PIL import Image
+
+# Session key listing the reports an anonymous visitor uploaded, newest last
+SUBMITTED_REPORTS_KEY = 'submitted_reports'
+SUBMITTED_REPORTS_KEPT = 20
 
 
 def index(request):
@@ -44,6 +67,7 @@ def camera_page(request) -> HttpResponsePermanentRedirect | HttpResponseRedirect
         return redirect('police_dashboard')
     return render(request, 'detection/camera.html')
 
+@tracked_view(lambda request: 'dashboard_poll' if request.headers.get('X-Requested-With') == 'XMLHttpRequest' else 'dashboard')
 def police_dashboard(request):
     """Police dashboard - view detection reports"""
     # If user is not authenticated, redirect to unified login
@@ -58,91 +82,262 @@ def police_dashboard(request):
     # Check if this is an AJAX request for data
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         try:
-            # Get all detection reports
-            reports = DetectionReport.objects.all().order_by('-created_at')[:10]  # Limit to 10 most recent
-            
-            # Serialize the data
-            reports_data = []
-            for report in reports:
-                # Get detection results for this report
-                results = DetectionResult.objects.filter(report=report)
-                detections = []
-                for result in results:
-                    # Ensure confidence is properly clamped
-                    confidence = float(result.confidence)
-                    if confidence > 100.0:
-                        confidence = 100.0
-                    elif confidence < 0.0:
-                        confidence = 0.0
-                        
-                    detections.append({
-                        'criminal_name': result.criminal.name,
-                        'confidence': confidence,
-                    })
-                
-                reports_data.append({
-                    'id': str(report.id),
-                    'detection_time': report.detection_time.strftime('%b %d, %Y %H:%M'),
-                    'location': report.location if report.location else '',
-                    'status': 'Criminal Detected' if detections else 'No Match',
-                    'has_detections': len(detections) > 0,
-                    'first_detection_id': str(results.first().id) if results.exists() and results.first() else None,
-                })
-            
-            # Get statistics
-            total_reports = DetectionReport.objects.count()
-            criminals_detected = DetectionResult.objects.count()
-            pending_review = DetectionReport.objects.filter(is_processed=False).count()
-            
-            # Calculate accuracy rate based on verified detections
-            accuracy_rate = calculate_detection_accuracy()
+            # One query on the report summaries, whatever the number of results
+            reports = DetectionReport.objects.order_by('-created_at').values(*REPORT_SUMMARY_VALUES)[:DASHBOARD_REPORTS]
             
             return JsonResponse({
-                'reports': reports_data,
-                'stats': {
-                    'total_reports': total_reports,
-                    'criminals_detected': criminals_detected,
-                    'pending_review': pending_review,
-                    'accuracy_rate': accuracy_rate
-                }
+                'reports': [serialize_report_summary(report) for report in reports],
+                'stats': dashboard_stats(get_stats()),
             })
         except Exception as e:
             print(f"Error in AJAX request: {e}")
             return JsonResponse({'error': str(e)}, status=500)
     
-    # Get statistics
+    # Get statistics from the running totals
     try:
-        total_reports = DetectionReport.objects.count()
-        criminals_detected = DetectionResult.objects.count()
-        pending_review = DetectionReport.objects.filter(is_processed=False).count()
-        
-        # Calculate accuracy rate based on verified detections
-        accuracy_rate = calculate_detection_accuracy()
-        
-        stats = {
-            'total_reports': total_reports,
-            'criminals_detected': criminals_detected,
-            'pending_review': pending_review,
-            'accuracy_rate': accuracy_rate
-        }
+        stats = dashboard_stats(get_stats())
+        
+        # One keyset page of reports, newest first, with the filters in the query string
+        try:
+            reports, next_cursor, previous_cursor = paginate_reports(
+                filter_reports(request.GET).values(*REPORT_SUMMARY_VALUES),
+                DASHBOARD_REPORTS,
+                after=request.GET.get('after'),
+                before=request.GET.get('before'),
+            )
+        except ValueError as e:
+            messages.error(request, f'Invalid report filter: {e}')
+            return redirect('police_dashboard')
         
-        # Get all detection reports for initial page load
-        reports = DetectionReport.objects.all().order_by('-created_at')
-        return render(request, 'detection/police_dashboard.html', {'reports': reports, 'stats': stats})
+        filters = {key: request.GET[key] for key in REPORT_FILTERS if request.GET.get(key)}
+        return render(request, 'detection/police_dashboard.html', {
+            'reports': reports,
+            'stats': stats,
+            'filters': filters,
+            'next_url': page_url(request, after=next_cursor) if next_cursor else None,
+            'previous_url': page_url(request, before=previous_cursor) if previous_cursor else None,
+            # Live updates replace the list with the newest reports, so only on the unfiltered first page
+            'live_reports': not filters and not request.GET.get('after') and not request.GET.get('before'),
+            'page_size': DASHBOARD_REPORTS,
+            'events_enabled': events_enabled(),
+        })
     except Exception as e:
         print(f"Error in police dashboard: {e}")
         messages.error(request, f'Error loading dashboard: {e}')
         return redirect('citizen_login')
 
+# Columns of the report summary sent to the dashboard, and how many reports it lists
+REPORT_SUMMARY_VALUES = (
+    'id', 'created_at', 'detection_time', 'location', 'detection_count',
+    'top_criminal_name', 'top_confidence', 'first_detection_id', 'status', 'change_seq',
+)
+DASHBOARD_REPORTS = 25
+# Query string filters of report listings, see reports.filter_reports
+REPORT_FILTERS = ('processed', 'verified', 'status', 'date_from', 'date_to', 'location')
+# More changes than this since a feed cursor and the feed sends a fresh list instead
+FEED_MAX_CHANGES = 50
+
+def serialize_report_summary(report):
+    """Dashboard JSON for one report, from a values() row of REPORT_SUMMARY_VALUES"""
+    return {
+        'id': str(report['id']),
+        'created_at': report['created_at'].isoformat(),
+        'detection_time': report['detection_time'].strftime('%b %d, %Y %H:%M'),
+        'location': report['location'] if report['location'] else '',
+        'status': 'Criminal Detected' if report['detection_count'] else 'No Match',
+        'review_status': report['status'],
+        'has_detections': report['detection_count'] > 0,
+        'detection_count': report['detection_count'],
+        'top_criminal_name': report['top_criminal_name'],
+        'top_confidence': report['top_confidence'],
+        'first_detection_id': str(report['first_detection_id']) if report['first_detection_id'] else None,
+        'change_seq': report['change_seq'],
+    }
+
+def page_url(request, **cursor):
+    """The current listing URL with its filters, moved to another page"""
+    query = request.GET.copy()
+    for key in ('after', 'before'):
+        query.pop(key, None)
+    query.update(cursor)
+    return f'{request.path}?{query.urlencode()}'
+
+def dashboard_stats(totals):
+    """Dashboard statistics from the DetectionStats running totals"""
+    return {
+        'total_reports': totals.total_reports,
+        'criminals_detected': totals.total_detections,
+        'pending_review': totals.pending_review,
+        'accuracy_rate': calculate_detection_accuracy(totals)
+    }
+
+@read_only_session
+@tracked_view('dashboard_feed')
+def dashboard_feed(request):
+    """
+    Reports created or changed since a cursor, for polling police dashboards.
+    
+    ?since=<cursor> returns the reports changed after the cursor of an earlier
+    response; without it, or when too much changed, the latest reports come
+    with full=true and replace the list. If-None-Match with the current
+    cursor gets 304 Not Modified, and ?wait=<seconds> holds the request until
+    something changes or the wait (at most DETECTION_FEED_MAX_WAIT) is over.
+    Only ASGI servers hold requests: a held request would tie up a whole sync
+    WSGI worker, so there the feed always answers at once. Clients that want
+    changes as they happen should use dashboard_events on ASGI instead.
+    """
+    if not request.user.is_authenticated or not request.user.is_staff:
+        return JsonResponse({'success': False, 'error': 'Access denied'}, status=403)
+    
+    try:
+        since = max(0, int(request.GET.get('since', 0)))
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'since and wait must be numbers'}, status=400)
+    wait = max(0.0, min(wait, getattr(settings, 'DETECTION_FEED_MAX_WAIT', 25)))
+    if not isinstance(request, ASGIRequest):
+        wait = 0.0
+    
+    # The cursor is the ETag: it moves whenever a report or statistic changes
+    client_etag = request.headers.get('If-None-Match', '')
+    cursor = current_change_seq()
+    deadline = time.monotonic() + wait
+    while (client_etag == f'"{cursor}"' or 0 < cursor <= since) and time.monotonic() < deadline:
+        time.sleep(min(getattr(settings, 'DETECTION_FEED_POLL_INTERVAL', 1.0), max(0.0, deadline - time.monotonic())))
+        cursor = current_change_seq()
+    
+    if client_etag == f'"{cursor}"':
+        response = HttpResponseNotModified()
+    else:
+        payload = feed_payload(since)
+        cursor = payload['cursor']
+        response = JsonResponse(payload)
+    response['ETag'] = f'"{cursor}"'
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+def feed_payload(since):
+    """The dashboard feed for a cursor: reports changed after it, or the latest ones with full=True"""
+    # Read the totals before the reports: a change in between is sent again next time
+    totals = get_stats()
+    cursor = totals.change_seq
+    full = since == 0 or since > cursor
+    changed = []
+    if not full:
+        changed = list(
+            DetectionReport.objects.filter(change_seq__gt=since)
+            .order_by('-change_seq').values(*REPORT_SUMMARY_VALUES)[:FEED_MAX_CHANGES + 1]
+        )
+        full = len(changed) > FEED_MAX_CHANGES
+    if full:
+        changed = DetectionReport.objects.order_by('-created_at').values(*REPORT_SUMMARY_VALUES)[:DASHBOARD_REPORTS]
+    
+    return {
+        'success': True,
+        'cursor': cursor,
+        'full': full,
+        'reports': [serialize_report_summary(report) for report in changed],
+        'stats': dashboard_stats(totals),
+    }
+
+@read_only_session
+async def dashboard_events(request):
+    """
+    Server-Sent Events stream of the dashboard feed, for ASGI deployments.
+    
+    Sends the feed on connect and again after every change, with the cursor
+    as the event id so a reconnecting EventSource resumes from Last-Event-ID.
+    """
+    if not events_enabled():
+        return JsonResponse({'success': False, 'error': 'Event streaming is disabled'}, status=404)
+    user = await request.auser()
+    if not user.is_authenticated or not user.is_staff:
+        return JsonResponse({'success': False, 'error': 'Access denied'}, status=403)
+    
+    try:
+        since = max(0, int(request.headers.get('Last-Event-ID') or request.GET.get('since', 0)))
+    except ValueError:
+        since = 0
+    
+    response = StreamingHttpResponse(dashboard_event_stream(since), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop proxies from buffering the stream
+    return response
+
+async def dashboard_event_stream(since):
+    """Yield feed updates as Server-Sent Events until the client goes away"""
+    wake = broadcaster.subscribe()
+    try:
+        yield 'retry: 3000\n\n'
+        first = True
+        while True:
+            wake.clear()
+            payload = await broadcaster.feed(since)
+            if first or payload['cursor'] != since:
+                yield format_event('dashboard', json.dumps(payload), payload['cursor'])
+                since = payload['cursor']
+            first = False
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=settings.DETECTION_EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+    finally:
+        broadcaster.unsubscribe(wake)
+
+@read_only_session
+@tracked_view('reports_api')
+def reports_api(request):
+    """
+    JSON listing of detection reports, newest first, for staff.
+    
+    Takes the filters of reports.filter_reports, limit (at most 100) and the
+    after / before cursors of an earlier page. Pages are keyset-paginated, so
+    a deep page costs the same as the first.
+    """
+    if not request.user.is_authenticated or not request.user.is_staff:
+        return JsonResponse({'success': False, 'error': 'Access denied'}, status=403)
+    
+    try:
+        limit = int(request.GET.get('limit', DASHBOARD_REPORTS))
+        reports, next_cursor, previous_cursor = paginate_reports(
+            filter_reports(request.GET).values(*REPORT_SUMMARY_VALUES),
+            limit,
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'reports': [serialize_report_summary(report) for report in reports],
+        'next_cursor': next_cursor,
+        'previous_cursor': previous_cursor,
+        'next_url': page_url(request, after=next_cursor) if next_cursor else None,
+        'previous_url': page_url(request, before=previous_cursor) if previous_cursor else None,
+    })
+
 @csrf_exempt
+@timed_view
+@tracked_view('upload')
 def upload_image(request):
     """Handle image upload from citizen"""
     if request.method == 'POST':
         try:
+            profile = detection_profile(request)
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'error': f"profile must be one of {', '.join(DETECTION_PROFILES)}"
+            }, status=400)
+        try:
+            # Raw image bytes in the body (camera clients send the JPEG Blob as is)
+            if request.content_type.startswith('image/'):
+                image_data = read_request_image(request)
             # Check if we have a file upload
-            if request.FILES.get('image'):
+            elif request.FILES.get('image'):
                 # Handle file upload
-                image_file = request.FILES['image']
+                image_data = read_uploaded_file(request.FILES['image'])
             elif request.POST.get('image_data'):
                 # Handle base64 data upload
                 image_data = request.POST['image_data']
@@ -152,159 +347,64 @@ def upload_image(request):
                 
                 # Decode base64 data
                 import base64
-                from django.core.files.base import ContentFile
-                from django.utils.crypto import get_random_string
-                
                 image_data = base64.b64decode(image_data)
-                image_file = ContentFile(image_data, name=f"upload_{get_random_string(10)}.jpg")
             else:
                 return JsonResponse({
                     'success': False,
                     'error': 'No image data provided'
                 })
+            lap('read_upload')
             
-            # Create a detection report
+            # Create a detection report, named after the photo it will hold
             report = DetectionReport(
                 citizen=request.user if request.user.is_authenticated else None,
-                location=request.POST.get('location', '')
+                location=request.POST.get('location', request.GET.get('location', '')),
+                detection_profile=profile
             )
-            report.save()
-            
-            # Save the image file
-            report.photo.save(f'report_{report.id}.jpg', image_file, save=True)
-            
-            # Process the image for face detection
-            detection_results = process_image_for_detection(report)
-            
-            # Save detection results
-            for result in detection_results:
-                # Save all results that have a criminal ID (potential matches)
-                if result.get('criminal_id'):
-                    # Ensure confidence is properly clamped before saving to database
-                    confidence = float(result['confidence'])
-                    clamped_confidence = max(0.0, min(100.0, confidence))
-                    
-                    detection_result = DetectionResult(
-                        report=report,
-                        criminal_id=result['criminal_id'],
-                        confidence=clamped_confidence,  # Use clamped confidence
-                        face_coordinates=json.dumps(result['face_coordinates'])
-                    )
-                    detection_result.save()
-                # Also save results that detected a face but no match was found (for review)
-                elif not result.get('is_criminal', False) and result.get('confidence', 0) >= 0:
-                    # Create a placeholder criminal for "Unknown Person" if one doesn't exist
-                    unknown_criminal, created = Criminal.objects.get_or_create(
-                        name="Unknown Person",
-                        defaults={
-                            'description': 'Face detected but no match found in database',
-                        }
-                    )
-                    
-                    # Ensure confidence is properly clamped before saving to database
-                    confidence = float(result['confidence'])
-                    clamped_confidence = max(0.0, min(100.0, confidence))
-                    
-                    detection_result = DetectionResult(
-                        report=report,
-                        criminal=unknown_criminal,
-                        confidence=clamped_confidence,  # Use clamped confidence
-                        face_coordinates=json.dumps(result['face_coordinates'])
-                    )
-                    detection_result.save()
+            assign_report_photo(report)
+            with transaction.atomic():
+                report.save()
+                record_report_change(report, total_reports=1, pending_review=1)
             
-            # Update report as processed
-            report.is_processed = True
-            report.save(update_fields=['is_processed'])
-            
-            # Count total faces and criminals detected
-            total_faces = len(detection_results)
-            # Consider any result with a criminal_id as a potential criminal detection
-            criminals_found = [result for result in detection_results if result.get('criminal_id') and result.get('confidence', 0) > 5]
-            
-            # Only return detailed results if criminals are found
-            if len(criminals_found) > 0:
-                # Enhance the criminals list with more detailed information
-                enhanced_criminals = []
-                for criminal_data in criminals_found:
-                    try:
-                        criminal = Criminal.objects.get(id=criminal_data['criminal_id'])
-                        enhanced_criminals.append({
-                            'id': str(criminal.id),
-                            'name': criminal.name,
-                            'description': criminal.description,
-                            'photo_url': criminal.photo.url if criminal.photo else '',
-                            'confidence': criminal_data['confidence'],
-                            'face_coordinates': criminal_data['face_coordinates']
-                        })
-                    except Criminal.DoesNotExist:
-                        # Fallback if criminal not found
-                        enhanced_criminals.append({
-                            'id': criminal_data['criminal_id'],
-                            'name': criminal_data['criminal_name'],
-                            'description': '',
-                            'photo_url': '',
-                            'confidence': criminal_data['confidence'],
-                            'face_coordinates': criminal_data['face_coordinates']
-                        })
-                
-                return JsonResponse({
-                    'success': True,
-                    'report_id': str(report.id),
-                    'message': 'Potential criminal detected!',
-                    'detections': detection_results,
-                    'total_faces_detected': total_faces,
-                    'total_criminals_found': len(criminals_found),
-                    'criminals_list': enhanced_criminals,
-                    'location': report.location,
-                    'detection_time': report.detection_time.strftime('%b %d, %Y %H:%M')
-                })
-            else:
-                # Show all detections even if no high-confidence matches
-                enhanced_detections = []
-                for result in detection_results:
-                    if result.get('criminal_id'):
-                        try:
-                            criminal = Criminal.objects.get(id=result['criminal_id'])
-                            enhanced_detections.append({
-                                'id': str(criminal.id),
-                                'name': criminal.name,
-                                'description': criminal.description,
-                                'photo_url': criminal.photo.url if criminal.photo else '',
-                                'confidence': result['confidence'],
-                                'face_coordinates': result['face_coordinates']
-                            })
-                        except Criminal.DoesNotExist:
-                            enhanced_detections.append({
-                                'id': result['criminal_id'],
-                                'name': result.get('criminal_name', 'Unknown'),
-                                'description': '',
-                                'photo_url': '',
-                                'confidence': result['confidence'],
-                                'face_coordinates': result['face_coordinates']
-                            })
-                    else:
-                        enhanced_detections.append({
-                            'id': 'unknown',
-                            'name': result.get('criminal_name', 'Unknown Person'),
-                            'description': 'Face detected but no match found',
-                            'photo_url': '',
-                            'confidence': result['confidence'],
-                            'face_coordinates': result['face_coordinates']
-                        })
-                
+            # In async mode the detection workers pick the report up from storage; return straight away
+            if async_detection_enabled(request):
+                store_report_photo(report, image_data, defer=False)
+                lap('store_upload')
+                job = enqueue_detection(report)
+                remember_submitted_report(request, report)
                 return JsonResponse({
                     'success': True,
+                    'queued': True,
                     'report_id': str(report.id),
-                    'message': 'Detection completed with all results',
-                    'detections': detection_results,
-                    'total_faces_detected': total_faces,
-                    'total_criminals_found': len([r for r in detection_results if r.get('criminal_id')]),
-                    'criminals_list': enhanced_detections,
+                    'job_id': str(job.id),
+                    'status': job.status,
+                    'status_url': reverse('report_status', args=[report.id]),
+                    'message': 'Image received. Detection is running in the background.',
                     'location': report.location,
                     'detection_time': report.detection_time.strftime('%b %d, %Y %H:%M')
                 })
             
+            # Save the original for review (in the background unless
+            # DETECTION_DEFER_PHOTO_WRITE is off) and detect on the bytes in memory
+            store_report_photo(report, image_data)
+            lap('store_upload')
+            img = decode_image(image_data)
+            lap('decode')
+            
+            # Process the image for face detection
+            tiled = tiled_detection_enabled(request)
+            detection_results = process_image_for_detection(report, img, tiled=tiled) if img is not None else []
+            
+            # Save detection results
+            save_detection_results(report, detection_results)
+            
+            return JsonResponse(build_detection_response(report, detection_results))
+            
+        except UploadTooLarge as e:
+            return JsonResponse({
+                'success': False,
+                'error': str(e)
+            }, status=413)
         except Exception as e:
             return JsonResponse({
                 'success': False,
@@ -317,164 +417,213 @@ def upload_image(request):
     })
 
 
-def convert_image_to_pixels(image_path):
-    """Convert image to pixel array for storage and comparison"""
-    try:
-        # Open image using PIL for better pixel handling
-        img = Image.open(image_path)
-        
-        # Convert to RGB if not already
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Resize to standard size for consistency
-        img = img.resize((100, 100), Image.Resampling.LANCZOS)
-        
-        # Convert to numpy array
-        pixel_array = np.array(img)
+def save_detection_results(report, detection_results):
+    """Save DetectionResult rows for processed detections and mark the report processed"""
+    restart_stage_clock()
+    with transaction.atomic():
+        unknown_criminal = None
+        detection_rows = []
+        for result in detection_results:
+            # Save all results that have a criminal ID (potential matches)
+            if result.get('criminal_id'):
+                criminal_id = result['criminal_id']
+            # Also save results that detected a face but no match was found (for review)
+            elif not result.get('is_criminal', False) and result.get('confidence', 0) >= 0:
+                # Create a placeholder criminal for "Unknown Person" if one doesn't exist
+                if unknown_criminal is None:
+                    unknown_criminal, created = Criminal.objects.get_or_create(
+                        name="Unknown Person",
+                        defaults={
+                            'description': 'Face detected but no match found in database',
+                        }
+                    )
+                criminal_id = unknown_criminal.id
+            else:
+                continue
+            
+            # Ensure confidence is properly clamped before saving to database
+            confidence = float(result['confidence'])
+            clamped_confidence = max(0.0, min(100.0, confidence))
+            
+            detection_rows.append(DetectionResult(
+                report=report,
+                criminal_id=criminal_id,
+                confidence=clamped_confidence,  # Use clamped confidence
+                face_coordinates=json.dumps(result['face_coordinates']),
+                rank=result.get('rank', 1)
+            ))
         
-        # Normalize pixel values to 0-1 range
-        normalized_pixels = pixel_array.astype(np.float32) / 255.0
+        # Every candidate of every face in one INSERT; only the best candidate
+        # of each face counts towards the totals
+        DetectionResult.objects.bulk_create(detection_rows)
+        saved_confidences = [row.confidence for row in detection_rows if row.rank == 1]
         
-        # Return flattened array for storage
-        return normalized_pixels.flatten()
-    except Exception as e:
-        print(f"Error converting image to pixels: {e}")
-        return None
+        # Update report as processed, along with its dashboard summary
+        was_processed = report.is_processed
+        report.is_processed = True
+        report.refresh_summary(save=False)
+        report.save(update_fields=['is_processed', 'detection_profile', 'cascades_run', 'rejection_reason'] + DetectionReport.SUMMARY_FIELDS)
+        record_report_change(
+            report,
+            total_detections=len(saved_confidences),
+            confidence_sum=sum(saved_confidences),
+            pending_review=0 if was_processed else -1,
+        )
+    lap('db_write')
 
-def compare_images_pixel_by_pixel(pixels1, pixels2):
-    """Compare two images pixel by pixel using multiple methods"""
-    try:
-        # Ensure both arrays are numpy arrays
-        arr1 = np.array(pixels1)
-        arr2 = np.array(pixels2)
-        
-        # Method 1: Mean Squared Error (MSE)
-        mse = np.mean((arr1 - arr2) ** 2)
-        
-        # Method 2: Structural Similarity Index (SSIM) approximation
-        # Calculate mean and standard deviation
-        mean1, std1 = np.mean(arr1), np.std(arr1)
-        mean2, std2 = np.mean(arr2), np.std(arr2)
-        
-        # Covariance calculation
-        covariance = np.mean((arr1 - mean1) * (arr2 - mean2))
-        
-        # SSIM constants
-        C1 = (0.01 * 255) ** 2
-        C2 = (0.03 * 255) ** 2
-        
-        # SSIM calculation
-        ssim = ((2 * mean1 * mean2 + C1) * (2 * covariance + C2)) / \
-               ((mean1 ** 2 + mean2 ** 2 + C1) * (std1 ** 2 + std2 ** 2 + C2))
-        
-        # Method 3: Normalized Cross-Correlation
-        # Normalize arrays
-        norm1 = (arr1 - np.mean(arr1)) / (np.std(arr1) * len(arr1))
-        norm2 = (arr2 - np.mean(arr2)) / np.std(arr2)
-        ncc = np.correlate(norm1, norm2)[0]
-        
-        # Convert to similarity score (0-100)
-        # Lower MSE means higher similarity
-        mse_similarity = max(0, (1 - mse) * 100)
-        
-        # SSIM is already in range -1 to 1, convert to 0-100
-        ssim_similarity = max(0, (ssim + 1) * 50)
-        
-        # NCC is in range -1 to 1, convert to 0-100
-        ncc_similarity = max(0, (ncc + 1) * 50)
+
+def build_detection_response(report, detection_results):
+    """Build the JSON payload returned to the citizen for a processed report"""
+    # The quality gate turned the photo away; the camera page asks for a retake
+    if report.rejection_reason:
+        return {
+            'success': True,
+            'report_id': str(report.id),
+            'rejected': True,
+            'rejection_reason': report.rejection_reason,
+            'message': REJECTION_MESSAGES.get(report.rejection_reason, 'Please retake the photo.'),
+            'detections': [],
+            'total_faces_detected': 0,
+            'total_criminals_found': 0,
+            'criminals_list': [],
+            'location': report.location,
+            'detection_time': report.detection_time.strftime('%b %d, %Y %H:%M')
+        }
+
+    # Count total faces and criminals detected; a face can have several candidates
+    total_faces = len({result.get('face_index', index) for index, result in enumerate(detection_results)})
+    # The best candidate of each matched face is a potential criminal detection
+    criminals_found = [result for result in detection_results if result.get('is_criminal') and result.get('confidence', 0) > 5]
+    criminals = {str(criminal_id): criminal for criminal_id, criminal in Criminal.objects.in_bulk(
+        [result['criminal_id'] for result in detection_results if result.get('criminal_id')]
+    ).items()}
+    
+    # Only return detailed results if criminals are found
+    if len(criminals_found) > 0:
+        # Enhance the criminals list with more detailed information
+        enhanced_criminals = []
+        for criminal_data in criminals_found:
+            criminal = criminals.get(criminal_data['criminal_id'])
+            if criminal is not None:
+                enhanced_criminals.append({
+                    'id': str(criminal.id),
+                    'name': criminal.name,
+                    'description': criminal.description,
+                    'photo_url': criminal.photo.url if criminal.photo else '',
+                    'confidence': criminal_data['confidence'],
+                    'face_coordinates': criminal_data['face_coordinates']
+                })
+            else:
+                # Fallback if criminal not found
+                enhanced_criminals.append({
+                    'id': criminal_data['criminal_id'],
+                    'name': criminal_data['criminal_name'],
+                    'description': '',
+                    'photo_url': '',
+                    'confidence': criminal_data['confidence'],
+                    'face_coordinates': criminal_data['face_coordinates']
+                })
         
-        # Weighted average of all methods
-        final_similarity = (mse_similarity * 0.4 + ssim_similarity * 0.4 + ncc_similarity * 0.2)
+        return {
+            'success': True,
+            'report_id': str(report.id),
+            'message': 'Potential criminal detected!',
+            'detections': detection_results,
+            'total_faces_detected': total_faces,
+            'total_criminals_found': len(criminals_found),
+            'criminals_list': enhanced_criminals,
+            'location': report.location,
+            'detection_time': report.detection_time.strftime('%b %d, %Y %H:%M')
+        }
+    else:
+        # Show all detections even if no high-confidence matches
+        enhanced_detections = []
+        for result in detection_results:
+            if result.get('criminal_id'):
+                criminal = criminals.get(result['criminal_id'])
+                if criminal is not None:
+                    enhanced_detections.append({
+                        'id': str(criminal.id),
+                        'name': criminal.name,
+                        'description': criminal.description,
+                        'photo_url': criminal.photo.url if criminal.photo else '',
+                        'confidence': result['confidence'],
+                        'face_coordinates': result['face_coordinates']
+                    })
+                else:
+                    enhanced_detections.append({
+                        'id': result['criminal_id'],
+                        'name': result.get('criminal_name', 'Unknown'),
+                        'description': '',
+                        'photo_url': '',
+                        'confidence': result['confidence'],
+                        'face_coordinates': result['face_coordinates']
+                    })
+            else:
+                enhanced_detections.append({
+                    'id': 'unknown',
+                    'name': result.get('criminal_name', 'Unknown Person'),
+                    'description': 'Face detected but no match found',
+                    'photo_url': '',
+                    'confidence': result['confidence'],
+                    'face_coordinates': result['face_coordinates']
+                })
         
-        return min(100.0, max(0.0, final_similarity))
-    except Exception as e:
-        print(f"Error comparing images: {e}")
-        return 0.0
+        return {
+            'success': True,
+            'report_id': str(report.id),
+            'message': 'Detection completed with all results',
+            'detections': detection_results,
+            'total_faces_detected': total_faces,
+            'total_criminals_found': len([r for r in detection_results if r.get('criminal_id')]),
+            'criminals_list': enhanced_detections,
+            'location': report.location,
+            'detection_time': report.detection_time.strftime('%b %d, %Y %H:%M')
+        }
+
+def process_image_for_detection(report, img=None, tiled=None, raise_errors=False):
+    """Process image and detect faces with pixel-based matching
+
+    img is the already decoded BGR photo; without it the report's photo is
+    read from storage. tiled picks tiled detection for crowd images and
+    defaults to the DETECTION_TILED setting. The report's detection profile
+    (DETECTION_PROFILE when it has none) decides which cascades run; both
+    are recorded on the report for save_detection_results to store.
 
-def process_image_for_detection(report):
-    """Process image and detect faces with pixel-based matching"""
+    Errors, including a photo that cannot be read, give no results unless
+    raise_errors is set, as it is for detection jobs so they can be retried.
+    """
     try:
-        # Get the image path
-        image_path = report.photo.path
+        restart_stage_clock()
         
-        # Load the image
-        img = cv2.imread(image_path)
+        # Load the image unless the caller decoded the upload already
         if img is None:
-            return []
-        
-        # Convert to grayscale for face detection
-        gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Apply histogram equalization to improve contrast
-        gray_img = cv2.equalizeHist(gray_img)
+            img = cv2.imread(report.photo.path)
+            lap('decode')
+            if img is None:
+                raise ValueError(f"Could not read photo {report.photo.name}")
         
-        # Apply Gaussian blur to reduce noise
-        gray_img = cv2.GaussianBlur(gray_img, (3, 3), 0)
+        # Blurry, dark or overexposed frames never reach the cascades
+        report.rejection_reason = ''
+        gate = quality_gate_enabled()
+        if gate:
+            reason = frame_rejection(img)
+            lap('quality')
+            if reason:
+                reject_frame(report, reason)
+                return []
         
-        # Load multiple face cascade classifiers for better detection
-        try:
-            cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-            alt_cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_alt2.xml'
-        except AttributeError:
-            # Fallback path if cv2.data is not available
-            cascade_path = 'cv2/data/haarcascade_frontalface_default.xml'
-            alt_cascade_path = 'cv2/data/haarcascade_frontalface_alt2.xml'
-        
-        face_cascade = cv2.CascadeClassifier(cascade_path)
-        alt_face_cascade = cv2.CascadeClassifier(alt_cascade_path)
-        
-        # Detect faces with multiple classifiers and combine results
-        faces1 = face_cascade.detectMultiScale(
-            gray_img, 
-            scaleFactor=1.05,
-            minNeighbors=3,
-            minSize=(30, 30),
-            flags=cv2.CASCADE_SCALE_IMAGE
-        )
-        
-        faces2 = alt_face_cascade.detectMultiScale(
-            gray_img, 
-            scaleFactor=1.08,
-            minNeighbors=2,
-            minSize=(25, 25),
-            flags=cv2.CASCADE_SCALE_IMAGE
-        )
-        
-        # Combine results from both classifiers
-        all_faces = list(faces1) + list(faces2)
-        
-        # Remove duplicate detections by merging overlapping rectangles
-        if len(all_faces) > 0:
-            filtered_faces = []
-            for (x, y, w, h) in all_faces:
-                # Check if this face overlaps significantly with any already added face
-                overlap = False
-                for fx, fy, fw, fh in filtered_faces:
-                    # Calculate overlap area
-                    x1 = max(x, fx)
-                    y1 = max(y, fy)
-                    x2 = min(x + w, fx + fw)
-                    y2 = min(y + h, fy + fh)
-                    
-                    if x1 < x2 and y1 < y2:
-                        # Calculate overlap ratio
-                        overlap_area = (x2 - x1) * (y2 - y1)
-                        area1 = w * h
-                        area2 = fw * fh
-                        min_area = min(area1, area2)
-                        
-                        # If overlap is more than 50% of the smaller face, consider it duplicate
-                        if overlap_area > 0.5 * min_area:
-                            overlap = True
-                            break
-                
-                if not overlap:
-                    filtered_faces.append((x, y, w, h))
-            
-            faces = filtered_faces
+        # Run the cascades over parallel tiles, or once (on a downscaled frame
+        # when DETECTION_MAX_DIMENSION is set); boxes come back in the pixels of img
+        if tiled is None:
+            tiled = tiled_detection_enabled()
+        report.detection_profile = report.detection_profile or detection_profile()
+        if tiled:
+            faces, cascades_run = detect_faces_tiled(img, profile=report.detection_profile)
         else:
-            faces = []
+            faces, cascades_run = detect_faces(img, profile=report.detection_profile)
+        report.cascades_run = ','.join(cascades_run)
+        observe_faces(len(faces))
         
         results = []
         
@@ -482,102 +631,84 @@ def process_image_for_detection(report):
         if len(faces) == 0:
             return results
         
-        # Convert input image to pixels for comparison
-        input_pixels = convert_image_to_pixels(image_path)
-        if input_pixels is None:
-            return results
+        # Faces too small to identify are not matched
+        if gate:
+            faces = large_enough_faces(faces)
+            if not faces:
+                reject_frame(report, 'face_too_small')
+                return results
         
-        # Get all criminals with photos
-        criminals = Criminal.objects.exclude(photo='')
+        # Bound the cost of crowded frames: only the largest faces are matched
+        max_faces = getattr(settings, 'DETECTION_MAX_FACES', 10)
+        if len(faces) > max_faces:
+            faces = sorted(faces, key=lambda face: face[2] * face[3], reverse=True)[:max_faces]
         
-        # For each detected face, compare with criminal database
-        face_results = []
-        for (x, y, w, h) in faces:
-            # Extract face region
-            face_img = gray_img[y:y+h, x:x+w]
-            
-            # Apply additional preprocessing for better matching
-            # Sharpen the face image
-            kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-            face_img = cv2.filter2D(face_img, -1, kernel)
-            
-            # Resize face for consistency
-            face_img = cv2.resize(face_img, (100, 100))
-            
-            best_match = None
-            best_confidence = 0.0
-            
-            # Compare with each criminal using pixel-based comparison
-            for criminal in criminals:
-                try:
-                    # Load criminal's photo
-                    criminal_image_path = os.path.join(settings.MEDIA_ROOT, str(criminal.photo))
-                    if os.path.exists(criminal_image_path):
-                        # Convert criminal image to pixels
-                        criminal_pixels = convert_image_to_pixels(criminal_image_path)
-                        if criminal_pixels is not None:
-                            # Compare pixels
-                            confidence = compare_images_pixel_by_pixel(input_pixels, criminal_pixels)
-                            
-                            # If this is a better match and above threshold
-                            if confidence > best_confidence and confidence > 5:  # Low threshold for sensitivity
-                                best_confidence = confidence
-                                best_match = criminal
-                except Exception as e:
-                    # Skip this criminal if there's an error loading their photo
-                    continue
-            
-            # Store result for this face
-            face_result = {
-                'face_coordinates': {
-                    'x': int(x),
-                    'y': int(y),
-                    'width': int(w),
-                    'height': int(h)
-                },
-                'confidence': best_confidence,
-                'best_match': best_match
-            }
-            
-            face_results.append(face_result)
+        # Describe every face region the same way criminal photos are described
+        face_pixels = np.stack([descriptor_from_image(img, (x, y, w, h)) for (x, y, w, h) in faces])
+        lap('describe')
         
-        # Now select only the most confident result to avoid multiple detections
-        if face_results:
-            # Sort by confidence (highest first)
-            face_results.sort(key=lambda x: x['confidence'], reverse=True)
-            
-            # Take only the best result if it meets our criteria
-            best_face_result = face_results[0]
-            
-            # Create the final result
-            final_result = {
-                'face_coordinates': best_face_result['face_coordinates']
+        # Load the precomputed criminal descriptors (an ANN shortlist for large
+        # galleries); photos are never reopened here
+        gallery = load_candidate_gallery(face_pixels)
+        lap('gallery')
+        
+        # Score all faces against all criminals in one batched pass and keep
+        # the best candidates of every face
+        scores = score_gallery(face_pixels, gallery)
+        candidates = top_matches(scores, getattr(settings, 'DETECTION_TOP_K', 3))
+        
+        # Names are only needed for the criminals that actually matched
+        matched_ids = [gallery.ids[column] for face_candidates in candidates for column, _ in face_candidates]
+        names = {str(criminal_id): name for criminal_id, name in
+                 Criminal.objects.filter(id__in=matched_ids).values_list('id', 'name')}
+        lap('match')
+        
+        # Faces with the strongest match come first; every candidate of a face
+        # is a result, and only its best one counts as a criminal detection
+        face_order = sorted(
+            range(len(faces)),
+            key=lambda index: candidates[index][0][1] if candidates[index] else 0.0,
+            reverse=True
+        )
+        for face_index, index in enumerate(face_order):
+            x, y, w, h = faces[index]
+            face_coordinates = {
+                'x': int(x),
+                'y': int(y),
+                'width': int(w),
+                'height': int(h)
             }
             
-            # If we found a good match
-            if best_face_result['best_match'] and best_face_result['confidence'] > 5:
-                # Ensure confidence is properly clamped before saving
-                clamped_confidence = max(0.0, min(100.0, best_face_result['confidence']))
-                final_result.update({
-                    'criminal_id': str(best_face_result['best_match'].id),
-                    'criminal_name': best_face_result['best_match'].name,
-                    'confidence': round(clamped_confidence, 2),  # Already in percentage
-                    'is_criminal': True
-                })
-            else:
+            if not candidates[index]:
                 # No match found, but still detected a face
-                clamped_confidence = max(0.0, min(100.0, best_face_result['confidence']))
-                final_result.update({
+                results.append({
+                    'face_index': face_index,
+                    'rank': 1,
+                    'face_coordinates': face_coordinates,
                     'criminal_name': 'Unknown Person',
-                    'confidence': round(clamped_confidence, 2) if clamped_confidence > 0 else 0,
+                    'confidence': 0,
                     'is_criminal': False
                 })
+                continue
             
-            results.append(final_result)
+            for rank, (column, confidence) in enumerate(candidates[index], start=1):
+                # Ensure confidence is properly clamped before saving
+                clamped_confidence = max(0.0, min(100.0, confidence))
+                results.append({
+                    'face_index': face_index,
+                    'rank': rank,
+                    'face_coordinates': face_coordinates,
+                    'criminal_id': gallery.ids[column],
+                    'criminal_name': names.get(gallery.ids[column], 'Unknown'),
+                    'confidence': round(clamped_confidence, 2),  # Already in percentage
+                    'is_criminal': rank == 1
+                })
         
         return results
     
     except Exception as e:
+        if raise_errors:
+            raise
         # Return empty results if there's an error
         print(f"Error in process_image_for_detection: {e}")
         return []
@@ -586,7 +717,9 @@ def get_report_details(request, report_id):
     """Get detailed information about a detection report"""
     try:
         report = DetectionReport.objects.get(id=report_id)
-        results = DetectionResult.objects.filter(report=report)
+        # Best candidates first, as refresh_summary orders them; a face's best
+        # candidate comes before an alternative with the same confidence
+        results = DetectionResult.objects.filter(report=report).select_related('criminal').order_by('-confidence', 'rank', 'detected_at', 'id')
         
         detections = []
         for result in results:
@@ -603,7 +736,8 @@ def get_report_details(request, report_id):
                 'criminal_id': str(result.criminal.id),
                 'criminal_name': result.criminal.name,
                 'confidence': round(confidence, 2),  # Ensure proper formatting
-                'face_coordinates': json.loads(result.face_coordinates) if result.face_coordinates else {}
+                'face_coordinates': json.loads(result.face_coordinates) if result.face_coordinates else {},
+                'rank': result.rank
             })
         
         return JsonResponse({
@@ -612,6 +746,7 @@ def get_report_details(request, report_id):
             'detection_time': report.detection_time.strftime('%b %d, %Y %H:%M'),
             'location': report.location,
             'detections': detections,
+            'total_faces': len([detection for detection in detections if detection['rank'] == 1]),
             'status': 'Criminal Detected' if detections else 'No Match'
         })
     except DetectionReport.DoesNotExist:
@@ -625,6 +760,51 @@ def get_report_details(request, report_id):
             'error': str(e)
         })
 
+def remember_submitted_report(request, report):
+    """Let an anonymous uploader poll the status of their report from this session"""
+    if request.user.is_authenticated:
+        return
+    submitted = request.session.get(SUBMITTED_REPORTS_KEY, [])
+    request.session[SUBMITTED_REPORTS_KEY] = (submitted + [str(report.id)])[-SUBMITTED_REPORTS_KEPT:]
+
+def can_view_report_status(request, report):
+    """Staff, or whoever submitted the report: its citizen, or the session that uploaded it"""
+    if request.user.is_authenticated:
+        return request.user.is_staff or report.citizen_id == request.user.id
+    return str(report.id) in request.session.get(SUBMITTED_REPORTS_KEY, [])
+
+def get_report_status(request, report_id):
+    """Report the detection job state for a report, with results once it is done"""
+    try:
+        report = DetectionReport.objects.select_related('job').get(id=report_id)
+    except DetectionReport.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'error': 'Report not found'
+        })
+    if not can_view_report_status(request, report):
+        return JsonResponse({'success': False, 'error': 'Access denied'}, status=403)
+    
+    job = getattr(report, 'job', None)
+    if job is None:
+        # Reports processed inline have no job
+        status = DetectionJob.STATUS_DONE if report.is_processed else DetectionJob.STATUS_PENDING
+    else:
+        status = job.status
+    
+    response = {
+        'success': True,
+        'report_id': str(report.id),
+        'status': status,
+        'is_processed': report.is_processed,
+    }
+    if job is not None and status == DetectionJob.STATUS_DONE:
+        response.update(build_detection_response(report, json.loads(job.result or '[]')))
+    elif job is not None and status == DetectionJob.STATUS_FAILED:
+        # The cause was logged by the worker and stays on the job for staff
+        response['error'] = 'Detection failed'
+    return JsonResponse(response)
+
 def citizen_login(request):
     """Handle citizen login"""
     if request.method == 'POST':
@@ -685,7 +865,7 @@ def register_citizen(request):
     
     return render(request, 'detection/register.html')
 
-def calculate_detection_accuracy():
+def calculate_detection_accuracy(stats=None):
     """
     Calculate the accuracy rate of the detection system based on all detections.
     
@@ -693,65 +873,48 @@ def calculate_detection_accuracy():
     - True Positives: Detections that were later verified as correct
     - False Positives: Detections that were later verified as incorrect
     - Unverified Detections: Use confidence scores as probabilistic accuracy
+    
+    Works from the running totals in DetectionStats, so it costs at most one
+    primary key lookup whatever the number of detections.
     """
     try:
-        # Get all detections
-        all_detections = DetectionResult.objects.all()
-        total_detections = all_detections.count()
+        if stats is None:
+            stats = get_stats()
+        total_detections = stats.total_detections
         
         # If no detections, return 0% accuracy
-        if total_detections == 0:
+        if total_detections <= 0:
             return 0
         
-        # Get verified detections
-        verified_detections = all_detections.filter(is_verified=True)
-        total_verified = verified_detections.count()
+        correct_detections = stats.verified_correct
+        incorrect_detections = stats.verified_incorrect
+        total_verified = correct_detections + incorrect_detections
         
         # If no verified detections, calculate based on confidence distribution
-        if total_verified == 0:
-            # Calculate weighted accuracy based on confidence scores
-            if total_detections > 0:
-                total_weighted_confidence = 0
-                total_weight = 0
-                
-                for detection in all_detections:
-                    confidence = float(detection.confidence)
-                    # Use confidence as a weight for accuracy calculation
-                    # But normalize it to be more conservative
-                    normalized_confidence = confidence * 0.7  # Reduce confidence to be more realistic
-                    total_weighted_confidence += normalized_confidence
-                    total_weight += 1
-                
-                if total_weight > 0:
-                    avg_accuracy = total_weighted_confidence / total_weight
-                    # Ensure accuracy is reasonable (not too high for unverified detections)
-                    dynamic_accuracy = min(avg_accuracy, 85)  # Cap at 85% for unverified detections
-                    return round(dynamic_accuracy)
-            return 0
-        
-        # If we have verified detections, calculate based on verification results
-        correct_detections = verified_detections.filter(is_correct=True).count()
-        incorrect_detections = verified_detections.filter(is_correct=False).count()
+        if total_verified <= 0:
+            # Use the average confidence as accuracy, normalized to be more
+            # conservative (reduced to be more realistic)
+            avg_accuracy = stats.confidence_sum * 0.7 / total_detections
+            # Ensure accuracy is reasonable (not too high for unverified detections)
+            dynamic_accuracy = min(avg_accuracy, 85)  # Cap at 85% for unverified detections
+            return round(dynamic_accuracy)
         
         # Calculate accuracy as percentage
         # Accuracy = True Positives / (True Positives + False Positives)
-        if (correct_detections + incorrect_detections) > 0:
-            accuracy = (correct_detections / (correct_detections + incorrect_detections)) * 100
-            
-            # Apply dynamic adjustment based on verification volume
-            # More verifications = more trust in the accuracy
-            verification_ratio = total_verified / total_detections
-            if verification_ratio < 0.1:  # Less than 10% verified
-                # Reduce accuracy to reflect uncertainty
-                accuracy *= 0.8
-            elif verification_ratio < 0.3:  # 10-30% verified
-                # Moderate reduction
-                accuracy *= 0.9
-            
-            # Ensure accuracy is reasonable
-            dynamic_accuracy = min(accuracy, 95)  # Cap at 95%
-        else:
-            dynamic_accuracy = 0
+        accuracy = (correct_detections / total_verified) * 100
+        
+        # Apply dynamic adjustment based on verification volume
+        # More verifications = more trust in the accuracy
+        verification_ratio = total_verified / total_detections
+        if verification_ratio < 0.1:  # Less than 10% verified
+            # Reduce accuracy to reflect uncertainty
+            accuracy *= 0.8
+        elif verification_ratio < 0.3:  # 10-30% verified
+            # Moderate reduction
+            accuracy *= 0.9
+        
+        # Ensure accuracy is reasonable
+        dynamic_accuracy = min(accuracy, 95)  # Cap at 95%
         
         # Round to nearest integer
         return round(dynamic_accuracy)
@@ -761,6 +924,7 @@ def calculate_detection_accuracy():
         print(f"Error calculating accuracy: {e}")
         return 0
 
+@tracked_view('verify_detection')
 def verify_detection(request, detection_id):
     """Police can verify if a detection was correct or not"""
     if not request.user.is_authenticated or not request.user.is_staff:
@@ -768,21 +932,30 @@ def verify_detection(request, detection_id):
     
     if request.method == 'POST':
         try:
-            detection = DetectionResult.objects.get(id=detection_id)
             is_correct = request.POST.get('is_correct') == 'true'
             notes = request.POST.get('notes', '')
             
-            # Update verification fields
-            detection.is_verified = True
-            detection.is_correct = is_correct
-            detection.verified_by = request.user
-            detection.verification_notes = notes
-            detection.verified_at = timezone.now()  # Use timezone.now() instead of datetime.now()
-            detection.save()
-            
-            # Also update the associated report to mark it as processed
-            detection.report.is_processed = True
-            detection.report.save(update_fields=['is_processed'])
+            with transaction.atomic():
+                # Lock the detection so concurrent verifications are counted once
+                detection = DetectionResult.objects.select_for_update().select_related('report').get(id=detection_id)
+                # Alternative candidates can be ruled on but are not counted
+                changes = verification_changes(detection.is_verified, detection.is_correct, is_correct) if detection.rank == 1 else {}
+                
+                # Update verification fields
+                detection.is_verified = True
+                detection.is_correct = is_correct
+                detection.verified_by = request.user
+                detection.verification_notes = notes
+                detection.verified_at = timezone.now()  # Use timezone.now() instead of datetime.now()
+                detection.save()
+                
+                # Also update the associated report to mark it as processed
+                if not detection.report.is_processed:
+                    changes['pending_review'] = -1
+                detection.report.is_processed = True
+                detection.report.refresh_summary(save=False)
+                detection.report.save(update_fields=['is_processed'] + DetectionReport.SUMMARY_FIELDS)
+                record_report_change(detection.report, **changes)
             
             return JsonResponse({'success': True, 'message': 'Detection verified successfully'})
         except DetectionResult.DoesNotExist:
@@ -792,6 +965,7 @@ def verify_detection(request, detection_id):
     
     return JsonResponse({'success': False, 'error': 'Invalid request'})
 
+@tracked_view('confirm_criminal')
 def confirm_criminal_status(request, detection_id):
     """Police can confirm whether a detected person is actually a criminal or not"""
     if not request.user.is_authenticated or not request.user.is_staff:
@@ -799,21 +973,30 @@ def confirm_criminal_status(request, detection_id):
     
     if request.method == 'POST':
         try:
-            detection = DetectionResult.objects.get(id=detection_id)
             is_criminal = request.POST.get('is_criminal') == 'true'
             notes = request.POST.get('notes', '')
             
-            # Update criminal confirmation fields
-            detection.is_verified = True
-            detection.is_correct = is_criminal  # True if confirmed as criminal, False if not
-            detection.verified_by = request.user
-            detection.verification_notes = f"Criminal Status Confirmation: {notes}"
-            detection.verified_at = timezone.now()
-            detection.save()
-            
-            # Update the associated report
-            detection.report.is_processed = True
-            detection.report.save(update_fields=['is_processed'])
+            with transaction.atomic():
+                # Lock the detection so concurrent confirmations are counted once
+                detection = DetectionResult.objects.select_for_update().select_related('report').get(id=detection_id)
+                # Alternative candidates can be ruled on but are not counted
+                changes = verification_changes(detection.is_verified, detection.is_correct, is_criminal) if detection.rank == 1 else {}
+                
+                # Update criminal confirmation fields
+                detection.is_verified = True
+                detection.is_correct = is_criminal  # True if confirmed as criminal, False if not
+                detection.verified_by = request.user
+                detection.verification_notes = f"Criminal Status Confirmation: {notes}"
+                detection.verified_at = timezone.now()
+                detection.save()
+                
+                # Update the associated report
+                if not detection.report.is_processed:
+                    changes['pending_review'] = -1
+                detection.report.is_processed = True
+                detection.report.refresh_summary(save=False)
+                detection.report.save(update_fields=['is_processed'] + DetectionReport.SUMMARY_FIELDS)
+                record_report_change(detection.report, **changes)
             
             # Update the criminal record if needed
             if not is_criminal:
@@ -834,6 +1017,7 @@ def test_view(request):
     """Simple test view to check if basic functionality is working"""
     return JsonResponse({'status': 'ok', 'message': 'Test view is working'})
 
+@tracked_view('bulk_upload_criminals')
 def bulk_upload_criminals(request):
     """Handle bulk upload of criminals via CSV file"""
     if not request.user.is_authenticated:
@@ -881,6 +1065,9 @@ def bulk_upload_criminals(request):
                 except Exception as e:
                     errors.append(f"Row {row_num}: {str(e)}")
             
+            increment('detection_bulk_import_rows_total', created_count, result='created')
+            increment('detection_bulk_import_rows_total', len(errors), result='error')
+            
             if errors:
                 return JsonResponse({
                     'success': True, 
@@ -903,3 +1090,21 @@ def bulk_upload_criminals(request):
 
 
 # Add the necessary imports at the top of the file
+
+
+def metrics(request):
+    """Prometheus metrics aggregated across all worker processes (staff only)"""
+    token = getattr(settings, 'DETECTION_METRICS_TOKEN', '')
+    authorized = request.user.is_authenticated and request.user.is_staff
+    if token and hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+        # Lets a Prometheus scraper in without a staff session
+        authorized = True
+    if not authorized:
+        return HttpResponse('Access denied', status=403, content_type='text/plain')
+    
+    try:
+        body = render_prometheus(collect(), gauges())
+    except Exception as e:
+        print(f"Error collecting metrics: {e}")
+        return HttpResponse(f'Error collecting metrics: {e}', status=500, content_type='text/plain')
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
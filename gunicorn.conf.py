@@ -0,0 +1,12 @@
+# Gunicorn configuration for the Render deployment (see render.yaml)
+
+
+def post_worker_init(worker):
+    """Load and warm up the face detectors and gallery before the worker accepts requests"""
+    from detection.detectors import warm_up
+    from detection.gallery import warm_up_gallery
+    from detection.metrics import claim_process_file
+    # A dead worker's metrics file may still sit under this reused pid
+    claim_process_file()
+    warm_up()
+    warm_up_gallery()
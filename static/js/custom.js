@@ -2,6 +2,7 @@
 
 // Global variables
 let imageData = '';
+let imageFile = null; // A selected file is uploaded as is; imageData holds camera captures as data URLs
 let currentReportId = null;
 let cameraStream = null;
 let currentFacingMode = 'user'; // 'user' for front camera, 'environment' for back camera
@@ -138,6 +139,7 @@ function resetUploadArea() {
     }
     
     imageData = '';
+    imageFile = null;
 }
 
 // Add animation to cards
@@ -164,6 +166,7 @@ function checkForCapturedImage() {
         
         // Set the image data
         imageData = capturedImageData;
+        imageFile = null;
         
         // Show image preview
         showImagePreview(imageData);
@@ -364,21 +367,19 @@ function handleImageUpload(event) {
             return;
         }
         
-        const reader = new FileReader();
-        reader.onload = function(e) {
-            imageData = e.target.result;
-            // Don't show image preview to hide the person's image
-            hideImagePreview();
-            
-            // Enable submit button
-            if (submitBtn) {
-                submitBtn.disabled = false;
-            }
-            
-            // Show success message
-            showNotification('Photo uploaded successfully!', 'success');
-        };
-        reader.readAsDataURL(file);
+        // Keep the file itself; it is sent as raw bytes on submit
+        imageFile = file;
+        imageData = '';
+        // Don't show image preview to hide the person's image
+        hideImagePreview();
+        
+        // Enable submit button
+        if (submitBtn) {
+            submitBtn.disabled = false;
+        }
+        
+        // Show success message
+        showNotification('Photo uploaded successfully!', 'success');
     }
 }
 
@@ -441,7 +442,7 @@ function retakePhoto() {
 function submitDetection(event) {
     event.preventDefault();
     
-    if (!imageData) {
+    if (!imageData && !imageFile) {
         showNotification('Please select an image first', 'danger');
         return;
     }
@@ -461,25 +462,33 @@ function submitDetection(event) {
         submitBtn.disabled = true;
     }
     
-    // Create form data
-    const formData = new FormData();
-    formData.append('image_data', imageData);
+    // Send the image as raw bytes rather than a base64 form field, which is a third larger
+    const image = imageFile || dataUrlToBlob(imageData);
     
     // Add location if provided
+    const params = new URLSearchParams();
     const locationInput = document.getElementById('location');
     if (locationInput && locationInput.value.trim() !== '') {
-        formData.append('location', locationInput.value.trim());
+        params.append('location', locationInput.value.trim());
     }
     
     // Send request
-    fetch('/upload/', {
+    fetch(`/upload/?${params}`, {
         method: 'POST',
-        body: formData,
+        body: image,
         headers: {
+            'Content-Type': image.type || 'image/jpeg',
             'X-CSRFToken': getCookie('csrftoken')
         }
     })
     .then(response => response.json())
+    .then(data => {
+        // In async mode the server queues the detection; wait for it to finish
+        if (data.queued) {
+            return waitForDetection(data.status_url);
+        }
+        return data;
+    })
     .then(data => {
         // Hide processing indicator
         if (processingIndicator) {
@@ -492,8 +501,12 @@ function submitDetection(event) {
         // Reset upload area after successful submission
         resetUploadArea();
         
-        // Show success message
-        showNotification('Detection completed successfully!', 'success');
+        // Show success message, or ask for a better photo
+        if (data.rejected) {
+            showNotification(data.message, 'warning');
+        } else {
+            showNotification('Detection completed successfully!', 'success');
+        }
     })
     .catch(error => {
         console.error('Error:', error);
@@ -525,6 +538,39 @@ function submitDetection(event) {
     });
 }
 
+// Turn a data URL (camera capture) back into the image bytes it encodes
+function dataUrlToBlob(dataUrl) {
+    const [header, encoded] = dataUrl.split(',');
+    const mimeMatch = header.match(/data:([^;]+)/);
+    const binary = atob(encoded);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    return new Blob([bytes], { type: mimeMatch ? mimeMatch[1] : 'image/jpeg' });
+}
+
+// Poll a queued detection until the workers finish it
+function waitForDetection(statusUrl) {
+    return new Promise((resolve, reject) => {
+        const poll = () => {
+            fetch(statusUrl)
+                .then(response => response.json())
+                .then(data => {
+                    if (data.status === 'done') {
+                        resolve(data);
+                    } else if (data.status === 'failed' || !data.success) {
+                        reject(new Error(data.error || 'Detection failed'));
+                    } else {
+                        setTimeout(poll, 1500);
+                    }
+                })
+                .catch(reject);
+        };
+        poll();
+    });
+}
+
 // Get CSRF token
 function getCookie(name) {
     let cookieValue = null;
@@ -619,8 +665,22 @@ function displayResults(data) {
     
     if (!resultsContent) return;
     
-    // Only show detailed results if criminals are found
-    if (data.total_criminals_found > 0 && data.detections && data.detections.length > 0) {
+    // The photo was unusable (blurry, too dark, overexposed, face too small)
+    if (data.rejected) {
+        resultsContent.innerHTML = `
+            <div class="alert alert-warning" data-rejection-reason="${data.rejection_reason}">
+                <div class="d-flex">
+                    <div class="flex-shrink-0">
+                        <i class="fas fa-camera fa-2x"></i>
+                    </div>
+                    <div class="flex-grow-1 ms-3">
+                        <h5>Please Retake the Photo</h5>
+                        <p>${data.message}</p>
+                    </div>
+                </div>
+            </div>
+        `;
+    } else if (data.total_criminals_found > 0 && data.detections && data.detections.length > 0) {
         // Criminals detected
         let html = `
             <div class="alert alert-success alert-criminal">
@@ -853,6 +913,7 @@ function capturePhoto() {
         
         // Convert to data URL
         imageData = cameraCanvas.toDataURL('image/jpeg', 0.8);
+        imageFile = null;
         console.log('Image captured successfully, data length:', imageData.length);
         
         // Display in preview (only for camera capture)
@@ -1062,7 +1123,7 @@ function viewReportDetails(reportId) {
                         </div>
                         <div class="col-md-6">
                             <p class="mb-1"><strong>Report ID:</strong> ${data.report_id}</p>
-                            <p class="mb-1"><strong>Faces Detected:</strong> ${data.detections.length}</p>
+                            <p class="mb-1"><strong>Faces Detected:</strong> ${data.total_faces ?? data.detections.length}</p>
                         </div>
                     </div>
                     <div class="mt-3">